@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Contact, Conversation, Message
+from .models import BatchJob, BatchRow, Contact, Conversation, Message, SaleCampaign
 
 class MessageInline(admin.TabularInline):
     model = Message
@@ -10,6 +10,40 @@ class ConversationAdmin(admin.ModelAdmin):
         MessageInline,
     ]
 
+class BatchJobAdmin(admin.ModelAdmin):
+    list_display = ["batch_id", "action", "status", "total_rows", "succeeded", "unchanged", "failed", "rows_per_second", "created_at"]
+    list_filter = ["action", "status"]
+    actions = ["resume_batches", "retry_failed_rows"]
+
+    @admin.action(description="Resume selected batches from their last checkpoint")
+    def resume_batches(self, request, queryset):
+        from .tasks import resume_csv_batch
+        jobs = queryset.filter(action=BatchJob.APPLY, status__in=BatchJob.RESUMABLE)
+        for job in jobs:
+            resume_csv_batch.delay(job.batch_id)
+        self.message_user(request, f"Queued the unfinished rows of {len(jobs)} batches; running batches were skipped.")
+
+    @admin.action(description="Retry failed rows of selected batches")
+    def retry_failed_rows(self, request, queryset):
+        from .tasks import resume_csv_batch
+        jobs = queryset.filter(action=BatchJob.APPLY, status__in=BatchJob.RESUMABLE)
+        for job in jobs:
+            resume_csv_batch.delay(job.batch_id, retry_failed=True)
+        self.message_user(request, f"Queued the failed and unfinished rows of {len(jobs)} batches; running batches were skipped.")
+
+class BatchRowAdmin(admin.ModelAdmin):
+    list_display = ["job", "row", "sku", "state", "message"]
+    list_filter = ["state"]
+    search_fields = ["sku", "job__batch_id"]
+    raw_id_fields = ["job", "snapshot"]
+
+class SaleCampaignAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "vendor", "product_type", "tag", "percent_off", "discount_code", "variant_count", "failed", "starts_at", "ends_at"]
+    list_filter = ["status"]
+
 admin.site.register(Contact)
 admin.site.register(Conversation, ConversationAdmin)
 admin.site.register(Message)
+admin.site.register(BatchJob, BatchJobAdmin)
+admin.site.register(BatchRow, BatchRowAdmin)
+admin.site.register(SaleCampaign, SaleCampaignAdmin)
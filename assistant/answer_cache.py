@@ -0,0 +1,125 @@
+# assistant/answer_cache.py
+"""
+Cached answers to repeated questions ("store phone number", "cost of a $499
+item at code A").
+
+An answer is keyed on the normalized question, the model and a version
+hash of the system prompt and tool schemas, so changing either starts a
+fresh cache. Only answers whose turn called no tools, or only pure ones,
+are stored: anything that read or changed the store must go to Shopify
+again.
+
+Redis is also the Celery broker, so it can't evict keys on its own. Each
+answer expires after ANSWER_CACHE_TTL seconds, and a sorted set of keys by
+last use caps the cache at ANSWER_CACHE_MAX_ENTRIES, evicting the least
+recently used answers first.
+"""
+
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+import redis
+from django.conf import settings
+
+from . import rate_limit
+
+KEY_PREFIX = "answer-cache"
+LRU_KEY = f"{KEY_PREFIX}:lru"
+STATS_KEY = f"{KEY_PREFIX}:stats"
+
+# Punctuation that doesn't change what is being asked
+TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+WHITESPACE = re.compile(r"\s+")
+
+
+def enabled():
+    return settings.ANSWER_CACHE_TTL > 0 and settings.ANSWER_CACHE_MAX_ENTRIES > 0
+
+
+def normalize(question):
+    """Case, spacing and trailing punctuation folded away: "  What's code B?? " -> "what's code b"."""
+    question = unicodedata.normalize("NFKC", question).replace("’", "'").lower()
+    return TRAILING_PUNCTUATION.sub("", WHITESPACE.sub(" ", question).strip())
+
+
+def schema_version(*parts):
+    """Short hash of the prompt and tool schemas the answers were produced with."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def key(question, model, version):
+    digest = hashlib.sha256(normalize(question).encode()).hexdigest()
+    return f"{KEY_PREFIX}:{model}:{version}:{digest}"
+
+
+def record(outcome):
+    """Count 'hit', 'miss', 'stored', 'skipped' (not cacheable) or 'evicted'."""
+    try:
+        rate_limit.get_client().hincrby(STATS_KEY, outcome, 1)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def lookup(cache_key):
+    """The cached answer for `cache_key`, or None, marking it as just used."""
+    client = rate_limit.get_client()
+    try:
+        answer = client.get(cache_key)
+        if answer is None:
+            client.zrem(LRU_KEY, cache_key)
+            record("miss")
+            return None
+        client.zadd(LRU_KEY, {cache_key: time.time()})
+    except redis.exceptions.RedisError as e:
+        print(f"[AnswerCache] Redis unavailable, not caching: {e}")
+        return None
+    record("hit")
+    return answer.decode()
+
+
+def store(cache_key, answer):
+    """Store `answer`, evicting the least recently used answers beyond the cap."""
+    client = rate_limit.get_client()
+    try:
+        pipe = client.pipeline()
+        pipe.set(cache_key, answer, ex=settings.ANSWER_CACHE_TTL)
+        pipe.zadd(LRU_KEY, {cache_key: time.time()})
+        pipe.execute()
+        overflow = client.zcard(LRU_KEY) - settings.ANSWER_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            oldest = client.zrange(LRU_KEY, 0, overflow - 1)
+            pipe = client.pipeline()
+            pipe.delete(*oldest)
+            pipe.zrem(LRU_KEY, *oldest)
+            pipe.hincrby(STATS_KEY, "evicted", len(oldest))
+            pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"[AnswerCache] Could not store answer: {e}")
+        return
+    record("stored")
+
+
+def clear():
+    client = rate_limit.get_client()
+    try:
+        keys = client.zrange(LRU_KEY, 0, -1)
+        client.delete(LRU_KEY, *keys)
+    except redis.exceptions.RedisError as e:
+        print(f"[AnswerCache] Could not clear: {e}")
+
+
+def stats():
+    try:
+        client = rate_limit.get_client()
+        raw = client.hgetall(STATS_KEY)
+        entries = client.zcard(LRU_KEY)
+    except redis.exceptions.RedisError as e:
+        return {"error": str(e)}
+    counts = {outcome: int(raw.get(outcome.encode(), 0)) for outcome in ("hit", "miss", "stored", "skipped", "evicted")}
+    lookups = counts["hit"] + counts["miss"]
+    counts["hit_rate"] = round(counts["hit"] / lookups, 3) if lookups else None
+    counts["entries"] = entries
+    return counts
@@ -1,11 +1,20 @@
 # answer-question.py
+#
+# Ask the store handbook questions from the command line:
+#
+#     python -m assistant.answer_question
 
+import os
+
+import django
+from environs import Env
 from openai import OpenAI
+
+from . import handbook
+
 env = Env()
 env.read_env()
 
-expert = "aynmhandbookchat"
-
 OPENAI_API_KEY = env("OPENAI_API_KEY")
 client = OpenAI(api_key=OPENAI_API_KEY)
 
@@ -21,15 +30,15 @@ def answer_question(
     model=MODEL,
     question="What is your store phone number?",
     max_len=MAX_LEN,
-    size="ada",
     debug=False,
     max_tokens=MAX_TOKENS,
     stop_sequence=None,
 ):
     """
-    Answer a question based on the most similar context from the dataframe texts
+    Answer a question based on the most similar handbook passages, retrieved
+    from the index built by `manage.py ingest_handbook`
     """
-    context = ""
+    context = handbook.context_for(question, max_len)
     # If debug, print the raw model response
     if debug:
         print("Context:\n" + context)
@@ -42,7 +51,7 @@ def answer_question(
         if debug:
             print(f"\n***\n{prompt}\n***\n")
 
-        response = client.ChatCompletion.create(
+        response = client.chat.completions.create(
             messages=[
                 {
                     "role": "system",
@@ -50,11 +59,13 @@ def answer_question(
                 },
                 {"role": "user", "content": prompt},
             ],
-            model=MODEL,
+            model=model,
             temperature=0,
+            max_tokens=max_tokens,
+            stop=stop_sequence,
         )
 
-        answer = response["choices"][0]["message"]["content"].strip()
+        answer = response.choices[0].message.content.strip()
         return answer
     except Exception as e:
         print(e)
@@ -71,4 +82,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # The handbook index location and embedding backend come from the Django settings
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    django.setup()
     main()
@@ -0,0 +1,286 @@
+# assistant/async_shopify.py
+"""
+Asyncio Shopify client for bulk product operations.
+
+The `shopify` library sends one blocking request at a time, so a CSV of
+N products costs N times the sum of each product's round trips. This client
+talks to the same REST endpoints over httpx and runs many SKU operations at
+once, with a semaphore bounding the number in flight. Inside one operation,
+requests that don't depend on each other (product, variant and inventory
+item updates) are sent together.
+
+Requests go through the shared rate limiter and retry layer, so concurrency
+only helps until the API budget is spent, never past it.
+"""
+
+import asyncio
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import product_cache, rate_limit
+from .models import SkuIndex
+from .retry import async_retry_call
+from .shopify_chat_cli import ACCESS_TOKEN, STORE_NAME, VERSION, find_product_by_sku, write_sku_index
+
+PRODUCT_FIELDS = ("title", "product_type", "vendor", "tags", "body_html")
+VARIANT_FIELDS = ("price", "compare_at_price")
+
+
+def store_base_url():
+    host = STORE_NAME.split("://", 1)[-1].rstrip("/")
+    return f"https://{host}/admin/api/{VERSION}"
+
+
+@sync_to_async
+def index_lookup(sku):
+    """Resolve SKU to (product_id, variant_id, inventory_item_id) through the SKU index."""
+    entry = SkuIndex.objects.filter(sku=sku).first()
+    if not entry:
+        return None
+    return entry.product_id, entry.variant_id, entry.inventory_item_id
+
+
+@sync_to_async
+def repair_lookup(sku):
+    """
+    Resolve SKU the slow way, through `find_product_by_sku`, which drops a
+    stale index entry, scans the catalog and re-indexes what it finds.
+    """
+    product, variant = find_product_by_sku(sku)
+    if not product or not variant:
+        return None
+    return product.id, variant.id, variant.inventory_item_id
+
+
+@sync_to_async
+def index_created(product):
+    write_sku_index({
+        v["sku"]: SkuIndex(
+            sku=v["sku"],
+            product_id=product["id"],
+            variant_id=v["id"],
+            inventory_item_id=v.get("inventory_item_id"),
+        )
+        for v in product.get("variants", []) if v.get("sku")
+    })
+
+
+def product_info_from_json(product, variant, cost=None, available=None):
+    """Build a product info dict from REST response bodies."""
+    return {
+        "title": product.get("title"),
+        "product_type": product.get("product_type"),
+        "vendor": product.get("vendor"),
+        "tags": product.get("tags"),
+        "sku": variant.get("sku"),
+        "price": variant.get("price"),
+        "compare_at_price": variant.get("compare_at_price"),
+        "cost": cost,
+        "available": available,
+        "body_html": product.get("body_html"),
+    }
+
+
+class AsyncShopifyClient:
+    """
+    Use as an async context manager:
+
+        async with AsyncShopifyClient(concurrency=8) as client:
+            results = await client.map(client.update_product_by_sku, items)
+
+    `base_url`, `sku_lookup`, `sku_repair` and `rate_limited` can be
+    overridden to point the client at the fake server in `assistant.fake_shopify`.
+    `sku_repair` resolves SKUs the index misses or has stale ids for.
+    """
+
+    def __init__(self, concurrency=None, base_url=None, access_token=None,
+                 sku_lookup=None, sku_repair=None, rate_limited=True, update_cache=True):
+        self.concurrency = concurrency or settings.SHOPIFY_ASYNC_CONCURRENCY
+        self.base_url = base_url or store_base_url()
+        self.access_token = access_token or ACCESS_TOKEN
+        self.sku_lookup = sku_lookup or index_lookup
+        self.sku_repair = sku_repair or repair_lookup
+        self.rate_limited = rate_limited
+        self.update_cache = update_cache
+        self.http = None
+
+    async def __aenter__(self):
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"X-Shopify-Access-Token": self.access_token},
+            timeout=30,
+            limits=httpx.Limits(max_connections=self.concurrency * 2),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.http.aclose()
+
+    async def request(self, method, path, **kwargs):
+        """Send one REST request and return the decoded JSON body."""
+        async def attempt():
+            if self.rate_limited:
+                await asyncio.to_thread(rate_limit.acquire, "rest")
+            response = await self.http.request(method, path, **kwargs)
+            if self.rate_limited:
+                await asyncio.to_thread(rate_limit.observe_rest_headers, response.headers)
+            response.raise_for_status()
+            return response.json() if response.content else {}
+
+        return await async_retry_call(attempt, idempotent=method.upper() != "POST")
+
+    async def map(self, operation, items):
+        """
+        Run `operation(sku, fields)` for every (sku, fields) item with at most
+        `concurrency` in flight. Results come back in input order; an exception
+        becomes an error response for its item instead of cancelling the rest.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(item):
+            async with semaphore:
+                try:
+                    return await operation(*item)
+                except Exception as e:
+                    return {"status": "error", "message": str(e)}
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    async def set_available(self, inventory_item_id, available):
+        levels = await self.request("GET", "/inventory_levels.json", params={"inventory_item_ids": inventory_item_id})
+        levels = levels.get("inventory_levels", [])
+        if not levels:
+            return None
+        await self.request("POST", "/inventory_levels/set.json", json={
+            "inventory_item_id": inventory_item_id,
+            "location_id": levels[0]["location_id"],
+            "available": int(available),
+        })
+        return int(available)
+
+    async def get_available(self, inventory_item_id):
+        levels = await self.request("GET", "/inventory_levels.json", params={"inventory_item_ids": inventory_item_id})
+        levels = levels.get("inventory_levels", [])
+        return levels[0].get("available") if levels else None
+
+    async def update_product_by_sku(self, sku, update_fields):
+        ids = await self.sku_lookup(sku) or await self.sku_repair(sku)
+        if not ids:
+            return {"status": "error", "message": f"Could not find product with SKU '{sku}'"}
+        try:
+            return await self.update_ids(sku, ids, update_fields)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+        # The index pointed at a deleted product or variant; repair it and try once more
+        ids = await self.sku_repair(sku)
+        if not ids:
+            return {"status": "error", "message": f"Could not find product with SKU '{sku}'"}
+        return await self.update_ids(sku, ids, update_fields)
+
+    async def update_ids(self, sku, ids, update_fields):
+        product_id, variant_id, inventory_item_id = ids
+
+        product_fields = {k: update_fields[k] for k in PRODUCT_FIELDS if k in update_fields}
+        variant_fields = {k: str(update_fields[k]) for k in VARIANT_FIELDS if k in update_fields}
+        item_fields = {}
+        if "cost" in update_fields:
+            item_fields["cost"] = str(update_fields["cost"])
+        if "available" in update_fields:
+            # Quantities can only be set on managed, tracked inventory
+            variant_fields["inventory_management"] = "shopify"
+            item_fields["tracked"] = True
+
+        # Product, variant and inventory item are separate resources; update them together
+        async def put_product():
+            if product_fields:
+                body = await self.request("PUT", f"/products/{product_id}.json", json={"product": {"id": product_id, **product_fields}})
+            else:
+                body = await self.request("GET", f"/products/{product_id}.json")
+            return body["product"]
+
+        async def put_variant():
+            if variant_fields:
+                body = await self.request("PUT", f"/variants/{variant_id}.json", json={"variant": {"id": variant_id, **variant_fields}})
+                return body["variant"]
+            return None
+
+        async def put_item():
+            if item_fields:
+                body = await self.request("PUT", f"/inventory_items/{inventory_item_id}.json", json={"inventory_item": {"id": inventory_item_id, **item_fields}})
+            else:
+                body = await self.request("GET", f"/inventory_items/{inventory_item_id}.json")
+            return body["inventory_item"]
+
+        product, variant, item = await asyncio.gather(put_product(), put_variant(), put_item())
+        if variant is None:
+            variant = next((v for v in product.get("variants", []) if v["id"] == variant_id), {})
+
+        if "available" in update_fields:
+            available = await self.set_available(inventory_item_id, update_fields["available"])
+        else:
+            available = await self.get_available(inventory_item_id)
+
+        info = product_info_from_json(product, variant, cost=item.get("cost"), available=available)
+        if self.update_cache:
+            await asyncio.to_thread(product_cache.store, sku, info)
+        return {
+            "status": "success",
+            "message": "The product was successfully updated.",
+            "updated_fields": info,
+        }
+
+    async def create_product_with_sku(self, sku, fields):
+        if not sku:
+            return {"status": "error", "message": "SKU is required"}
+
+        product = {"title": fields.get("title") or "New Product"}
+        for field in ("product_type", "vendor", "tags", "body_html"):
+            if fields.get(field):
+                product[field] = fields[field]
+        variant = {"sku": sku, "price": str(fields.get("price") or "0.00"), "inventory_management": "shopify"}
+        if fields.get("compare_at_price"):
+            variant["compare_at_price"] = str(fields["compare_at_price"])
+        product["variants"] = [variant]
+
+        # Creating a product is not idempotent, so a failure here is not retried
+        created = (await self.request("POST", "/products.json", json={"product": product}))["product"]
+        created_variant = created["variants"][0]
+        inventory_item_id = created_variant["inventory_item_id"]
+        await index_created(created)
+
+        item_fields = {"tracked": True}
+        if fields.get("cost") is not None:
+            item_fields["cost"] = str(fields["cost"])
+        item_body = await self.request(
+            "PUT", f"/inventory_items/{inventory_item_id}.json",
+            json={"inventory_item": {"id": inventory_item_id, **item_fields}},
+        )
+
+        available = None
+        if fields.get("available") is not None:
+            available = await self.set_available(inventory_item_id, fields["available"])
+
+        info = product_info_from_json(created, created_variant, cost=item_body["inventory_item"].get("cost"), available=available)
+        if self.update_cache:
+            await asyncio.to_thread(product_cache.store, sku, info)
+        return {
+            "status": "success",
+            "message": "The product was successfully created.",
+            "product_info": info,
+        }
+
+
+def run_concurrently(operation_name, items, **client_kwargs):
+    """
+    Run an AsyncShopifyClient operation ("update_product_by_sku" or
+    "create_product_with_sku") over (sku, fields) items from synchronous
+    code. Returns the responses in input order.
+    """
+    async def main():
+        async with AsyncShopifyClient(**client_kwargs) as client:
+            return await client.map(getattr(client, operation_name), items)
+
+    return asyncio.run(main())
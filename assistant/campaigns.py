@@ -0,0 +1,271 @@
+# assistant/campaigns.py
+"""
+Bulk sale campaigns, e.g. "20% off all Yamaha keyboards".
+
+A campaign selects variants with a Shopify search (vendor, product type, tag
+and/or a SKU list), prices them server-side with a percentage or a discount
+code from `discounts`, and writes the changes with aliased
+`productVariantsBulkUpdate` and `tagsAdd` mutations, several products per
+request. The pre-sale price, compare-at price and tags of every variant are
+stored as ProductSnapshot rows under the campaign's batch id, and the revert
+puts those values back the same way.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import product_cache
+from .discounts import apply_discount, discount_codes
+from .models import ProductSnapshot, SaleCampaign, SkuIndex
+from .shopify_chat_cli import (
+    SKU_BATCH_SIZE,
+    chunked,
+    gid_to_id,
+    run_graphql,
+    sku_index_entry,
+    sku_search_term,
+    write_sku_index,
+)
+
+CAMPAIGN_VARIANTS_QUERY = '''
+query campaignVariants($query: String!, $cursor: String) {
+  productVariants(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        sku
+        price
+        compareAtPrice
+        product { id vendor productType tags }
+        inventoryItem { id }
+      }
+    }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+'''
+
+SELECTION_GRAPHQL_COST = 300
+# Budget per aliased mutation in a batch request
+MUTATION_GRAPHQL_COST = 10
+
+
+def search_value(value):
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def selection_queries(campaign):
+    """Yield the Shopify search query strings that together select the campaign's variants."""
+    filters = []
+    if campaign.vendor:
+        filters.append(f"vendor:{search_value(campaign.vendor)}")
+    if campaign.product_type:
+        filters.append(f"product_type:{search_value(campaign.product_type)}")
+    if campaign.tag:
+        filters.append(f"tag:{search_value(campaign.tag)}")
+    if not campaign.skus:
+        yield " AND ".join(filters)
+        return
+    for batch in chunked(campaign.skus, SKU_BATCH_SIZE):
+        skus = "(" + " OR ".join(sku_search_term(sku) for sku in batch) + ")"
+        yield " AND ".join(filters + [skus])
+
+
+def matches(campaign, node):
+    """Shopify search matches loosely; keep only exact (case-insensitive) matches."""
+    product = node["product"]
+    if campaign.vendor and (product["vendor"] or "").lower() != campaign.vendor.lower():
+        return False
+    if campaign.product_type and (product["productType"] or "").lower() != campaign.product_type.lower():
+        return False
+    if campaign.tag and campaign.tag.lower() not in [t.lower() for t in product["tags"]]:
+        return False
+    if campaign.skus and node["sku"] not in campaign.skus:
+        return False
+    return bool(node["sku"])
+
+
+def select_variants(campaign):
+    """Return the variant nodes selected by the campaign, deduplicated by SKU."""
+    if not (campaign.vendor or campaign.product_type or campaign.tag or campaign.skus):
+        raise ValueError("A campaign needs at least one of vendor, product type, tag or SKUs.")
+    selected = {}
+    for query in selection_queries(campaign):
+        cursor = None
+        while True:
+            data = run_graphql(
+                CAMPAIGN_VARIANTS_QUERY, {"query": query, "cursor": cursor}, cost=SELECTION_GRAPHQL_COST
+            )["productVariants"]
+            for edge in data["edges"]:
+                if matches(campaign, edge["node"]):
+                    selected[edge["node"]["sku"]] = edge["node"]
+            if not data["pageInfo"]["hasNextPage"]:
+                break
+            cursor = data["pageInfo"]["endCursor"]
+    write_sku_index({sku: sku_index_entry(node) for sku, node in selected.items()})
+    return list(selected.values())
+
+
+def sale_price(campaign, regular_price):
+    """Price a variant whose regular price is `regular_price` under the campaign's rule."""
+    if campaign.discount_code:
+        if campaign.discount_code not in discount_codes:
+            raise ValueError(f"Discount code {campaign.discount_code} not found.")
+        price = Decimal(str(apply_discount(float(regular_price), discount_codes[campaign.discount_code])))
+    elif campaign.percent_off is not None:
+        price = regular_price * (1 - Decimal(campaign.percent_off) / 100)
+    else:
+        raise ValueError("A campaign needs a percent off or a discount code.")
+    return price.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def regular_price_of(node):
+    """The variant's undiscounted price; a variant already on sale keeps its compare-at price."""
+    price = Decimal(node["price"])
+    compare_at_price = Decimal(node["compareAtPrice"]) if node["compareAtPrice"] else None
+    if compare_at_price and compare_at_price > price:
+        return compare_at_price
+    return price
+
+
+def run_product_mutations(products):
+    """
+    Send price and tag changes for many products, CAMPAIGN_PRODUCTS_PER_REQUEST
+    at a time as aliased mutations in one document. `products` maps a product
+    gid to (variant inputs, tags to add, tags to remove). Returns a list of
+    (product gid, error message) for products whose mutations failed.
+    """
+    failures = {}
+    for batch in chunked(products.items(), settings.CAMPAIGN_PRODUCTS_PER_REQUEST):
+        declarations, mutations, variables, owners = [], [], {}, {}
+        for i, (product_gid, (variants, tags_add, tags_remove)) in enumerate(batch):
+            declarations.append(f"$p{i}: ID!")
+            variables[f"p{i}"] = product_gid
+            if variants:
+                declarations.append(f"$v{i}: [ProductVariantsBulkInput!]!")
+                variables[f"v{i}"] = variants
+                mutations.append(f"v{i}: productVariantsBulkUpdate(productId: $p{i}, variants: $v{i}) {{ userErrors {{ field message }} }}")
+                owners[f"v{i}"] = product_gid
+            if tags_add:
+                declarations.append(f"$ta{i}: [String!]!")
+                variables[f"ta{i}"] = tags_add
+                mutations.append(f"ta{i}: tagsAdd(id: $p{i}, tags: $ta{i}) {{ userErrors {{ field message }} }}")
+                owners[f"ta{i}"] = product_gid
+            if tags_remove:
+                declarations.append(f"$tr{i}: [String!]!")
+                variables[f"tr{i}"] = tags_remove
+                mutations.append(f"tr{i}: tagsRemove(id: $p{i}, tags: $tr{i}) {{ userErrors {{ field message }} }}")
+                owners[f"tr{i}"] = product_gid
+        if not mutations:
+            continue
+
+        query = "mutation campaignBatch(%s) {\n%s\n}" % (", ".join(declarations), "\n".join(mutations))
+        try:
+            data = run_graphql(query, variables, cost=MUTATION_GRAPHQL_COST * len(mutations))
+        except Exception as e:
+            failures.update((product_gid, str(e)) for product_gid, _ in batch)
+            continue
+        for alias, payload in data.items():
+            errors = (payload or {}).get("userErrors") or []
+            if errors:
+                failures[owners[alias]] = "; ".join(e["message"] for e in errors)
+    return list(failures.items())
+
+
+def invalidate_products(skus, product_ids):
+    """Drop cached pricing for changed SKUs, and details (tags) for every SKU of the changed products."""
+    product_cache.invalidate(*skus, groups=["pricing"])
+    siblings = SkuIndex.objects.filter(product_id__in=product_ids).values_list("sku", flat=True)
+    product_cache.invalidate(*siblings, groups=["details"])
+
+
+def apply_campaign(campaign):
+    """Select, snapshot and discount the campaign's variants. Returns a summary dict."""
+    nodes = select_variants(campaign)
+
+    snapshots, products = [], {}
+    for node in nodes:
+        regular = regular_price_of(node)
+        price = sale_price(campaign, regular)
+        if price >= regular:
+            continue
+        product_gid = node["product"]["id"]
+        snapshots.append(ProductSnapshot(
+            batch_id=campaign.batch_id,
+            sku=node["sku"],
+            tags=", ".join(node["product"]["tags"]),
+            price=node["price"],
+            compare_at_price=node["compareAtPrice"],
+        ))
+        variants, tags_add, _ = products.setdefault(product_gid, ([], [], []))
+        variants.append({"id": node["id"], "price": str(price), "compareAtPrice": str(regular)})
+        if campaign.sale_tag and campaign.sale_tag not in node["product"]["tags"] and not tags_add:
+            tags_add.append(campaign.sale_tag)
+
+    # Snapshot before writing anything, so a partly applied campaign can still be reverted
+    ProductSnapshot.objects.bulk_create(snapshots, batch_size=settings.SNAPSHOT_BULK_SIZE)
+    failures = run_product_mutations(products)
+    invalidate_products([s.sku for s in snapshots], [gid_to_id(gid) for gid in products])
+
+    campaign.status = SaleCampaign.ACTIVE
+    campaign.variant_count = len(snapshots)
+    campaign.failed = len(failures)
+    campaign.errors = [f"Product {gid_to_id(gid)}: {message}" for gid, message in failures]
+    campaign.applied_at = timezone.now()
+    campaign.save()
+    return {
+        "status": "success" if not failures else "error",
+        "message": f"Put {len(snapshots)} variants across {len(products)} products on sale.",
+        "variants": len(snapshots),
+        "products": len(products),
+        "errors": campaign.errors,
+    }
+
+
+def revert_campaign(campaign):
+    """Restore the pre-sale prices and remove the sale tag where the campaign added it."""
+    snapshots = ProductSnapshot.objects.filter(batch_id=campaign.batch_id, reverted=False).order_by("id")
+    index = {}
+    products, snapshot_ids = {}, {}
+    for batch in chunked(snapshots.iterator(chunk_size=settings.SNAPSHOT_BULK_SIZE), settings.SNAPSHOT_BULK_SIZE):
+        index.update(
+            (entry.sku, entry) for entry in SkuIndex.objects.filter(sku__in=[snap.sku for snap in batch])
+        )
+        for snap in batch:
+            entry = index.get(snap.sku)
+            if not entry:
+                print(f"Cannot revert {snap.sku}: not in the SKU index")
+                continue
+            product_gid = f"gid://shopify/Product/{entry.product_id}"
+            variants, _, tags_remove = products.setdefault(product_gid, ([], [], []))
+            variants.append({
+                "id": f"gid://shopify/ProductVariant/{entry.variant_id}",
+                "price": snap.price,
+                "compareAtPrice": snap.compare_at_price or None,
+            })
+            original_tags = [t.strip() for t in (snap.tags or "").split(",")]
+            if campaign.sale_tag and campaign.sale_tag not in original_tags and not tags_remove:
+                tags_remove.append(campaign.sale_tag)
+            snapshot_ids.setdefault(product_gid, []).append(snap.id)
+
+    failures = run_product_mutations(products)
+    failed_products = {gid for gid, _ in failures}
+    # Failed products keep their snapshots unreverted so the revert can be run again
+    reverted_ids = [i for gid, ids in snapshot_ids.items() if gid not in failed_products for i in ids]
+    for batch in chunked(reverted_ids, settings.SNAPSHOT_BULK_SIZE):
+        ProductSnapshot.objects.filter(id__in=batch).update(reverted=True)
+    invalidate_products(list(index), [gid_to_id(gid) for gid in products])
+
+    campaign.status = SaleCampaign.REVERTED if not failures else SaleCampaign.ACTIVE
+    campaign.failed = len(failures)
+    campaign.errors = [f"Product {gid_to_id(gid)}: {message}" for gid, message in failures]
+    campaign.reverted_at = timezone.now()
+    campaign.save()
+    return {
+        "status": "success" if not failures else "error",
+        "message": f"Reverted {len(reverted_ids)} variants across {len(products) - len(failed_products)} products.",
+        "errors": campaign.errors,
+    }
@@ -0,0 +1,417 @@
+# assistant/catalog_mirror.py
+"""
+Local mirror of the Shopify catalog, loaded from a GraphQL bulk operation export.
+
+The bulk operation result is a JSONL file with one object per line. Nested
+connections are flattened, so products, variants and inventory levels arrive as
+separate lines in parent-before-child order. The file is streamed line by line
+and written in fixed-size chunks, so memory use does not grow with the catalog.
+
+Webhooks keep the mirror current between syncs. Shopify may deliver them more
+than once and out of order, so a delivery whose webhook id was already seen is
+dropped, and a payload older than the mirrored row's `updated_at` is skipped.
+"""
+
+import json
+import time
+
+import requests
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import product_cache
+from .retry import retry_call
+from .models import CatalogProduct, CatalogVariant, CatalogInventoryLevel, SkuIndex
+from .shopify_chat_cli import run_graphql, gid_to_id, write_sku_index
+
+CHUNK_SIZE = 1000
+POLL_INTERVAL = 5
+# Shopify retries a failed delivery for up to 48 hours
+WEBHOOK_ID_TTL = 48 * 60 * 60
+
+BULK_PRODUCTS_QUERY = '''
+{
+  products {
+    edges {
+      node {
+        id
+        title
+        productType
+        vendor
+        tags
+        descriptionHtml
+        updatedAt
+        variants {
+          edges {
+            node {
+              id
+              sku
+              price
+              compareAtPrice
+              inventoryItem {
+                id
+                tracked
+                unitCost { amount }
+                inventoryLevels {
+                  edges {
+                    node {
+                      id
+                      item { id }
+                      location { id }
+                      updatedAt
+                      quantities(names: ["available"]) { name quantity }
+                    }
+                  }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+'''
+
+RUN_BULK_QUERY_MUTATION = '''
+mutation runBulkQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+'''
+
+CURRENT_BULK_OPERATION_QUERY = '''
+{
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    objectCount
+    url
+  }
+}
+'''
+
+
+def start_bulk_export():
+    """Start the catalog bulk operation and return its id."""
+    data = run_graphql(RUN_BULK_QUERY_MUTATION, {"query": BULK_PRODUCTS_QUERY})
+    result = data["bulkOperationRunQuery"]
+    if result["userErrors"]:
+        raise Exception(f"Failed to start bulk operation. Errors: {result['userErrors']}")
+    return result["bulkOperation"]["id"]
+
+
+def wait_for_bulk_export(operation_id, poll_interval=POLL_INTERVAL, timeout=3600):
+    """Poll the running bulk operation until it finishes and return its result URL."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        operation = run_graphql(CURRENT_BULK_OPERATION_QUERY)["currentBulkOperation"]
+        if not operation or operation["id"] != operation_id:
+            raise Exception(f"Bulk operation {operation_id} is no longer the current operation.")
+        if operation["status"] == "COMPLETED":
+            # An empty catalog completes without a result file
+            return operation["url"]
+        if operation["status"] in ("FAILED", "CANCELED", "EXPIRED"):
+            raise Exception(f"Bulk operation {operation_id} {operation['status'].lower()}: {operation['errorCode']}")
+        time.sleep(poll_interval)
+    raise Exception(f"Timed out waiting for bulk operation {operation_id}.")
+
+
+def open_bulk_result(url):
+    response = requests.get(url, stream=True, timeout=60)
+    response.raise_for_status()
+    return response
+
+
+def iter_bulk_lines(url):
+    """Yield each JSON object from the bulk operation result without loading the whole file."""
+    with retry_call(open_bulk_result, (url,)) as response:
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def product_from_node(node, synced_at):
+    return CatalogProduct(
+        product_id=gid_to_id(node["id"]),
+        title=node.get("title"),
+        product_type=node.get("productType"),
+        vendor=node.get("vendor"),
+        tags=", ".join(node.get("tags") or []),
+        body_html=node.get("descriptionHtml"),
+        synced_at=synced_at,
+        updated_at=parse_datetime(node.get("updatedAt") or ""),
+    )
+
+
+def variant_from_node(node, synced_at):
+    inventory_item = node.get("inventoryItem") or {}
+    unit_cost = inventory_item.get("unitCost") or {}
+    return CatalogVariant(
+        variant_id=gid_to_id(node["id"]),
+        product_id=gid_to_id(node["__parentId"]),
+        sku=node.get("sku") or None,
+        price=node.get("price"),
+        compare_at_price=node.get("compareAtPrice"),
+        inventory_item_id=gid_to_id(inventory_item.get("id")),
+        cost=unit_cost.get("amount"),
+        tracked=bool(inventory_item.get("tracked")),
+        synced_at=synced_at,
+    )
+
+
+def inventory_level_from_node(node, synced_at):
+    available = None
+    for quantity in node.get("quantities") or []:
+        if quantity["name"] == "available":
+            available = quantity["quantity"]
+    return CatalogInventoryLevel(
+        inventory_item_id=gid_to_id(node["item"]["id"]),
+        location_id=gid_to_id(node["location"]["id"]),
+        available=available,
+        synced_at=synced_at,
+        updated_at=parse_datetime(node.get("updatedAt") or ""),
+    )
+
+
+def flush(model, rows, unique_fields):
+    """Upsert a chunk of mirror rows."""
+    if not rows:
+        return
+    update_fields = [
+        f.name for f in model._meta.concrete_fields
+        if not f.primary_key and f.name not in unique_fields
+    ]
+    model.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields,
+    )
+
+
+def flush_sku_index(variants):
+    write_sku_index({
+        v.sku: SkuIndex(
+            sku=v.sku,
+            product_id=v.product_id,
+            variant_id=v.variant_id,
+            inventory_item_id=v.inventory_item_id,
+        )
+        for v in variants if v.sku
+    })
+
+
+def load_bulk_lines(lines, synced_at, chunk_size=CHUNK_SIZE):
+    """
+    Write bulk operation lines into the mirror tables in chunks.
+    Returns per-table row counts.
+    """
+    counts = {"products": 0, "variants": 0, "inventory_levels": 0}
+    products, variants, levels = [], [], []
+
+    for node in lines:
+        gid = node.get("id", "")
+        if gid.startswith("gid://shopify/ProductVariant/"):
+            variants.append(variant_from_node(node, synced_at))
+        elif gid.startswith("gid://shopify/Product/"):
+            products.append(product_from_node(node, synced_at))
+        elif gid.startswith("gid://shopify/InventoryLevel/"):
+            levels.append(inventory_level_from_node(node, synced_at))
+        else:
+            continue
+
+        if len(products) >= chunk_size:
+            flush(CatalogProduct, products, ["product_id"])
+            counts["products"] += len(products)
+            products = []
+        if len(variants) >= chunk_size:
+            flush(CatalogVariant, variants, ["variant_id"])
+            flush_sku_index(variants)
+            counts["variants"] += len(variants)
+            variants = []
+        if len(levels) >= chunk_size:
+            flush(CatalogInventoryLevel, levels, ["inventory_item_id", "location_id"])
+            counts["inventory_levels"] += len(levels)
+            levels = []
+
+    flush(CatalogProduct, products, ["product_id"])
+    flush(CatalogVariant, variants, ["variant_id"])
+    flush_sku_index(variants)
+    flush(CatalogInventoryLevel, levels, ["inventory_item_id", "location_id"])
+    counts["products"] += len(products)
+    counts["variants"] += len(variants)
+    counts["inventory_levels"] += len(levels)
+    return counts
+
+
+def sync_catalog_mirror(poll_interval=POLL_INTERVAL):
+    """
+    Run a bulk export of the catalog and mirror it locally.
+    Rows not present in the export are removed once the load finishes.
+    """
+    synced_at = timezone.now()
+    operation_id = start_bulk_export()
+    url = wait_for_bulk_export(operation_id, poll_interval=poll_interval)
+
+    started = time.monotonic()
+    if url:
+        counts = load_bulk_lines(iter_bulk_lines(url), synced_at)
+    else:
+        counts = {"products": 0, "variants": 0, "inventory_levels": 0}
+
+    CatalogProduct.objects.filter(synced_at__lt=synced_at).delete()
+    CatalogVariant.objects.filter(synced_at__lt=synced_at).delete()
+    CatalogInventoryLevel.objects.filter(synced_at__lt=synced_at).delete()
+
+    elapsed = time.monotonic() - started
+    rows = sum(counts.values())
+    return {
+        "operation_id": operation_id,
+        "counts": counts,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else rows,
+    }
+
+
+def first_delivery(webhook_id):
+    """
+    True the first time a webhook id is seen; Shopify may deliver the same
+    webhook again. Call `forget_delivery` if handling it then fails, so a
+    redelivery isn't dropped.
+    """
+    if not webhook_id:
+        return True
+    return cache.add(f"shopify-webhook:{webhook_id}", 1, timeout=WEBHOOK_ID_TTL)
+
+
+def forget_delivery(webhook_id):
+    if webhook_id:
+        cache.delete(f"shopify-webhook:{webhook_id}")
+
+
+def newer_in_mirror(rows, updated_at):
+    """
+    Lock the mirrored row in `rows` and return True if it holds data newer
+    than `updated_at`. Call inside a transaction.
+    """
+    if updated_at is None:
+        return False
+    current = rows.select_for_update().values_list("updated_at", flat=True).first()
+    return current is not None and current > updated_at
+
+
+@transaction.atomic
+def apply_product_update(payload):
+    """
+    Upsert one product and its variants from a `products/update` webhook payload
+    (REST format). Cost and tracking are not part of the payload, so the
+    mirrored values for those are left untouched. A payload older than the
+    mirrored product is skipped.
+    """
+    synced_at = timezone.now()
+    product_id = payload["id"]
+    updated_at = parse_datetime(payload.get("updated_at") or "")
+    if newer_in_mirror(CatalogProduct.objects.filter(product_id=product_id), updated_at):
+        return {"product_id": product_id, "skipped": "older than the mirror"}
+
+    flush(CatalogProduct, [CatalogProduct(
+        product_id=product_id,
+        title=payload.get("title"),
+        product_type=payload.get("product_type"),
+        vendor=payload.get("vendor"),
+        tags=payload.get("tags"),
+        body_html=payload.get("body_html"),
+        synced_at=synced_at,
+        updated_at=updated_at,
+    )], ["product_id"])
+
+    variants = [
+        CatalogVariant(
+            variant_id=v["id"],
+            product_id=product_id,
+            sku=v.get("sku") or None,
+            price=v.get("price"),
+            compare_at_price=v.get("compare_at_price"),
+            inventory_item_id=v.get("inventory_item_id"),
+            synced_at=synced_at,
+        )
+        for v in payload.get("variants") or []
+    ]
+    if variants:
+        CatalogVariant.objects.bulk_create(
+            variants,
+            update_conflicts=True,
+            unique_fields=["variant_id"],
+            update_fields=["product_id", "sku", "price", "compare_at_price", "inventory_item_id", "synced_at"],
+        )
+    flush_sku_index(variants)
+
+    # Variants and SKUs the product no longer carries
+    variant_ids = [v.variant_id for v in variants]
+    skus = [v.sku for v in variants if v.sku]
+    dropped = SkuIndex.objects.filter(product_id=product_id).exclude(sku__in=skus)
+    product_cache.invalidate(*dropped.values_list("sku", flat=True))
+    dropped.delete()
+    CatalogVariant.objects.filter(product_id=product_id).exclude(variant_id__in=variant_ids).delete()
+    product_cache.invalidate(*skus, groups=["details", "pricing"])
+    return {"product_id": product_id, "variants": len(variants)}
+
+
+@transaction.atomic
+def apply_product_delete(payload):
+    """Remove a deleted product, its variants and their inventory levels."""
+    product_id = payload["id"]
+    inventory_item_ids = list(
+        CatalogVariant.objects.filter(product_id=product_id)
+        .exclude(inventory_item_id=None)
+        .values_list("inventory_item_id", flat=True)
+    )
+    CatalogInventoryLevel.objects.filter(inventory_item_id__in=inventory_item_ids).delete()
+    CatalogVariant.objects.filter(product_id=product_id).delete()
+    CatalogProduct.objects.filter(product_id=product_id).delete()
+    entries = SkuIndex.objects.filter(product_id=product_id)
+    product_cache.invalidate(*entries.values_list("sku", flat=True))
+    entries.delete()
+    return {"product_id": product_id, "deleted": True}
+
+
+@transaction.atomic
+def apply_inventory_level_update(payload):
+    """
+    Upsert one inventory level from an `inventory_levels/update` webhook
+    payload, unless the mirrored level is newer.
+    """
+    updated_at = parse_datetime(payload.get("updated_at") or "")
+    level = CatalogInventoryLevel.objects.filter(
+        inventory_item_id=payload["inventory_item_id"], location_id=payload["location_id"]
+    )
+    if newer_in_mirror(level, updated_at):
+        return {
+            "inventory_item_id": payload["inventory_item_id"],
+            "location_id": payload["location_id"],
+            "skipped": "older than the mirror",
+        }
+
+    flush(CatalogInventoryLevel, [CatalogInventoryLevel(
+        inventory_item_id=payload["inventory_item_id"],
+        location_id=payload["location_id"],
+        available=payload.get("available"),
+        synced_at=timezone.now(),
+        updated_at=updated_at,
+    )], ["inventory_item_id", "location_id"])
+    skus = SkuIndex.objects.filter(inventory_item_id=payload["inventory_item_id"]).values_list("sku", flat=True)
+    product_cache.invalidate(*skus, groups=["inventory"])
+    return {"inventory_item_id": payload["inventory_item_id"], "location_id": payload["location_id"]}
+
+
+WEBHOOK_HANDLERS = {
+    "products/update": apply_product_update,
+    "products/delete": apply_product_delete,
+    "inventory_levels/update": apply_inventory_level_update,
+}
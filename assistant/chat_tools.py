@@ -0,0 +1,380 @@
+# assistant/chat_tools.py
+"""
+The tools the chat model can call, registered in `tool_registry` with the
+handler that carries each one out and the formatter that describes its
+result in the answer. The web views and the CLI both dispatch through the
+registry, so a tool behaves (and is measured) the same way in both.
+"""
+
+import json
+import uuid
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from environs import Env
+
+from . import job_progress
+from .discounts import calculate_cost
+from .models import SaleCampaign
+from .shopify_chat_cli import (
+    get_product_info_by_sku,
+    get_product_info_by_skus,
+    update_product_by_sku,
+    create_product_with_sku,
+    put_product_on_sale,
+    take_product_off_sale,
+    disable_product_by_sku,
+)
+from .tool_registry import register, register_async
+
+env = Env()
+env.read_env()
+
+
+def mailgun_message(recipients, subject, body, attachment=None):
+    """Return (url, auth, data, files) for sending a message through the Mailgun API."""
+    mailgun_domain = env("MAILGUN_DOMAIN")
+    mailgun_api_key = env("MAILGUN_API_KEY")
+    from_email = env("FROM_EMAIL")
+
+    # Mailgun can accept a list of recipients directly
+    data = {
+        "from": from_email,
+        "to": recipients,  # <-- This is now a list
+        "subject": subject,
+        "text": body,
+    }
+
+    files = []
+    if attachment:
+        attachment.seek(0)
+        file_content = attachment.read()
+        files.append(
+            ("attachment", (attachment.name, file_content, "application/octet-stream"))
+        )
+    return f"https://api.mailgun.net/v3/{mailgun_domain}/messages", ("api", mailgun_api_key), data, files
+
+
+def send_email(recipients, subject, body, attachment=None):
+    url, auth, data, files = mailgun_message(recipients, subject, body, attachment)
+    try:
+        response = requests.post(
+            url,
+            auth=auth,
+            data=data,
+            files=files if files else None
+        )
+        response.raise_for_status()
+        return {"status": "success", "details": response.json()}
+    except requests.exceptions.RequestException as e:
+        return {"status": "error", "details": str(e)}
+
+
+async def asend_email(recipients, subject, body, attachment=None):
+    """`send_email` over async HTTP, for the async views."""
+    url, auth, data, files = mailgun_message(recipients, subject, body, attachment)
+    try:
+        async with httpx.AsyncClient(timeout=30) as http:
+            response = await http.post(url, auth=auth, data=data, files=files if files else None)
+        response.raise_for_status()
+        return {"status": "success", "details": response.json()}
+    except httpx.HTTPError as e:
+        return {"status": "error", "details": str(e)}
+
+
+def start_csv_job(action, csv_filename):
+    """Queue a CSV create or update on the Celery worker and return its job id right away."""
+    from assistant.tasks import run_csv_upload
+    job_id = uuid.uuid4().hex
+    job_progress.queue(job_id, action)
+    run_csv_upload.apply_async(args=[job_id, action, csv_filename], task_id=job_id)
+    return job_id
+
+
+def email_sent_message(args, email_response, uploaded_file=None):
+    if email_response["status"] != "success":
+        return f"\n\nFailed to send email.\nError: {email_response['details']}"
+    message = (
+        "\n\nEmail was successfully sent!\n"
+        f"Recipients: {args['recipients']}\n"
+        f"Subject: {args['subject']}\n"
+        f"Body: {args['body']}"
+    )
+    if uploaded_file:
+        message += f"\nAttachment: {uploaded_file.name}"
+    return message
+
+
+def product_details(info, sku, price_label="Price", price_note="", include_cost=False):
+    """The product fields shown after a lookup or change, one per line."""
+    lines = [
+        f"SKU: {info.get('sku', sku)}",
+        f"Title: {info.get('title', 'No title')}",
+        f"{price_label}: {info.get('price', 'N/A')}{price_note}",
+        f"Compare at Price: {info.get('compare_at_price', 'N/A')}",
+    ]
+    if include_cost:
+        lines.append(f"Cost: {info.get('cost', 'N/A')}")
+    lines += [
+        f"Available Quantity: {info.get('available', 'N/A')}",
+        f"Vendor: {info.get('vendor', 'N/A')}",
+        f"Type: {info.get('product_type', 'N/A')}",
+        f"Tags: {info.get('tags', '')}",
+        "Description:",
+        f"{info.get('body_html', 'No description')}",
+    ]
+    return "\n".join(lines)
+
+
+def with_product_info(response, sku):
+    """Add the product's info, read back after a successful change, to `response`."""
+    if response.get("status") != "success":
+        return response
+    try:
+        return {**response, "product_info": get_product_info_by_sku(sku)}
+    except Exception as e:
+        return {**response, "product_info_error": str(e)}
+
+
+def email_text(args, response, uploaded_file=None, apply_time=None, **context):
+    if response.get("status") == "scheduled":
+        message = (
+            f"\n\nYour email has been scheduled at {apply_time}!\n"
+            f"Recipients: {args['recipients']}\n"
+            f"Subject: {args['subject']}\n"
+            f"Body: {args['body']}"
+        )
+        if uploaded_file:
+            message += f"\nAttachment scheduled: {uploaded_file.name}"
+        return message
+    return email_sent_message(args, response, uploaded_file)
+
+
+@register("send_email", formatter=email_text)
+def send_email_tool(args, uploaded_file=None, apply_time=None, attachment_path=None, **context):
+    recipients = args["recipients"]
+    subject = args["subject"]
+    body = args["body"]
+
+    # If apply_time is provided, schedule the email
+    if apply_time:
+        from assistant.tasks import send_scheduled_email
+        send_scheduled_email.apply_async(
+            args=[recipients, subject, body, attachment_path],
+            eta=apply_time
+        )
+        return {"status": "scheduled", "apply_time": str(apply_time)}
+    # No scheduling, send immediately
+    return send_email(recipients, subject, body, attachment=uploaded_file)
+
+
+@register_async("send_email")
+async def asend_email_tool(args, uploaded_file=None, apply_time=None, **context):
+    """Emails are sent over async HTTP; scheduling one only queues a task."""
+    if apply_time:
+        return await sync_to_async(send_email_tool, thread_sensitive=False)(
+            args, uploaded_file=uploaded_file, apply_time=apply_time, **context
+        )
+    return await asend_email(args["recipients"], args["subject"], args["body"], attachment=uploaded_file)
+
+
+def product_info_text(args, product_info, **context):
+    requested_fields = args.get("fields", None)  # fields is optional
+    if requested_fields:
+        # Filter product_info to only include requested fields
+        answer = "\n\nRequested Product Information:\n"
+        for f in requested_fields:
+            answer += f"{f.capitalize()}: {product_info.get(f, 'N/A')}\n"
+        return answer
+    # Show all fields
+    return "\n\nProduct Information:\n" + product_details(product_info, "Unknown", include_cost=True)
+
+
+@register("get_product_info_by_sku", formatter=product_info_text, read_only=True)
+def lookup_product(args, **context):
+    product_info = get_product_info_by_sku(args["sku"])
+    # Print JSON for debugging
+    print("Product Info JSON for debugging:", json.dumps(product_info, indent=2))
+    return product_info
+
+
+def product_infos_text(args, product_infos, **context):
+    requested_fields = args.get("fields") or ["title", "price", "compare_at_price", "cost", "available"]
+    answer = f"\n\nProduct Information for {len(product_infos)} SKUs:\n"
+    for sku, product_info in product_infos.items():
+        if product_info is None:
+            answer += f"\nSKU: {sku}\nNot found\n"
+            continue
+        answer += f"\nSKU: {sku}\n"
+        for f in requested_fields:
+            if f != "sku":
+                answer += f"{f.capitalize()}: {product_info.get(f, 'N/A')}\n"
+    return answer
+
+
+@register("get_product_info_by_skus", formatter=product_infos_text, read_only=True)
+def lookup_products(args, **context):
+    product_infos = get_product_info_by_skus(args["skus"])
+    # Print JSON for debugging
+    print("Product Infos JSON for debugging:", json.dumps(product_infos, indent=2))
+    return product_infos
+
+
+def update_text(args, response, **context):
+    if response.get("status") != "success":
+        return f"\n\nFailed to update product.\nError: {response.get('message', 'Unknown error')}"
+    return "\n\nProduct successfully updated!\n" + product_details(response.get("updated_fields", {}), args["sku"])
+
+
+@register("update_product_by_sku", formatter=update_text)
+def update_product(args, **context):
+    update_fields = {k: v for k, v in args.items() if k != "sku"}
+    response = update_product_by_sku(args["sku"], update_fields)
+    # Print JSON for debugging
+    print("Update Product Response JSON for debugging:", json.dumps(response, indent=2))
+    return response
+
+
+def create_text(args, response, **context):
+    if response.get("status") != "success":
+        return f"\n\nFailed to create product.\nError: {response.get('message', 'Unknown error')}"
+    return "\n\nProduct successfully created!\n" + product_details(response.get("product_info", {}), args["sku"])
+
+
+@register("create_product_with_sku", formatter=create_text)
+def create_product(args, **context):
+    create_fields = {k: v for k, v in args.items() if k != "sku"}
+    response = create_product_with_sku(args["sku"], **create_fields)
+    # Print JSON for debugging
+    print("Create Product Response JSON for debugging:", json.dumps(response, indent=2))
+    return response
+
+
+def csv_job_text(args, response, **context):
+    if response.get("status") != "queued":
+        return f"\n\nError: {response.get('message', 'Unknown error')}"
+    verb = "Creating" if response["action"] == "create" else "Updating"
+    return f"\n\n{verb} products from the CSV in the background (job {response['job_id']})."
+
+
+def csv_job_tool(action):
+    def handler(args, csv_filename=None, csv_jobs=None, **context):
+        # The CLI names the file in the arguments; the web form uploads it
+        csv_filename = csv_filename or args.get("filename")
+        if not csv_filename:
+            return {"status": "error", "message": "No CSV file provided."}
+        # Large files take minutes, so they run on the worker and the page polls for progress
+        job_id = start_csv_job(action, csv_filename)
+        if csv_jobs is not None:
+            csv_jobs.append(job_id)
+        return {"status": "queued", "action": action, "job_id": job_id}
+    return handler
+
+
+register("create_products_from_csv", formatter=csv_job_text)(csv_job_tool("create"))
+register("update_products_from_csv", formatter=csv_job_text)(csv_job_tool("update"))
+
+
+def sale_text(args, response, **context):
+    if response.get("status") != "success":
+        return f"\n\nFailed to put product on sale.\nError: {response.get('message', 'Unknown error')}"
+    if "product_info" not in response:
+        return (
+            "\n\nProduct put on sale successfully, but unable to retrieve updated product info.\n"
+            f"SKU: {args['sku']}\n"
+            f"Error: {response.get('product_info_error')}"
+        )
+    return "\n\nProduct successfully put on sale!\n" + product_details(
+        response["product_info"], args["sku"], price_label="New Price",
+        price_note=f" (was {args['regular_price']}, now {args['sale_price']})",
+    )
+
+
+@register("put_product_on_sale", formatter=sale_text)
+def put_on_sale(args, **context):
+    sku = args["sku"]
+    response = put_product_on_sale(sku, args["sale_price"], args["regular_price"], args.get("tags_to_add", ["on-sale"]))
+    # Print JSON to console for debugging
+    print("Put Product On Sale Response JSON:", json.dumps(response, indent=2))
+    return with_product_info(response, sku)
+
+
+def off_sale_text(args, response, **context):
+    if response.get("status") != "success":
+        return f"\n\nFailed to take product off sale.\nError: {response.get('message', 'Unknown error')}"
+    if "product_info" not in response:
+        return (
+            "\n\nProduct taken off sale successfully, but unable to retrieve updated product info.\n"
+            f"SKU: {args['sku']}\n"
+            f"Error: {response.get('product_info_error')}"
+        )
+    return "\n\nProduct successfully taken off sale!\n" + product_details(
+        response["product_info"], args["sku"], price_label="Current Price", price_note=" (sale pricing removed)",
+    )
+
+
+@register("take_product_off_sale", formatter=off_sale_text)
+def take_off_sale(args, **context):
+    sku = args["sku"]
+    response = take_product_off_sale(sku, args.get("tags_to_remove", ["on-sale"]))
+    # Print JSON for debugging
+    print("Take Product Off Sale Response JSON:", json.dumps(response, indent=2))
+    return with_product_info(response, sku)
+
+
+def campaign_text(args, response, apply_time=None, revert_time=None, **context):
+    return (
+        f"\n\nSale campaign '{response['name']}' "
+        + (f"scheduled for {apply_time}." if apply_time else "started.")
+        + (f" It will be reverted at {revert_time}." if revert_time else "")
+        + " Progress and results are shown on the campaign in the admin."
+    )
+
+
+@register("start_sale_campaign", formatter=campaign_text)
+def start_campaign(args, apply_time=None, revert_time=None, **context):
+    from assistant.tasks import run_sale_campaign
+    campaign = SaleCampaign.objects.create(
+        name=args["name"],
+        vendor=args.get("vendor"),
+        product_type=args.get("product_type"),
+        tag=args.get("tag"),
+        skus=args.get("skus") or [],
+        percent_off=args.get("percent_off"),
+        discount_code=args.get("discount_code"),
+        sale_tag=args.get("sale_tag") or "on-sale",
+        starts_at=apply_time,
+        ends_at=revert_time,
+    )
+    run_sale_campaign.apply_async(args=[campaign.pk], eta=apply_time)
+    return {"status": "scheduled" if apply_time else "started", "campaign_id": campaign.pk, "name": campaign.name}
+
+
+def disable_text(args, response, **context):
+    if response.get("status") != "success":
+        return f"\n\nFailed to disable product.\nError: {response.get('message', 'Unknown error')}"
+    return "\n\nProduct successfully disabled!\n" + product_details(
+        response.get("updated_fields", {}), args["sku"], price_note=" (No longer available)",
+    )
+
+
+@register("disable_product_by_sku", formatter=disable_text)
+def disable_product(args, **context):
+    response = disable_product_by_sku(args["sku"])
+    # Print JSON for debugging
+    print("Disable Product Response JSON:", json.dumps(response, indent=2))
+    return response
+
+
+def cost_text(args, response, **context):
+    return (
+        f"\n\nThe cost for a retail price of ${args['retail']:.2f} with discount code '{response['discount']}' "
+        f"is calculated as: ${response['cost']:.2f}"
+    )
+
+
+@register("calculate_cost", formatter=cost_text, pure=True)
+def cost(args, **context):
+    discount_code = args.get("discount", "A")  # Default to 'A' if not provided
+    return {"status": "success", "discount": discount_code, "cost": calculate_cost(args["retail"], discount_code)}
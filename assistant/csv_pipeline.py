@@ -0,0 +1,181 @@
+# assistant/csv_pipeline.py
+"""
+Streaming ingestion for product CSVs, shared by the chat views and the batch tasks:
+
+    read_rows -> normalize_row -> validate -> chunked -> dispatch
+
+Every stage is a generator, so a file is read one row at a time no matter how
+large it is. Per-row outcomes are appended to a results CSV as they happen,
+and callers keep only counts and the first few errors in memory.
+"""
+
+import csv
+import glob
+import os
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+PRODUCT_FIELDS = (
+    "title", "product_type", "vendor", "tags", "body_html",
+    "price", "compare_at_price", "cost", "available",
+)
+PRICE_FIELDS = ("price", "compare_at_price", "cost")
+
+# Errors kept in memory for summaries; the rest are only in the results file
+MAX_REPORTED_ERRORS = 20
+# Successful rows listed by name in chat summaries
+MAX_LISTED_ROWS = 50
+
+CsvItem = namedtuple("CsvItem", ["row", "sku", "fields", "error"])
+
+
+class CsvFormatError(Exception):
+    pass
+
+
+def read_header(csv_path):
+    """Return the CSV's column names, or raise CsvFormatError if it can't be ingested."""
+    if not os.path.exists(csv_path):
+        raise CsvFormatError(f"File '{csv_path}' not found.")
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), None)
+    fieldnames = [name.strip() for name in header or []]
+    if "sku" not in fieldnames:
+        raise CsvFormatError("CSV must contain a 'sku' column.")
+    return fieldnames
+
+
+def read_rows(csv_path):
+    """
+    Yield (row_number, row_dict) for each data row. Row numbers count data
+    rows from 1, skipping blank lines.
+    """
+    fieldnames = read_header(csv_path)
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader)
+        row_number = 1
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield row_number, dict(zip(fieldnames, values))
+            row_number += 1
+
+
+def count_rows(csv_path):
+    """Number of data rows in the CSV, read in one streaming pass."""
+    return sum(1 for _ in read_rows(csv_path))
+
+
+def normalize_row(row):
+    """Return (sku, fields) with whitespace stripped and empty or 'nan' values dropped."""
+    sku = (row.get("sku") or "").strip()
+    fields = {}
+    for field in PRODUCT_FIELDS:
+        value = (row.get(field) or "").strip()
+        if value and value.lower() != "nan":
+            fields[field] = value
+    return sku, fields
+
+
+def validate(sku, fields):
+    """Return (fields, error). Prices must be decimals and `available` a whole number."""
+    if not sku:
+        return None, "No SKU provided"
+    for field in PRICE_FIELDS:
+        if field in fields:
+            try:
+                if Decimal(fields[field]) < 0:
+                    return None, f"{field} must not be negative: '{fields[field]}'"
+            except InvalidOperation:
+                return None, f"{field} is not a number: '{fields[field]}'"
+    if "available" in fields:
+        try:
+            fields["available"] = int(fields["available"])
+        except ValueError:
+            return None, f"available is not a whole number: '{fields['available']}'"
+    return fields, None
+
+
+def iter_items(csv_path):
+    """Yield a CsvItem for every row, with `error` set instead of raising for invalid rows."""
+    for row_number, row in read_rows(csv_path):
+        sku, fields = normalize_row(row)
+        fields, error = validate(sku, fields)
+        yield CsvItem(row_number, sku or None, fields, error)
+
+
+def results_path(name):
+    """Where the results CSV for `name` (a batch id and action, or an upload) is written."""
+    os.makedirs(settings.CSV_RESULTS_DIR, exist_ok=True)
+    return os.path.join(settings.CSV_RESULTS_DIR, f"{name}.results.csv")
+
+
+class ResultsWriter:
+    """
+    Append per-row outcomes to a results CSV while keeping only running counts,
+    the first MAX_REPORTED_ERRORS errors and the first MAX_LISTED_ROWS
+    successful rows in memory.
+
+        with ResultsWriter(path) as results:
+            results.write(item.row, item.sku, response)
+        results.summary()
+    """
+    COLUMNS = ["row", "sku", "status", "message"]
+
+    def __init__(self, path, header=True):
+        self.path = path
+        self.header = header
+        self.counts = {"success": 0, "unchanged": 0, "error": 0}
+        self.errors = []
+        self.listed = []
+        self.file = None
+        self.writer = None
+
+    def __enter__(self):
+        self.file = open(self.path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        if self.header:
+            self.writer.writerow(self.COLUMNS)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def write(self, row, sku, response, listed=None):
+        """Record one row's response dict. `listed` is what to show for it in summaries on success."""
+        status = response.get("status")
+        status = status if status in self.counts else "error"
+        message = response.get("message", "") if status != "success" else ""
+        self.counts[status] += 1
+        if status == "error" and len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row}, SKU {sku}: {message or 'Unknown error'}")
+        if status == "success" and listed and len(self.listed) < MAX_LISTED_ROWS:
+            self.listed.append(listed)
+        self.writer.writerow([row, sku or "", status, message])
+
+    def summary(self):
+        return {**self.counts, "errors": list(self.errors), "results_path": self.path}
+
+
+def merge_results(path, part_paths):
+    """Concatenate chunk result files (in row order) into `path` and delete them."""
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        csv.writer(out).writerow(ResultsWriter.COLUMNS)
+        for part in part_paths:
+            with open(part, newline="", encoding="utf-8") as f:
+                for line in f:
+                    out.write(line)
+            os.remove(part)
+    return path
+
+
+def part_paths(path):
+    """Chunk result files written for `path`, in row order."""
+    return sorted(glob.glob(f"{path}.part*"))
+
+
+def part_path(path, first_row):
+    return f"{path}.part{first_row:09d}"
@@ -0,0 +1,124 @@
+# assistant/fake_openai.py
+"""
+Local stand-in for the OpenAI chat completions endpoint, for benchmarking
+the chat views without calling the real API.
+
+Each request waits `latency` seconds before its first token, like a model
+thinking, then streams `tokens` content chunks `token_interval` seconds
+apart as server-sent events. Non-streaming requests get the whole answer
+after the same total time.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAI:
+    def __init__(self, latency=1.0, tokens=30, token_interval=0.02):
+        self.latency = latency
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self, host="127.0.0.1", port=0):
+        fake = self
+
+        class Handler(FakeOpenAIHandler):
+            api = fake
+
+        self.server = FakeOpenAIServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def chunk(self, model, delta, finish_reason=None):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def completion(self, model, content):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": self.tokens, "total_tokens": self.tokens},
+        }
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once
+    request_queue_size = 1024
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    api = None
+    # Streams end by closing the connection
+    protocol_version = "HTTP/1.0"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": "Not Found"}})
+            return
+
+        self.api.count_request()
+        model = body.get("model", "fake")
+        time.sleep(self.api.latency)
+        if not body.get("stream"):
+            time.sleep(self.api.tokens * self.api.token_interval)
+            self.send_json(200, self.api.completion(model, "token " * self.api.tokens))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.send_event(self.api.chunk(model, {"role": "assistant", "content": ""}))
+        for _ in range(self.api.tokens):
+            time.sleep(self.api.token_interval)
+            self.send_event(self.api.chunk(model, {"content": "token "}))
+        self.send_event(self.api.chunk(model, {}, finish_reason="stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,216 @@
+# assistant/fake_shopify.py
+"""
+In-memory stand-in for the Shopify Admin REST endpoints used by
+`AsyncShopifyClient`, for benchmarks and local runs without a store.
+
+Every request waits `latency` seconds to imitate the round trip to Shopify,
+and responses carry the `X-Shopify-Shop-Api-Call-Limit` header. Pass
+`bucket=(capacity, leak_per_second)` to answer with 429s once the leaky
+bucket is full, like a real store does.
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+LOCATION_ID = 1
+
+
+class FakeShopify:
+    def __init__(self, latency=0.05, bucket=None, version="2024-10"):
+        self.latency = latency
+        self.bucket = bucket
+        self.version = version
+        self.products = {}
+        self.variants = {}
+        self.inventory_items = {}
+        self.levels = {}
+        self.requests = 0
+        self.ids = count(1000)
+        self.lock = threading.Lock()
+        self.bucket_level = 0.0
+        self.bucket_ts = time.monotonic()
+        self.server = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/admin/api/{self.version}"
+
+    def start(self, host="127.0.0.1", port=0):
+        fake = self
+
+        class Handler(FakeShopifyHandler):
+            shop = fake
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def add_product(self, sku, title="Fake Product", price="10.00", available=0, cost=None):
+        with self.lock:
+            product_id, variant_id, item_id = next(self.ids), next(self.ids), next(self.ids)
+            self.products[product_id] = {
+                "id": product_id, "title": title, "product_type": "", "vendor": "",
+                "tags": "", "body_html": "", "variant_ids": [variant_id],
+            }
+            self.variants[variant_id] = {
+                "id": variant_id, "product_id": product_id, "sku": sku, "price": price,
+                "compare_at_price": None, "inventory_item_id": item_id, "inventory_management": "shopify",
+            }
+            self.inventory_items[item_id] = {"id": item_id, "sku": sku, "cost": cost, "tracked": True}
+            self.levels[item_id] = available
+        return product_id, variant_id, item_id
+
+    def seed(self, n, prefix="FAKE-"):
+        """Add `n` single-variant products. Returns {sku: (product_id, variant_id, inventory_item_id)}."""
+        return {f"{prefix}{i}": self.add_product(f"{prefix}{i}") for i in range(n)}
+
+    def product_json(self, product_id):
+        product = {k: v for k, v in self.products[product_id].items() if k != "variant_ids"}
+        product["variants"] = [dict(self.variants[v]) for v in self.products[product_id]["variant_ids"]]
+        return product
+
+    def take_call(self):
+        """Leak the bucket and add this call. Returns (allowed, call_limit_header)."""
+        with self.lock:
+            self.requests += 1
+            if not self.bucket:
+                return True, "1/40"
+            capacity, leak = self.bucket
+            now = time.monotonic()
+            self.bucket_level = max(0.0, self.bucket_level - (now - self.bucket_ts) * leak)
+            self.bucket_ts = now
+            if self.bucket_level + 1 > capacity:
+                return False, f"{capacity}/{capacity}"
+            self.bucket_level += 1
+            return True, f"{int(self.bucket_level)}/{capacity}"
+
+    def handle(self, method, path, query, body):
+        """Route one request. Returns (status, response_body)."""
+        prefix = f"/admin/api/{self.version}"
+        if not path.startswith(prefix):
+            return 404, {"errors": "Not Found"}
+        path = path[len(prefix):]
+
+        with self.lock:
+            if method == "POST" and path == "/products.json":
+                return 201, {"product": self.create_product(body["product"])}
+
+            match = re.fullmatch(r"/products/(\d+)\.json", path)
+            if match and int(match[1]) in self.products:
+                product_id = int(match[1])
+                if method == "PUT":
+                    fields = {k: v for k, v in body["product"].items() if k not in ("id", "variants")}
+                    self.products[product_id].update(fields)
+                return 200, {"product": self.product_json(product_id)}
+
+            match = re.fullmatch(r"/variants/(\d+)\.json", path)
+            if match and int(match[1]) in self.variants:
+                variant = self.variants[int(match[1])]
+                if method == "PUT":
+                    variant.update({k: v for k, v in body["variant"].items() if k != "id"})
+                return 200, {"variant": dict(variant)}
+
+            match = re.fullmatch(r"/inventory_items/(\d+)\.json", path)
+            if match and int(match[1]) in self.inventory_items:
+                item = self.inventory_items[int(match[1])]
+                if method == "PUT":
+                    item.update({k: v for k, v in body["inventory_item"].items() if k != "id"})
+                return 200, {"inventory_item": dict(item)}
+
+            if method == "GET" and path == "/inventory_levels.json":
+                item_ids = [int(i) for i in query.get("inventory_item_ids", [""])[0].split(",") if i]
+                return 200, {"inventory_levels": [
+                    {"inventory_item_id": i, "location_id": LOCATION_ID, "available": self.levels[i]}
+                    for i in item_ids if i in self.levels
+                ]}
+
+            if method == "POST" and path == "/inventory_levels/set.json":
+                item_id = int(body["inventory_item_id"])
+                if item_id not in self.levels:
+                    return 404, {"errors": "Not Found"}
+                self.levels[item_id] = int(body["available"])
+                return 200, {"inventory_level": {
+                    "inventory_item_id": item_id, "location_id": LOCATION_ID, "available": self.levels[item_id],
+                }}
+
+        return 404, {"errors": "Not Found"}
+
+    def create_product(self, fields):
+        product_id = next(self.ids)
+        variant_ids = []
+        for variant_fields in fields.get("variants") or [{}]:
+            variant_id, item_id = next(self.ids), next(self.ids)
+            self.variants[variant_id] = {
+                "id": variant_id, "product_id": product_id, "sku": variant_fields.get("sku"),
+                "price": variant_fields.get("price", "0.00"), "compare_at_price": variant_fields.get("compare_at_price"),
+                "inventory_item_id": item_id, "inventory_management": variant_fields.get("inventory_management"),
+            }
+            self.inventory_items[item_id] = {"id": item_id, "sku": variant_fields.get("sku"), "cost": None, "tracked": False}
+            self.levels[item_id] = 0
+            variant_ids.append(variant_id)
+        self.products[product_id] = {
+            "id": product_id,
+            "title": fields.get("title", ""),
+            "product_type": fields.get("product_type", ""),
+            "vendor": fields.get("vendor", ""),
+            "tags": fields.get("tags", ""),
+            "body_html": fields.get("body_html", ""),
+            "variant_ids": variant_ids,
+        }
+        return self.product_json(product_id)
+
+
+class FakeShopifyHandler(BaseHTTPRequestHandler):
+    shop = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_PUT(self):
+        self.respond("PUT")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def respond(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        time.sleep(self.shop.latency)
+
+        allowed, call_limit = self.shop.take_call()
+        if not allowed:
+            status, body = 429, {"errors": "Exceeded 2 calls per second for api client."}
+            extra = {"Retry-After": "1.0"}
+        else:
+            url = urlparse(self.path)
+            try:
+                status, body = self.shop.handle(method, url.path, parse_qs(url.query), json.loads(raw) if raw else {})
+            except (KeyError, ValueError) as e:
+                status, body = 422, {"errors": str(e)}
+            extra = {}
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Shopify-Shop-Api-Call-Limit", call_limit)
+        for name, value in extra.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,303 @@
+# assistant/handbook.py
+"""
+Context for the model from the store handbook and policy docs.
+
+`ingest_handbook` splits the docs into chunks, embeds them and writes an
+index directory:
+
+    embeddings.npy   float32 matrix, one unit-length row per chunk
+    chunks.json      each chunk's source file, text and estimated tokens
+    meta.json        embedding backend, dimensions and build time
+
+A worker memory-maps the matrix the first time it needs it, so every
+process on a host shares the same pages and nothing is copied into Python
+objects. A query is one matrix-vector product (the dot products of unit
+vectors are their cosine similarities) and a partial sort for the top k,
+which takes a few milliseconds even for tens of thousands of chunks.
+
+Embedding backends are classes with an `embed(texts)` method returning a
+float32 array with a row per text. HANDBOOK_EMBEDDING_BACKEND names one of
+EMBEDDING_BACKENDS or gives a dotted path to another, and the index records
+which one built it so questions are embedded the same way. The "hashing"
+backend needs no network and always gives the same vectors for the same
+text, so it can stand in for OpenAI offline and in tests.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.json"
+META_FILE = "meta.json"
+
+DOC_EXTENSIONS = (".md", ".txt", ".html", ".htm")
+# Separates chunks in the prompt's context
+SEPARATOR = "\n\n###\n\n"
+
+WORD = re.compile(r"[a-z0-9$%']+")
+TAG = re.compile(r"<[^>]+>")
+HEADING = re.compile(r"^(?=#{1,6}\s)", re.M)
+# Words too common to tell chunks apart, left out of the hashing embeddings
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or our "
+    "the to we what when where which who why with you your".split()
+)
+
+
+def estimate_tokens(text):
+    """MAX_LEN and chunk sizes are in tokens, estimated at four characters each."""
+    return max(1, len(text) // 4)
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embeddings: words and word pairs hashed into signed
+    buckets. Questions that share words with a chunk score high, which is
+    enough to exercise retrieval without an API key.
+    """
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def features(self, text):
+        words = [word for word in WORD.findall(text.lower()) if word not in STOP_WORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        # Damp repeated words so one phrase used over and over doesn't swamp the rest
+        return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+
+class OpenAIEmbedder:
+    # Inputs sent per embeddings request
+    BATCH_SIZE = 100
+
+    def __init__(self, model=None):
+        from openai import OpenAI
+        self.model = model or settings.HANDBOOK_EMBEDDING_MODEL
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.BATCH_SIZE],
+                dimensions=settings.HANDBOOK_EMBEDDING_DIMENSIONS,
+            )
+            rows += [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return np.asarray(rows, dtype=np.float32)
+
+
+EMBEDDING_BACKENDS = {
+    "hashing": HashingEmbedder,
+    "openai": OpenAIEmbedder,
+}
+
+
+def get_embedder(name):
+    backend = EMBEDDING_BACKENDS.get(name) or import_string(name)
+    return backend()
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def read_doc(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".html", ".htm")):
+        text = TAG.sub(" ", text)
+    return text
+
+
+def doc_paths(paths):
+    """Every handbook doc under `paths`, which may be files or directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    if name.endswith(DOC_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def chunk_text(text, max_tokens):
+    """
+    Split `text` into chunks of about `max_tokens`. Each Markdown heading
+    starts a new chunk, and sections are split on paragraph breaks where
+    possible and otherwise on sentence ends.
+    """
+    chunks = []
+    for section in HEADING.split(text):
+        pieces = []
+        for paragraph in re.split(r"\n\s*\n", section):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            if estimate_tokens(paragraph) <= max_tokens:
+                pieces.append(paragraph)
+            else:
+                pieces += re.split(r"(?<=[.!?])\s+", paragraph)
+
+        current = ""
+        for piece in pieces:
+            candidate = f"{current}\n\n{piece}" if current else piece
+            if current and estimate_tokens(candidate) > max_tokens:
+                chunks.append(current)
+                candidate = piece
+            current = candidate
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def build_index(paths, index_dir=None, backend=None, chunk_tokens=None):
+    """
+    Chunk and embed the docs under `paths` and replace the index in
+    `index_dir`. Returns {"docs", "chunks", "dimensions", "seconds"}.
+    """
+    started = time.monotonic()
+    index_dir = index_dir or settings.HANDBOOK_INDEX_DIR
+    chunk_tokens = chunk_tokens or settings.HANDBOOK_CHUNK_TOKENS
+    backend = backend or settings.HANDBOOK_EMBEDDING_BACKEND
+    embedder = get_embedder(backend)
+
+    chunks, docs = [], 0
+    for path in doc_paths(paths):
+        docs += 1
+        for text in chunk_text(read_doc(path), chunk_tokens):
+            chunks.append({"source": os.path.basename(path), "text": text, "tokens": estimate_tokens(text)})
+    if not chunks:
+        raise ValueError("No handbook text found to index.")
+
+    matrix = normalize_rows(embedder.embed([chunk["text"] for chunk in chunks]))
+    meta = {
+        "backend": backend,
+        "dimensions": int(matrix.shape[1]),
+        "chunks": len(chunks),
+        "built_at": time.time(),
+    }
+
+    # Write next to the live index and swap it in, so readers never see half an index
+    building = f"{index_dir}.building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    np.save(os.path.join(building, EMBEDDINGS_FILE), matrix.astype(np.float32))
+    with open(os.path.join(building, CHUNKS_FILE), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+    with open(os.path.join(building, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    previous = f"{index_dir}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, previous)
+    os.rename(building, index_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    return {
+        "docs": docs,
+        "chunks": len(chunks),
+        "dimensions": meta["dimensions"],
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+
+class HandbookIndex:
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, CHUNKS_FILE), encoding="utf-8") as f:
+            self.chunks = json.load(f)
+        self.matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self.embedder = get_embedder(self.meta["backend"])
+
+    @property
+    def version(self):
+        return f"{self.meta['backend']}:{self.meta['built_at']}"
+
+    def search(self, vector, k):
+        """[(score, chunk)] for the `k` chunks most similar to the unit-length `vector`, best first."""
+        scores = self.matrix @ vector
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+    def query(self, question, k):
+        vector = normalize_rows(self.embedder.embed([question]))[0]
+        return self.search(vector, k)
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    This worker's HandbookIndex, loaded on first use and again only when
+    `ingest_handbook` replaces it. None if nothing has been ingested yet.
+    """
+    global _index, _index_mtime
+    try:
+        mtime = os.path.getmtime(os.path.join(settings.HANDBOOK_INDEX_DIR, META_FILE))
+    except OSError:
+        return None
+    if _index is None or mtime != _index_mtime:
+        with _index_lock:
+            if _index is None or mtime != _index_mtime:
+                _index = HandbookIndex(settings.HANDBOOK_INDEX_DIR)
+                _index_mtime = mtime
+    return _index
+
+
+def version():
+    """Identifies the current index, so answers cached from an older one don't match."""
+    index = get_index()
+    return index.version if index else ""
+
+
+def context_for(question, max_len, k=None):
+    """
+    The handbook chunks most relevant to `question`, best first and joined
+    for the prompt, stopping before their estimated tokens pass `max_len`.
+    """
+    try:
+        index = get_index()
+        if index is None:
+            return ""
+        hits = index.query(question, k or settings.HANDBOOK_TOP_K)
+    except Exception as e:
+        print(f"[Handbook] Retrieval failed, answering without context: {e}")
+        return ""
+
+    texts, length = [], 0
+    for score, chunk in hits:
+        if score < settings.HANDBOOK_MIN_SCORE:
+            break
+        length += chunk["tokens"] + estimate_tokens(SEPARATOR)
+        if length > max_len:
+            break
+        texts.append(chunk["text"])
+    return SEPARATOR.join(texts)
@@ -0,0 +1,95 @@
+# assistant/intent_router.py
+"""
+Answer fully structured commands without the model:
+
+    "price of SKU 12345"             -> get_product_info_by_sku
+    "cost of 299.99 with code BY"    -> calculate_cost
+    "take SKU X off sale"            -> take_product_off_sale
+
+Each intent is a compiled pattern that has to match the whole question, so
+anything with extra words, a product named instead of a SKU, or an unknown
+discount code goes to the model as before. Hits and misses are logged and
+counted per intent for /metrics/.
+"""
+
+import re
+from collections import namedtuple
+
+import redis
+
+from . import rate_limit
+from .discounts import discount_codes
+
+STATS_KEY = "intent-router:stats"
+
+Route = namedtuple("Route", ["intent", "tool_name", "args"])
+
+SKU = r"sku\s*[#:]?\s*(?P<sku>[a-z0-9][a-z0-9._/-]*)"
+AMOUNT = r"\$?\s*(?P<retail>\d+(?:,\d{3})*(?:\.\d{1,2})?)"
+CODE = r"(?:discount\s+)?code\s+(?P<code>[a-z0-9+]+)"
+
+PATTERNS = [
+    ("price", re.compile(rf"(?:(?:what(?:'s|\s+is)\s+)?the\s+)?price\s+(?:of|for)\s+{SKU}", re.I)),
+    ("price", re.compile(rf"(?:what(?:'s|\s+is)\s+)?{SKU}(?:'s)?\s+price", re.I)),
+    ("price", re.compile(rf"how\s+much\s+is\s+{SKU}", re.I)),
+    ("cost", re.compile(
+        rf"(?:(?:what(?:'s|\s+is)|calculate)\s+)?(?:the\s+)?cost\s+(?:of|for)\s+(?:an?\s+)?{AMOUNT}"
+        rf"(?:\s+item)?\s+(?:with|at|using)\s+{CODE}",
+        re.I,
+    )),
+    ("off_sale", re.compile(rf"(?:please\s+)?take\s+{SKU}\s+off\s+(?:the\s+)?sale", re.I)),
+    ("off_sale", re.compile(rf"(?:please\s+)?remove\s+{SKU}\s+from\s+(?:the\s+)?sale", re.I)),
+]
+
+# Trailing punctuation and extra spaces don't change the command
+TRAILING = re.compile(r"[\s?!.]+$")
+WHITESPACE = re.compile(r"\s+")
+
+
+def clean(question):
+    return TRAILING.sub("", WHITESPACE.sub(" ", question).strip())
+
+
+def to_route(intent, match):
+    if intent == "price":
+        return Route(intent, "get_product_info_by_sku", {"sku": match["sku"], "fields": ["title", "price"]})
+    if intent == "cost":
+        code = match["code"].upper()
+        if code not in discount_codes:
+            return None
+        return Route(intent, "calculate_cost", {"retail": float(match["retail"].replace(",", "")), "discount": code})
+    return Route(intent, "take_product_off_sale", {"sku": match["sku"]})
+
+
+def record(outcome):
+    try:
+        rate_limit.get_client().hincrby(STATS_KEY, outcome, 1)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def route(question):
+    """The Route for a structured command, or None if the model should answer it."""
+    text = clean(question)
+    for intent, pattern in PATTERNS:
+        match = pattern.fullmatch(text)
+        if match:
+            routed = to_route(intent, match)
+            if routed:
+                print(f"[IntentRouter] hit {intent}: {routed.tool_name}({routed.args})")
+                record(intent)
+                return routed
+    print(f"[IntentRouter] miss: {text[:80]!r}")
+    record("miss")
+    return None
+
+
+def stats():
+    try:
+        raw = rate_limit.get_client().hgetall(STATS_KEY)
+    except redis.exceptions.RedisError as e:
+        return {"error": str(e)}
+    counts = {key.decode(): int(value) for key, value in raw.items()}
+    total = sum(counts.values())
+    counts["hit_rate"] = round((total - counts.get("miss", 0)) / total, 3) if total else None
+    return counts
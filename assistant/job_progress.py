@@ -0,0 +1,71 @@
+# assistant/job_progress.py
+"""
+Live progress for CSV uploads processed on the Celery worker.
+
+The worker keeps a few counters per job in the Redis cache: rows in the file,
+rows done and rows with errors, plus the start time and, once finished, the
+result. The status endpoint only reads these keys, so polling it every couple
+of seconds never touches the database or the worker.
+"""
+
+import time
+
+from django.core.cache import cache
+
+KEY_PREFIX = "csv-job"
+# Long enough to come back to a finished job's summary
+PROGRESS_TTL = 60 * 60 * 24
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+
+FIELDS = ("action", "state", "total", "done", "failed", "started_at", "result")
+
+
+def key(job_id, field):
+    return f"{KEY_PREFIX}:{job_id}:{field}"
+
+
+def queue(job_id, action):
+    """Register a job as soon as it is enqueued, so polling finds it before a worker picks it up."""
+    cache.set_many({key(job_id, "action"): action, key(job_id, "state"): QUEUED}, timeout=PROGRESS_TTL)
+
+
+def start(job_id, total):
+    cache.set_many({
+        key(job_id, "state"): RUNNING,
+        key(job_id, "total"): total,
+        key(job_id, "done"): 0,
+        key(job_id, "failed"): 0,
+        key(job_id, "started_at"): time.time(),
+    }, timeout=PROGRESS_TTL)
+
+
+def advance(job_id, done, failed=0):
+    """Count rows finished since the last call; `failed` of them had errors."""
+    cache.incr(key(job_id, "done"), done)
+    if failed:
+        cache.incr(key(job_id, "failed"), failed)
+
+
+def finish(job_id, result):
+    cache.set_many({key(job_id, "state"): COMPLETE, key(job_id, "result"): result}, timeout=PROGRESS_TTL)
+
+
+def status(job_id):
+    """
+    Return the job's counters with its throughput, percent done and an ETA in
+    seconds, or None for an unknown (or expired) job.
+    """
+    values = cache.get_many([key(job_id, field) for field in FIELDS])
+    if not values:
+        return None
+    job = {field: values.get(key(job_id, field)) for field in FIELDS}
+    total, done = job["total"] or 0, job["done"] or 0
+    elapsed = time.time() - job["started_at"] if job["started_at"] else 0
+    rate = done / elapsed if elapsed and done else None
+    job["rows_per_second"] = round(rate, 1) if rate else None
+    job["percent"] = int(100 * done / total) if total else 0
+    job["eta_seconds"] = round((total - done) / rate) if rate and job["state"] == RUNNING else None
+    return job
@@ -0,0 +1,77 @@
+# assistant/management/commands/benchmark_chat_concurrency.py
+
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from openai import AsyncOpenAI, OpenAI
+
+from assistant.fake_openai import FakeOpenAI
+from assistant.views import astream_answer, stream_answer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare how many chat questions one process answers at once on the sync path "
+        "(one question per worker) and the async path, against a local fake OpenAI API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=100, help="Questions to answer per async run.")
+        parser.add_argument("--sync-questions", type=int, default=5,
+                            help="Questions to answer one at a time on the sync path.")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100],
+                            help="Questions in flight at once on the async path.")
+        parser.add_argument("--latency", type=float, default=1.0, help="Simulated seconds before the first token.")
+        parser.add_argument("--tokens", type=int, default=30, help="Tokens streamed per answer.")
+        parser.add_argument("--token-interval", type=float, default=0.02, help="Simulated seconds between tokens.")
+
+    def report(self, label, started, first_tokens, questions):
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<28} {questions / seconds:7.2f} questions/sec, {seconds:6.2f}s, "
+            f"first token after {statistics.mean(first_tokens):.2f}s on average"
+        )
+
+    def handle(self, *args, **options):
+        fake = FakeOpenAI(latency=options["latency"], tokens=options["tokens"], token_interval=options["token_interval"])
+        base_url = fake.start()
+        try:
+            # A sync worker (gunicorn core.wsgi) answers one question at a time
+            sync_client = OpenAI(base_url=base_url, api_key="fake", max_retries=0)
+            first_tokens = []
+            started = time.perf_counter()
+            for _ in range(options["sync_questions"]):
+                asked = time.perf_counter()
+                for i, _ in enumerate(stream_answer(question="What is your store phone number?", openai_client=sync_client, use_cache=False)):
+                    if i == 0:
+                        first_tokens.append(time.perf_counter() - asked)
+            self.report("sync, 1 in flight:", started, first_tokens, options["sync_questions"])
+
+            # The async path keeps many questions in flight on one event loop
+            for concurrency in options["concurrency"]:
+                async def main():
+                    async_client = AsyncOpenAI(base_url=base_url, api_key="fake", max_retries=0)
+                    semaphore = asyncio.Semaphore(concurrency)
+                    first_tokens = []
+
+                    async def ask():
+                        async with semaphore:
+                            asked = time.perf_counter()
+                            first = None
+                            async for _ in astream_answer(question="What is your store phone number?", openai_client=async_client, use_cache=False):
+                                if first is None:
+                                    first = time.perf_counter() - asked
+                            first_tokens.append(first)
+
+                    await asyncio.gather(*(ask() for _ in range(options["questions"])))
+                    await async_client.close()
+                    return first_tokens
+
+                started = time.perf_counter()
+                first_tokens = asyncio.run(main())
+                self.report(f"async, {concurrency} in flight:", started, first_tokens, options["questions"])
+        finally:
+            fake.stop()
+        self.stdout.write(self.style.SUCCESS("Benchmark complete."))
@@ -0,0 +1,29 @@
+# assistant/management/commands/benchmark_product_fetch.py
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from assistant.shopify_chat_cli import get_product_info_by_sku
+
+
+class Command(BaseCommand):
+    help = "Time uncached product info lookups over the REST and GraphQL fetch paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("skus", nargs="+", help="SKUs to look up.")
+        parser.add_argument("--repeat", type=int, default=3, help="Lookups per SKU and API.")
+
+    def handle(self, *args, **options):
+        for api in ("rest", "graphql"):
+            timings = []
+            for sku in options["skus"]:
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    get_product_info_by_sku(sku, api=api, use_cache=False)
+                    timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f"{api:>8}: median {statistics.median(timings) * 1000:.0f} ms, "
+                f"max {max(timings) * 1000:.0f} ms over {len(timings)} lookups"
+            )
@@ -0,0 +1,15 @@
+# assistant/management/commands/rebuild_sku_index.py
+
+from django.core.management.base import BaseCommand
+
+from assistant.shopify_chat_cli import rebuild_sku_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SKU -> product/variant/inventory item index from a full Shopify catalog scan."
+
+    def handle(self, *args, **options):
+        result = rebuild_sku_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {result['indexed']} SKUs, removed {result['removed']} stale entries."
+        ))
@@ -0,0 +1,30 @@
+# assistant/management/commands/register_shopify_webhooks.py
+
+import shopify
+from django.core.management.base import BaseCommand, CommandError
+
+# catalog_mirror imports shopify_chat_cli, which activates the Shopify session
+from assistant.catalog_mirror import WEBHOOK_HANDLERS
+
+
+class Command(BaseCommand):
+    help = "Subscribe the store to the product and inventory webhooks handled by this app."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "address",
+            help="Public URL of the webhook endpoint, e.g. https://example.com/webhooks/shopify/",
+        )
+
+    def handle(self, *args, **options):
+        address = options["address"]
+        existing = {(w.topic, w.address) for w in shopify.Webhook.find()}
+
+        for topic in WEBHOOK_HANDLERS:
+            if (topic, address) in existing:
+                self.stdout.write(f"{topic}: already subscribed")
+                continue
+            webhook = shopify.Webhook({"topic": topic, "address": address, "format": "json"})
+            if not webhook.save():
+                raise CommandError(f"Failed to subscribe to {topic}. Errors: {webhook.errors.full_messages()}")
+            self.stdout.write(self.style.SUCCESS(f"{topic}: subscribed"))
@@ -0,0 +1,33 @@
+# assistant/management/commands/resume_batch.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assistant.models import BatchJob, BatchRow
+from assistant.tasks import resume_csv_batch
+
+
+class Command(BaseCommand):
+    help = "Resume an applied CSV batch from its last checkpoint, optionally retrying its failed rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("batch_id", help="Batch id of the applied CSV batch.")
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Also queue rows whose update failed. Rows that already succeeded are not touched.",
+        )
+
+    def handle(self, *args, **options):
+        job = BatchJob.objects.filter(batch_id=options["batch_id"], action=BatchJob.APPLY).first()
+        if not job:
+            raise CommandError(f"No applied batch {options['batch_id']}.")
+        if job.status not in BatchJob.RESUMABLE:
+            raise CommandError(f"Batch {job.batch_id} is still {job.status}; only an interrupted or complete batch can be resumed.")
+
+        unfinished = job.rows.filter(state__in=BatchRow.UNFINISHED).count()
+        failed = job.rows.filter(state=BatchRow.FAILED, fields__isnull=False).count()
+        result = resume_csv_batch.delay(job.batch_id, retry_failed=options["retry_failed"])
+        retried = f" and {failed} failed rows" if options["retry_failed"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {unfinished} unfinished rows{retried} of batch {job.batch_id} as task {result.id}."
+        ))
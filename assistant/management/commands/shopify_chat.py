@@ -0,0 +1,55 @@
+# assistant/management/commands/shopify_chat.py
+
+import json
+
+from django.core.management.base import BaseCommand
+
+# chat_tools registers the same tool handlers as the web chat, so calls are measured the same way
+from assistant import chat_tools, tool_registry  # noqa: F401
+from assistant.shopify_chat_cli import client, tools
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant for the music store All You Need Music. You can send emails, "
+    "retrieve product information by SKU, create products, update products, and process CSV files."
+)
+
+
+class Command(BaseCommand):
+    help = "Chat with the store assistant from the terminal, with the same tools as the web chat."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            default="gpt-4o-mini",
+            help="OpenAI model to chat with.",
+        )
+
+    def handle(self, *args, **options):
+        model = options["model"]
+        while True:
+            try:
+                user_input = input(":")
+            except (EOFError, KeyboardInterrupt):
+                self.stdout.write("")
+                return
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_input},
+            ]
+
+            completion = client.chat.completions.create(model=model, messages=messages, tools=tools)
+            message = completion.choices[0].message
+
+            if not message.tool_calls:
+                self.stdout.write(message.content or "")
+                continue
+
+            for tool_call in message.tool_calls:
+                tool_name = tool_call.function.name
+                args = json.loads(tool_call.function.arguments or "{}")
+                response = tool_registry.call(tool_name, args)
+                messages.append({"role": "function", "name": tool_name, "content": json.dumps(response, default=str)})
+
+            messages.append({"role": "system", "content": "The tool results are above. Summarize them for the user, confirming any changes that were made."})
+            followup_completion = client.chat.completions.create(model=model, messages=messages, tools=tools)
+            self.stdout.write(followup_completion.choices[0].message.content or "")
@@ -0,0 +1,37 @@
+# assistant/management/commands/sync_catalog_mirror.py
+
+from django.core.management.base import BaseCommand
+
+from assistant.catalog_mirror import sync_catalog_mirror
+from assistant.tasks import refresh_catalog_mirror
+
+
+class Command(BaseCommand):
+    help = "Mirror the Shopify catalog locally from a GraphQL bulk operation export."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the sync on the Celery worker instead of running it here.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=5,
+            help="Seconds between bulk operation status checks.",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            result = refresh_catalog_mirror.delay()
+            self.stdout.write(f"Queued catalog mirror sync as task {result.id}.")
+            return
+
+        result = sync_catalog_mirror(poll_interval=options["poll_interval"])
+        counts = result["counts"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Mirrored {counts['products']} products, {counts['variants']} variants and "
+            f"{counts['inventory_levels']} inventory levels in {result['seconds']}s "
+            f"({result['rows_per_second']} rows/sec)."
+        ))
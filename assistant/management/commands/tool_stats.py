@@ -0,0 +1,41 @@
+# assistant/management/commands/tool_stats.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assistant import tool_metrics
+
+
+class Command(BaseCommand):
+    help = "Show per-tool latency, Shopify call and payload-size percentiles for chat tool calls."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tool", help="Only show this tool.")
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Clear every tool's histograms after showing them.",
+        )
+
+    def handle(self, *args, **options):
+        stats = tool_metrics.stats(options["tool"])
+        if "error" in stats:
+            raise CommandError(f"Could not read tool metrics: {stats['error']}")
+        if not stats:
+            self.stdout.write("No tool calls recorded yet.")
+            return
+
+        self.stdout.write(
+            f"{'tool':<28}{'calls':>7}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'api/call':>10}{'p99 api':>9}{'p99 resp B':>12}"
+        )
+        # Slowest tail first
+        for name, tool in sorted(stats.items(), key=lambda item: -(item[1]["wall_ms"]["p99"] or 0)):
+            wall, api, response = tool["wall_ms"], tool["api_calls"], tool["response_bytes"]
+            self.stdout.write(
+                f"{name:<28}{tool['count']:>7}{tool['errors']:>7}{wall['p50']:>9}{wall['p95']:>9}{wall['p99']:>9}"
+                f"{api['mean']:>10}{api['p99']:>9}{response['p99']:>12}"
+            )
+
+        if options["reset"]:
+            tool_metrics.reset()
+            self.stdout.write(self.style.SUCCESS("Cleared the tool histograms."))
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.17 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0003_productsnapshot_batch_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkuIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(max_length=255, unique=True)),
+                ('product_id', models.BigIntegerField()),
+                ('variant_id', models.BigIntegerField()),
+                ('inventory_item_id', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.17 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0004_skuindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField(unique=True)),
+                ('title', models.CharField(blank=True, max_length=255, null=True)),
+                ('product_type', models.CharField(blank=True, max_length=255, null=True)),
+                ('vendor', models.CharField(blank=True, max_length=255, null=True)),
+                ('tags', models.TextField(blank=True, null=True)),
+                ('body_html', models.TextField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant_id', models.BigIntegerField(unique=True)),
+                ('product_id', models.BigIntegerField(db_index=True)),
+                ('sku', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('price', models.CharField(blank=True, max_length=50, null=True)),
+                ('compare_at_price', models.CharField(blank=True, max_length=50, null=True)),
+                ('inventory_item_id', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('cost', models.CharField(blank=True, max_length=50, null=True)),
+                ('tracked', models.BooleanField(default=False)),
+                ('synced_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogInventoryLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inventory_item_id', models.BigIntegerField()),
+                ('location_id', models.BigIntegerField()),
+                ('available', models.IntegerField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('inventory_item_id', 'location_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-17 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0005_catalog_mirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=255)),
+                ('action', models.CharField(choices=[('apply', 'Apply'), ('revert', 'Revert')], default='apply', max_length=20)),
+                ('csv_path', models.CharField(blank=True, max_length=500, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('complete', 'Complete')], default='running', max_length=20)),
+                ('total_rows', models.IntegerField(default=0)),
+                ('succeeded', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('rows_per_second', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('batch_id', 'action')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0006_batchjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productsnapshot',
+            name='batch_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
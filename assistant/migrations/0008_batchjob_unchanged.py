@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0007_alter_productsnapshot_batch_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchjob',
+            name='unchanged',
+            field=models.IntegerField(default=0),
+        ),
+    ]
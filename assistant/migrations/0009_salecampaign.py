@@ -0,0 +1,36 @@
+# Generated by Django 4.2.17 on 2026-10-17 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0008_batchjob_unchanged'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('vendor', models.CharField(blank=True, max_length=255, null=True)),
+                ('product_type', models.CharField(blank=True, max_length=255, null=True)),
+                ('tag', models.CharField(blank=True, max_length=255, null=True)),
+                ('skus', models.JSONField(blank=True, default=list)),
+                ('percent_off', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('discount_code', models.CharField(blank=True, max_length=20, null=True)),
+                ('sale_tag', models.CharField(default='on-sale', max_length=255)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('active', 'Active'), ('reverted', 'Reverted'), ('failed', 'Failed')], default='scheduled', max_length=20)),
+                ('variant_count', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('reverted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-17 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0009_salecampaign'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchjob',
+            name='results_path',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.17 on 2026-10-17 18:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0010_batchjob_results_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='batchjob',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('complete', 'Complete'), ('interrupted', 'Interrupted')], default='running', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='BatchRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row', models.IntegerField()),
+                ('sku', models.CharField(blank=True, max_length=255, null=True)),
+                ('fields', models.JSONField(blank=True, null=True)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('snapshotted', 'Snapshotted'), ('applied', 'Applied'), ('unchanged', 'Unchanged'), ('failed', 'Failed'), ('reverted', 'Reverted')], default='pending', max_length=20)),
+                ('message', models.TextField(blank=True, default='')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='assistant.batchjob')),
+                ('snapshot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='assistant.productsnapshot')),
+            ],
+            options={
+                'unique_together': {('job', 'row')},
+                'indexes': [models.Index(fields=['job', 'state'], name='assistant_b_job_id_7b1fed_idx')],
+            },
+        ),
+    ]
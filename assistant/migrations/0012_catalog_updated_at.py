@@ -0,0 +1,23 @@
+# Generated by Django 4.2.17 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0011_batchrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogproduct',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cataloginventorylevel',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
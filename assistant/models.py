@@ -27,7 +27,7 @@ class Message(models.Model):
         return self.question
 
 class ProductSnapshot(models.Model):
-    batch_id = models.CharField(max_length=255, null=True, blank=True)  # A unique ID for this batch of updates
+    batch_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)  # A unique ID for this batch of updates
     sku = models.CharField(max_length=255)
     title = models.CharField(max_length=255, null=True, blank=True)
     product_type = models.CharField(max_length=255, null=True, blank=True)
@@ -42,4 +42,153 @@ class ProductSnapshot(models.Model):
     reverted = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"{self.sku} snapshot in batch {self.batch_id}"
\ No newline at end of file
+        return f"{self.sku} snapshot in batch {self.batch_id}"
+
+class SkuIndex(models.Model):
+    sku = models.CharField(max_length=255, unique=True)
+    product_id = models.BigIntegerField()
+    variant_id = models.BigIntegerField()
+    inventory_item_id = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.sku} -> product {self.product_id}, variant {self.variant_id}"
+
+class CatalogProduct(models.Model):
+    product_id = models.BigIntegerField(unique=True)
+    title = models.CharField(max_length=255, null=True, blank=True)
+    product_type = models.CharField(max_length=255, null=True, blank=True)
+    vendor = models.CharField(max_length=255, null=True, blank=True)
+    tags = models.TextField(null=True, blank=True)
+    body_html = models.TextField(null=True, blank=True)
+    synced_at = models.DateTimeField()
+    # Shopify's updated_at for the data held, so older webhooks don't overwrite it
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.title or str(self.product_id)
+
+class CatalogVariant(models.Model):
+    variant_id = models.BigIntegerField(unique=True)
+    product_id = models.BigIntegerField(db_index=True)
+    sku = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    price = models.CharField(max_length=50, null=True, blank=True)
+    compare_at_price = models.CharField(max_length=50, null=True, blank=True)
+    inventory_item_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    cost = models.CharField(max_length=50, null=True, blank=True)
+    tracked = models.BooleanField(default=False)
+    synced_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.sku or str(self.variant_id)
+
+class CatalogInventoryLevel(models.Model):
+    inventory_item_id = models.BigIntegerField()
+    location_id = models.BigIntegerField()
+    available = models.IntegerField(null=True, blank=True)
+    synced_at = models.DateTimeField()
+    # Shopify's updated_at for the data held, so older webhooks don't overwrite it
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("inventory_item_id", "location_id")
+
+    def __str__(self):
+        return f"Item {self.inventory_item_id} at location {self.location_id}: {self.available}"
+
+class BatchJob(models.Model):
+    APPLY = "apply"
+    REVERT = "revert"
+    ACTION_CHOICES = [(APPLY, "Apply"), (REVERT, "Revert")]
+
+    RUNNING = "running"
+    COMPLETE = "complete"
+    INTERRUPTED = "interrupted"  # Not dispatched yet, or finished with rows left pending; see resume_csv_batch
+    STATUS_CHOICES = [(RUNNING, "Running"), (COMPLETE, "Complete"), (INTERRUPTED, "Interrupted")]
+    # A running batch still has its chunks queued; resuming it would dispatch its rows twice
+    RESUMABLE = [INTERRUPTED, COMPLETE]
+
+    batch_id = models.CharField(max_length=255)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, default=APPLY)
+    csv_path = models.CharField(max_length=500, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    total_rows = models.IntegerField(default=0)
+    succeeded = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    unchanged = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # The first few; every row is in results_path
+    results_path = models.CharField(max_length=500, null=True, blank=True)
+    rows_per_second = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("batch_id", "action")
+
+    def __str__(self):
+        return f"{self.action} batch {self.batch_id} ({self.status})"
+
+class BatchRow(models.Model):
+    """One CSV row of an applied batch, checkpointed as it moves through the batch."""
+    PENDING = "pending"
+    SNAPSHOTTED = "snapshotted"  # Current values stored; the update may or may not have been sent
+    APPLIED = "applied"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+    REVERTED = "reverted"
+    STATE_CHOICES = [
+        (PENDING, "Pending"), (SNAPSHOTTED, "Snapshotted"), (APPLIED, "Applied"),
+        (UNCHANGED, "Unchanged"), (FAILED, "Failed"), (REVERTED, "Reverted"),
+    ]
+    # States that still need work when a batch is resumed
+    UNFINISHED = [PENDING, SNAPSHOTTED]
+
+    job = models.ForeignKey(BatchJob, on_delete=models.CASCADE, related_name="rows")
+    row = models.IntegerField()  # Data row number in the CSV, from 1
+    sku = models.CharField(max_length=255, null=True, blank=True)
+    fields = models.JSONField(null=True, blank=True)  # Validated CSV fields; null when the row is invalid
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=PENDING)
+    snapshot = models.ForeignKey(ProductSnapshot, on_delete=models.SET_NULL, null=True, blank=True)
+    message = models.TextField(blank=True, default="")
+
+    class Meta:
+        unique_together = ("job", "row")
+        indexes = [models.Index(fields=["job", "state"])]
+
+    def __str__(self):
+        return f"Row {self.row} ({self.sku}) of {self.job}: {self.state}"
+
+class SaleCampaign(models.Model):
+    SCHEDULED = "scheduled"
+    ACTIVE = "active"
+    REVERTED = "reverted"
+    FAILED = "failed"
+    STATUS_CHOICES = [(SCHEDULED, "Scheduled"), (ACTIVE, "Active"), (REVERTED, "Reverted"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=255)
+    # Variant selection; every filter given must match
+    vendor = models.CharField(max_length=255, null=True, blank=True)
+    product_type = models.CharField(max_length=255, null=True, blank=True)
+    tag = models.CharField(max_length=255, null=True, blank=True)
+    skus = models.JSONField(default=list, blank=True)
+    # Pricing rule: a percentage off, or a discount code from discounts.discount_codes
+    percent_off = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    discount_code = models.CharField(max_length=20, null=True, blank=True)
+    sale_tag = models.CharField(max_length=255, default="on-sale")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=SCHEDULED)
+    variant_count = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    reverted_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def batch_id(self):
+        """ProductSnapshot batch id holding the pre-sale prices and tags."""
+        return f"campaign-{self.pk}"
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
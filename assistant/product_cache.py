@@ -0,0 +1,119 @@
+# assistant/product_cache.py
+"""
+Read-through cache for product info returned by `get_product_info_by_sku`.
+
+Fields are cached in groups so each group can have its own TTL: inventory
+changes constantly, pricing occasionally, and descriptive fields rarely.
+A lookup that only misses the inventory group can be filled with a single
+inventory level request instead of a full product fetch.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = "product-info"
+
+FIELD_GROUPS = {
+    "details": ("title", "product_type", "vendor", "tags", "sku", "body_html"),
+    "pricing": ("price", "compare_at_price", "cost"),
+    "inventory": ("available",),
+}
+
+# Order of fields in the dicts handed back to callers
+FIELDS = (
+    "title", "product_type", "vendor", "tags", "sku",
+    "price", "compare_at_price", "cost", "available", "body_html",
+)
+
+
+def group_ttl(group):
+    return {
+        "details": settings.PRODUCT_CACHE_TTL_DETAILS,
+        "pricing": settings.PRODUCT_CACHE_TTL_PRICING,
+        "inventory": settings.PRODUCT_CACHE_TTL_INVENTORY,
+    }[group]
+
+
+def group_key(sku, group):
+    return f"{KEY_PREFIX}:{sku}:{group}"
+
+
+def get_cached(sku):
+    """
+    Return (info, missing_groups) for SKU. `info` holds every field from the
+    groups that were cached; `missing_groups` is the set of groups that were not.
+    """
+    keys = {group_key(sku, group): group for group in FIELD_GROUPS}
+    found = cache.get_many(keys.keys())
+    info = {}
+    for key, value in found.items():
+        info.update(value)
+    missing = {group for key, group in keys.items() if key not in found}
+    return info, missing
+
+
+def get_cached_many(skus):
+    """Like `get_cached`, for many SKUs in one round trip. Returns {sku: (info, missing_groups)}."""
+    keys = {group_key(sku, group): (sku, group) for sku in skus for group in FIELD_GROUPS}
+    found = cache.get_many(keys.keys())
+    results = {sku: ({}, set()) for sku in skus}
+    for key, (sku, group) in keys.items():
+        if key in found:
+            results[sku][0].update(found[key])
+        else:
+            results[sku][1].add(group)
+    return results
+
+
+def store(sku, info):
+    """
+    Write the fields in `info` through to the cache. Groups that `info` fully
+    covers are replaced. Groups it only partly covers are merged into the cached
+    copy, or dropped if there is none, so the cache never mixes old and new values.
+    """
+    to_set = {}
+    to_delete = []
+    for group, fields in FIELD_GROUPS.items():
+        present = {f: info[f] for f in fields if f in info}
+        if not present:
+            continue
+        if len(present) == len(fields):
+            to_set[group] = present
+            continue
+        existing = cache.get(group_key(sku, group))
+        if existing is None:
+            to_delete.append(group_key(sku, group))
+        else:
+            existing.update(present)
+            to_set[group] = existing
+
+    for group, value in to_set.items():
+        cache.set(group_key(sku, group), value, timeout=group_ttl(group))
+    if to_delete:
+        cache.delete_many(to_delete)
+
+
+def invalidate(*skus, groups=None):
+    """Drop cached groups (all of them by default) for the given SKUs."""
+    groups = groups or FIELD_GROUPS.keys()
+    keys = [group_key(sku, group) for sku in skus if sku for group in groups]
+    if keys:
+        cache.delete_many(keys)
+
+
+def record(outcome, count=1):
+    """Count lookup outcomes: 'hit', 'partial' or 'miss'."""
+    if not count:
+        return
+    key = f"{KEY_PREFIX}:stats:{outcome}"
+    cache.add(key, 0, timeout=None)
+    cache.incr(key, count)
+
+
+def stats():
+    keys = {f"{KEY_PREFIX}:stats:{outcome}": outcome for outcome in ("hit", "partial", "miss")}
+    values = cache.get_many(keys.keys())
+    counts = {outcome: values.get(key, 0) for key, outcome in keys.items()}
+    total = sum(counts.values())
+    counts["hit_rate"] = round(counts["hit"] / total, 3) if total else None
+    return counts
@@ -0,0 +1,252 @@
+# assistant/rate_limit.py
+"""
+Shopify API rate limiting shared by every web and worker process.
+
+Shopify meters the REST API as a leaky bucket (40 calls, draining 2/sec on a
+standard plan) and the GraphQL API as a bucket of query cost points (1,000
+points, restoring 50/sec). Each bucket is mirrored in Redis. Before a call we
+take tokens from the mirror and sleep only if there aren't enough; after the
+call we correct the mirror from what Shopify reports:
+
+- REST: the `X-Shopify-Shop-Api-Call-Limit` header, e.g. "32/40"
+- GraphQL: `extensions.cost.throttleStatus` in the response body
+
+If Redis is unreachable, calls go through unthrottled rather than failing.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+import redis
+import shopify
+from django.conf import settings
+
+KEY_PREFIX = "shopify-rate"
+REST_LIMIT_HEADER = "X-Shopify-Shop-Api-Call-Limit"
+
+# (capacity, refill per second) until Shopify tells us otherwise
+DEFAULT_BUCKETS = {
+    "rest": (40, 2.0),
+    "graphql": (1000, 50.0),
+}
+
+# Take `cost` tokens if available. Returns "0", or the seconds to wait before
+# there will be enough. Uses the Redis clock so every host agrees on time.
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'capacity', 'rate')
+local capacity = tonumber(state[3]) or tonumber(ARGV[2])
+local rate = tonumber(state[4]) or tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+local cost = math.min(tonumber(ARGV[1]), capacity)
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'capacity', capacity, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Correct the bucket from a server-reported level. Keeps the lower of the
+# local and reported token counts, since our own in-flight calls may not be
+# counted by Shopify yet.
+OBSERVE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'capacity', 'rate')
+local reported = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local tokens = reported
+if state[1] then
+  local local_tokens = tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * tonumber(state[4])
+  tokens = math.min(math.min(local_tokens, capacity), reported)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'capacity', capacity, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(tokens)
+"""
+
+_client = None
+
+# Per-operation call counter set by `count_calls`
+_call_counter = contextvars.ContextVar("shopify_call_counter", default=None)
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+def bucket_key(bucket):
+    return f"{KEY_PREFIX}:{bucket}"
+
+
+def acquire(bucket, cost=1, timeout=120):
+    """
+    Block until `cost` tokens can be taken from `bucket` ("rest" or "graphql").
+    Returns the number of seconds spent waiting.
+    """
+    capacity, rate = DEFAULT_BUCKETS[bucket]
+    counter = _call_counter.get()
+    if counter is not None:
+        counter[bucket] += 1
+    waited = 0.0
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            wait = float(get_client().eval(ACQUIRE_SCRIPT, 1, bucket_key(bucket), cost, capacity, rate))
+        except redis.exceptions.RedisError as e:
+            print(f"[RateLimit] Redis unavailable, not throttling: {e}")
+            return waited
+        if wait <= 0:
+            break
+        wait = min(wait, max(0.0, deadline - time.monotonic()))
+        if wait <= 0:
+            print(f"[RateLimit] Gave up waiting for {bucket} budget after {timeout}s")
+            break
+        time.sleep(wait)
+        waited += wait
+
+    record(bucket, waited)
+    return waited
+
+
+def observe(bucket, available, capacity, rate):
+    try:
+        get_client().eval(OBSERVE_SCRIPT, 1, bucket_key(bucket), available, capacity, rate)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def observe_rest_headers(headers):
+    """Update the REST bucket from a response's call-limit header."""
+    value = None
+    for key, header_value in (headers or {}).items():
+        if key.lower() == REST_LIMIT_HEADER.lower():
+            value = header_value
+    if not value or "/" not in value:
+        return
+    used, limit = (int(part) for part in value.split("/", 1))
+    # REST buckets drain at 1/20th of their size per second (2/sec for 40, 4/sec for 80)
+    observe("rest", limit - used, limit, limit / 20)
+
+
+def observe_graphql_cost(extensions):
+    """Update the GraphQL bucket from a response's `extensions` object."""
+    status = ((extensions or {}).get("cost") or {}).get("throttleStatus")
+    if not status:
+        return
+    observe("graphql", status["currentlyAvailable"], status["maximumAvailable"], status["restoreRate"])
+
+
+def record(bucket, waited):
+    try:
+        pipe = get_client().pipeline()
+        pipe.hincrby(f"{KEY_PREFIX}:stats", f"{bucket}:calls", 1)
+        if waited:
+            pipe.hincrby(f"{KEY_PREFIX}:stats", f"{bucket}:waits", 1)
+            pipe.hincrbyfloat(f"{KEY_PREFIX}:stats", f"{bucket}:waited_seconds", waited)
+        pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+@contextmanager
+def count_calls():
+    """
+    Count the REST and GraphQL calls (retries included) made inside the block:
+
+        with rate_limit.count_calls() as calls:
+            ...
+        calls["rest"], calls["graphql"]
+
+    Blocks nest: calls counted by an inner block are added to the enclosing
+    one when it exits, so the outer count covers everything made inside it.
+    """
+    enclosing = _call_counter.get()
+    counter = {bucket: 0 for bucket in DEFAULT_BUCKETS}
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+        if enclosing is not None:
+            for bucket, calls in counter.items():
+                enclosing[bucket] += calls
+
+
+def record_operation(operation, calls):
+    """Add one run of `operation` that made `calls` API calls to the per-operation totals."""
+    try:
+        pipe = get_client().pipeline()
+        pipe.hincrby(f"{KEY_PREFIX}:operations", f"{operation}:runs", 1)
+        pipe.hincrby(f"{KEY_PREFIX}:operations", f"{operation}:calls", calls)
+        pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+def operation_stats():
+    """Return {operation: {"runs", "calls", "calls_per_run"}}."""
+    try:
+        raw = get_client().hgetall(f"{KEY_PREFIX}:operations")
+    except redis.exceptions.RedisError as e:
+        return {"error": str(e)}
+    result = {}
+    for key, value in raw.items():
+        operation, name = key.decode().rsplit(":", 1)
+        result.setdefault(operation, {})[name] = int(value)
+    for totals in result.values():
+        runs = totals.get("runs", 0)
+        totals["calls_per_run"] = round(totals.get("calls", 0) / runs, 2) if runs else None
+    return result
+
+
+def stats():
+    try:
+        raw = get_client().hgetall(f"{KEY_PREFIX}:stats")
+        levels = {bucket: get_client().hgetall(bucket_key(bucket)) for bucket in DEFAULT_BUCKETS}
+    except redis.exceptions.RedisError as e:
+        return {"error": str(e)}
+    result = {}
+    for key, value in raw.items():
+        bucket, name = key.decode().split(":", 1)
+        result.setdefault(bucket, {})[name] = float(value) if name == "waited_seconds" else int(value)
+    for bucket, state in levels.items():
+        if state:
+            result.setdefault(bucket, {})["tokens"] = round(float(state[b"tokens"]), 1)
+            result[bucket]["capacity"] = float(state[b"capacity"])
+    return result
+
+
+def install():
+    """
+    Route every REST request made by the shopify library through the shared
+    REST bucket. The library sends all REST calls through
+    ShopifyConnection._open, which also keeps the last response around.
+    """
+    connection_class = shopify.base.ShopifyConnection
+    if getattr(connection_class, "_rate_limited", False):
+        return
+    original_open = connection_class._open
+
+    def _open(self, *args, **kwargs):
+        acquire("rest")
+        try:
+            return original_open(self, *args, **kwargs)
+        finally:
+            if self.response is not None:
+                observe_rest_headers(getattr(self.response, "headers", None))
+
+    connection_class._open = _open
+    connection_class._rate_limited = True
@@ -0,0 +1,170 @@
+# assistant/retry.py
+"""
+Retries for Shopify API calls.
+
+Transient failures are retried with jittered exponential backoff until a total
+deadline runs out. When Shopify sends `Retry-After`, we wait at least that long.
+Transient failures are:
+
+- 429 Too Many Requests, and GraphQL `THROTTLED` errors
+- 5xx responses
+- connection resets and timeouts
+
+A 429 or throttle means Shopify did not process the request, so it is always
+safe to retry. A 5xx or dropped connection might have happened after the write
+went through, so non-idempotent requests (REST POSTs, GraphQL mutations) are
+only retried on 429.
+"""
+
+import asyncio
+import http.client
+import random
+import socket
+import time
+import urllib.error
+
+import httpx
+import requests
+import shopify
+from django.conf import settings
+from pyactiveresource import connection as ar_connection
+
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+
+
+class ShopifyRateLimitError(Exception):
+    """Shopify asked us to slow down (HTTP 429 or a GraphQL THROTTLED error)."""
+    def __init__(self, retry_after=2.0, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+def header(headers, name):
+    """Case-insensitive header lookup that works for dicts and HTTPMessage objects."""
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def parse_retry_after(headers):
+    value = header(headers, "Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def classify(exc):
+    """
+    Return (kind, retry_after) for an exception. `kind` is "throttled",
+    "transient" or None when the error should not be retried.
+    """
+    if isinstance(exc, ShopifyRateLimitError):
+        return "throttled", exc.retry_after
+
+    status, headers = None, None
+    if isinstance(exc, ar_connection.ConnectionError) and getattr(exc, "response", None) is not None:
+        status, headers = getattr(exc.response, "code", None), getattr(exc.response, "headers", None)
+    elif isinstance(exc, urllib.error.HTTPError):
+        status, headers = exc.code, exc.headers
+    elif isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status, headers = exc.response.status_code, exc.response.headers
+    elif isinstance(exc, httpx.HTTPStatusError):
+        status, headers = exc.response.status_code, exc.response.headers
+
+    if status is not None:
+        if status == 429:
+            return "throttled", parse_retry_after(headers)
+        if 500 <= status < 600:
+            return "transient", parse_retry_after(headers)
+        return None, None
+
+    if isinstance(exc, (
+        ar_connection.Error,
+        urllib.error.URLError,
+        requests.ConnectionError,
+        requests.Timeout,
+        httpx.TransportError,
+        http.client.RemoteDisconnected,
+        ConnectionResetError,
+        socket.timeout,
+    )):
+        return "transient", None
+    return None, None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, BASE_DELAY))
+    return delay
+
+
+def retry_call(func, args=(), kwargs=None, idempotent=True, deadline=None):
+    """
+    Call func(*args, **kwargs), retrying transient Shopify failures until
+    `deadline` seconds (settings.SHOPIFY_RETRY_DEADLINE by default) have passed.
+    """
+    kwargs = kwargs or {}
+    deadline = settings.SHOPIFY_RETRY_DEADLINE if deadline is None else deadline
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as exc:
+            kind, retry_after = classify(exc)
+            if kind is None or (kind == "transient" and not idempotent):
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            if time.monotonic() + delay > give_up_at:
+                print(f"[Retry] Giving up on {getattr(func, '__name__', func)} after {attempt + 1} attempts: {exc}")
+                raise
+            print(f"[Retry] {kind} error ({exc}). Retrying in {delay:.2f}s...")
+            time.sleep(delay)
+            attempt += 1
+
+
+async def async_retry_call(make_call, idempotent=True, deadline=None):
+    """
+    Async counterpart of `retry_call`. `make_call` is a zero-argument function
+    returning a fresh awaitable for each attempt.
+    """
+    deadline = settings.SHOPIFY_RETRY_DEADLINE if deadline is None else deadline
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        try:
+            return await make_call()
+        except Exception as exc:
+            kind, retry_after = classify(exc)
+            if kind is None or (kind == "transient" and not idempotent):
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            if time.monotonic() + delay > give_up_at:
+                print(f"[Retry] Giving up after {attempt + 1} attempts: {exc}")
+                raise
+            print(f"[Retry] {kind} error ({exc}). Retrying in {delay:.2f}s...")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def install():
+    """
+    Retry every REST request the shopify library makes. Each attempt goes
+    back through ShopifyConnection._open, so retries are rate limited too.
+    """
+    connection_class = shopify.base.ShopifyConnection
+    if getattr(connection_class, "_retrying", False):
+        return
+    inner_open = connection_class._open
+
+    def _open(self, *args, **kwargs):
+        method = args[0] if args else kwargs.get("method", "GET")
+        return retry_call(inner_open, (self,) + args, kwargs, idempotent=method.upper() != "POST")
+
+    connection_class._open = _open
+    connection_class._retrying = True
@@ -2,11 +2,22 @@
 
 from openai import OpenAI
 from decouple import config
-import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from pyactiveresource.connection import ResourceNotFound
 import shopify
+import contextvars
 import json
-import csv
 import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from .models import CatalogInventoryLevel, SkuIndex
+from . import csv_pipeline, product_cache, rate_limit, retry
+from .retry import ShopifyRateLimitError
 
 OPENAI_API_KEY = config("OPENAI_API_KEY")
 client = OpenAI(api_key=OPENAI_API_KEY)
@@ -18,10 +29,86 @@ VERSION = "2024-10"
 session = shopify.Session(STORE_NAME, VERSION, ACCESS_TOKEN)
 shopify.ShopifyResource.activate_session(session)
 shop = shopify.Shop.current
+# Throttle, then retry, every REST call made through the shopify library
+rate_limit.install()
+retry.install()
+
+# Budget reserved for a GraphQL query before Shopify reports its actual cost
+DEFAULT_GRAPHQL_COST = 50
+
+def execute_graphql(query, variables, cost):
+    rate_limit.acquire("graphql", cost)
+    response = json.loads(shopify.GraphQL().execute(query, variables=variables))
+    extensions = response.get("extensions") or {}
+    rate_limit.observe_graphql_cost(extensions)
+
+    errors = response.get("errors") or []
+    if any((e.get("extensions") or {}).get("code") == "THROTTLED" for e in errors):
+        cost_info = extensions.get("cost") or {}
+        status = cost_info.get("throttleStatus") or {}
+        retry_after = None
+        if status.get("restoreRate"):
+            needed = cost_info.get("requestedQueryCost", cost) - status.get("currentlyAvailable", 0)
+            retry_after = max(needed, 0) / status["restoreRate"]
+        raise ShopifyRateLimitError(retry_after, "GraphQL request throttled")
+    if errors:
+        raise Exception(f"GraphQL request failed. Errors: {errors}")
+    return response.get("data", {})
+
+def run_graphql(query, variables=None, cost=DEFAULT_GRAPHQL_COST):
+    """
+    Execute a GraphQL Admin API query on the active session and return its `data`.
+    `cost` is the query cost budget to reserve from the shared rate limiter.
+    Throttled requests are retried; so are failed queries, but not failed mutations.
+    Raises if the response carries top-level errors.
+    """
+    idempotent = not query.lstrip().startswith("mutation")
+    return retry.retry_call(execute_graphql, (query, variables, cost), idempotent=idempotent)
+
+def gid_to_id(gid):
+    """Turn a GraphQL global id (gid://shopify/Product/123) into its numeric REST id."""
+    return int(gid.rsplit("/", 1)[-1]) if gid else None
+
+def index_products(products):
+    """
+    Upsert every variant of the given Shopify products into the SKU index.
+    Returns the number of SKUs written.
+    """
+    entries = {}
+    for product in products:
+        for variant in product.variants:
+            if not variant.sku:
+                continue
+            entries[variant.sku] = SkuIndex(
+                sku=variant.sku,
+                product_id=product.id,
+                variant_id=variant.id,
+                inventory_item_id=getattr(variant, 'inventory_item_id', None),
+            )
+    return write_sku_index(entries)
+
+def write_sku_index(entries):
+    """
+    Upsert a {sku: SkuIndex} mapping. Keying by SKU keeps each statement free of
+    duplicates, which Postgres refuses to upsert twice in one statement.
+    """
+    if entries:
+        SkuIndex.objects.bulk_create(
+            entries.values(),
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=["product_id", "variant_id", "inventory_item_id", "updated_at"],
+        )
+    return len(entries)
 
-def find_product_by_sku(sku):
+def scan_catalog_for_sku(sku):
+    """
+    Page through the whole catalog looking for SKU. Every page is written to
+    the SKU index on the way, so a scan also repairs the index.
+    """
     products = shopify.Product.find(limit=250)
     while True:
+        index_products(products)
         for product in products:
             for variant in product.variants:
                 if variant.sku == sku:
@@ -32,22 +119,56 @@ def find_product_by_sku(sku):
             break
     return None, None
 
-def get_product_info_by_sku(sku):
-    product, variant = find_product_by_sku(sku)
-    if not product or not variant:
-        raise Exception(f"Could not find product with SKU '{sku}'")
+def rebuild_sku_index():
+    """
+    Rebuild the SKU index from a full catalog scan and drop SKUs that no longer exist.
+    """
+    started = timezone.now()
+    total = 0
+    products = shopify.Product.find(limit=250, fields="id,variants")
+    while True:
+        total += index_products(products)
+        if hasattr(products, 'has_next_page') and products.has_next_page():
+            products = products.next_page()
+        else:
+            break
+    removed, _ = SkuIndex.objects.filter(updated_at__lt=started).delete()
+    return {"indexed": total, "removed": removed}
 
-    inventory_item_id = variant.inventory_item_id
-    inventory_item = shopify.InventoryItem.find(inventory_item_id)
-    cost = inventory_item.cost if hasattr(inventory_item, 'cost') else None
+def find_product_by_sku(sku):
+    entry = SkuIndex.objects.filter(sku=sku).first()
+    if entry:
+        try:
+            product = shopify.Product.find(entry.product_id)
+        except ResourceNotFound:
+            product = None
+        if product:
+            for variant in product.variants:
+                if variant.sku == sku:
+                    if variant.id != entry.variant_id:
+                        index_products([product])
+                    return product, variant
+            # The product no longer carries this SKU; re-index what it does carry
+            index_products([product])
+        # Stale hit: forget it and fall back to a scan, which re-indexes as it goes
+        SkuIndex.objects.filter(pk=entry.pk).delete()
+
+    if not getattr(settings, "SKU_INDEX_SCAN_ON_MISS", True):
+        return None, None
+    return scan_catalog_for_sku(sku)
 
+def fetch_available(inventory_item_id):
     inventory_levels = shopify.InventoryLevel.find(inventory_item_ids=inventory_item_id)
-    available = None
     if inventory_levels:
-        first_level = inventory_levels[0]
-        available = first_level.available
-
-    result = {
+        return inventory_levels[0].available
+    return None
+
+def product_info_from(product, variant, **known):
+    """
+    Build a product info dict from REST objects already in hand. Pass `cost`
+    and `available` in `known` when they are known; they are left out otherwise.
+    """
+    info = {
         "title": product.title,
         "product_type": product.product_type,
         "vendor": product.vendor,
@@ -55,13 +176,429 @@ def get_product_info_by_sku(sku):
         "sku": variant.sku,
         "price": variant.price,
         "compare_at_price": variant.compare_at_price,
-        "cost": cost,
+        "body_html": product.body_html,
+    }
+    info.update(known)
+    return {field: info[field] for field in product_cache.FIELDS if field in info}
+
+def write_through(product, variant, info):
+    """
+    Store freshly written product info in the cache. Product-level fields are
+    shared by every variant, so sibling SKUs lose their cached details.
+    """
+    product_cache.store(variant.sku, info)
+    siblings = [v.sku for v in product.variants if v.sku and v.sku != variant.sku]
+    product_cache.invalidate(*siblings, groups=["details"])
+
+def fetch_product_info(sku):
+    product, variant = find_product_by_sku(sku)
+    if not product or not variant:
+        raise Exception(f"Could not find product with SKU '{sku}'")
+
+    inventory_item_id = variant.inventory_item_id
+    inventory_item = shopify.InventoryItem.find(inventory_item_id)
+    cost = inventory_item.cost if hasattr(inventory_item, 'cost') else None
+
+    return product_info_from(product, variant, cost=cost, available=fetch_available(inventory_item_id))
+
+PRODUCT_VARIANT_FIELDS = '''
+    id
+    sku
+    price
+    compareAtPrice
+    product { id title productType vendor tags descriptionHtml }
+    inventoryItem {
+      id
+      unitCost { amount }
+      inventoryLevels(first: 10) {
+        edges { node { location { id } quantities(names: ["available"]) { name quantity } } }
+      }
+    }
+'''
+
+PRODUCT_BY_SKU_QUERY = '''
+query productBySku($query: String!) {
+  productVariants(first: 10, query: $query) {
+    edges { node { %s } }
+  }
+}
+''' % PRODUCT_VARIANT_FIELDS
+
+def sku_search_term(sku):
+    """Quote a SKU for use in a Shopify search query string."""
+    escaped = sku.replace("\\", "\\\\").replace('"', '\\"')
+    return f'sku:"{escaped}"'
+
+def product_info_from_variant_node(node):
+    """Build a product info dict from a GraphQL ProductVariant node."""
+    product = node["product"]
+    inventory_item = node.get("inventoryItem") or {}
+    unit_cost = inventory_item.get("unitCost") or {}
+    levels = [edge["node"] for edge in inventory_item.get("inventoryLevels", {}).get("edges", [])]
+    available = None
+    if levels:
+        for quantity in levels[0]["quantities"]:
+            if quantity["name"] == "available":
+                available = quantity["quantity"]
+    info = {
+        "title": product["title"],
+        "product_type": product["productType"],
+        "vendor": product["vendor"],
+        "tags": ", ".join(product["tags"]),
+        "sku": node["sku"],
+        "price": node["price"],
+        "compare_at_price": node["compareAtPrice"],
+        "cost": unit_cost.get("amount"),
         "available": available,
-        "body_html": product.body_html
+        "body_html": product["descriptionHtml"],
     }
+    return {field: info[field] for field in product_cache.FIELDS}
+
+def sku_index_entry(node):
+    """Build a SkuIndex row from a GraphQL ProductVariant node."""
+    return SkuIndex(
+        sku=node["sku"],
+        product_id=gid_to_id(node["product"]["id"]),
+        variant_id=gid_to_id(node["id"]),
+        inventory_item_id=gid_to_id((node.get("inventoryItem") or {}).get("id")),
+    )
+
+def fetch_product_info_graphql(sku):
+    """
+    Fetch product, variant, cost and inventory for SKU in a single GraphQL
+    request instead of the catalog lookup plus two REST calls.
+    """
+    data = run_graphql(PRODUCT_BY_SKU_QUERY, {"query": sku_search_term(sku)})
+    for edge in data["productVariants"]["edges"]:
+        # The search matches loosely; only an exact SKU counts
+        if edge["node"]["sku"] == sku:
+            write_sku_index({sku: sku_index_entry(edge["node"])})
+            return product_info_from_variant_node(edge["node"])
+    raise Exception(f"Could not find product with SKU '{sku}'")
+
+PRODUCTS_BY_VARIANT_IDS_QUERY = '''
+query productsByVariantIds($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on ProductVariant { %s }
+  }
+}
+''' % PRODUCT_VARIANT_FIELDS
+
+PRODUCTS_BY_SKUS_QUERY = '''
+query productsBySkus($query: String!, $first: Int!) {
+  productVariants(first: $first, query: $query) {
+    edges { node { %s } }
+  }
+}
+''' % PRODUCT_VARIANT_FIELDS
+
+# SKUs per batched request; keeps each query well under Shopify's 1,000 point cost limit
+SKU_BATCH_SIZE = 25
+BATCH_GRAPHQL_COST = 600
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def fetch_product_infos_graphql(skus):
+    """
+    Fetch product info for many SKUs in batched GraphQL requests. SKUs already
+    in the SKU index are fetched by variant id with `nodes(ids:)`; the rest, and
+    any stale index hits, are searched for with OR'd `sku:` queries.
+    Returns {sku: info} for the SKUs that were found.
+    """
+    results = {}
+    pending = set(skus)
+    found_entries = {}
+
+    indexed = SkuIndex.objects.filter(sku__in=pending).values_list("variant_id", flat=True)
+    for batch in chunked(indexed.iterator(), SKU_BATCH_SIZE):
+        ids = [f"gid://shopify/ProductVariant/{variant_id}" for variant_id in batch]
+        for node in run_graphql(PRODUCTS_BY_VARIANT_IDS_QUERY, {"ids": ids}, cost=BATCH_GRAPHQL_COST)["nodes"]:
+            if node and node.get("sku") in pending:
+                results[node["sku"]] = product_info_from_variant_node(node)
+                pending.discard(node["sku"])
+
+    for batch in chunked(sorted(pending), SKU_BATCH_SIZE):
+        query = " OR ".join(sku_search_term(sku) for sku in batch)
+        first = SKU_BATCH_SIZE * 2
+        edges = run_graphql(
+            PRODUCTS_BY_SKUS_QUERY, {"query": query, "first": first}, cost=BATCH_GRAPHQL_COST
+        )["productVariants"]["edges"]
+        for edge in edges:
+            node = edge["node"]
+            if node["sku"] in pending:
+                results[node["sku"]] = product_info_from_variant_node(node)
+                found_entries[node["sku"]] = sku_index_entry(node)
+                pending.discard(node["sku"])
+        if len(edges) == first:
+            # Loose matches may have crowded out exact ones; look those up one by one
+            for sku in [sku for sku in batch if sku in pending]:
+                try:
+                    results[sku] = fetch_product_info_graphql(sku)
+                except Exception:
+                    continue
+                pending.discard(sku)
+
+    write_sku_index(found_entries)
+    return results
+
+def get_product_info_by_skus(skus, use_cache=True):
+    """
+    Return {sku: info} for many SKUs, with None for SKUs that do not exist.
+    Cached SKUs are served from the cache; the rest are fetched in batches.
+    """
+    skus = list(dict.fromkeys(sku for sku in skus if sku))
+    results = {}
+    if use_cache:
+        for sku, (cached, missing) in product_cache.get_cached_many(skus).items():
+            if not missing:
+                results[sku] = {field: cached.get(field) for field in product_cache.FIELDS}
+        product_cache.record("hit", len(results))
+        product_cache.record("miss", len(skus) - len(results))
+
+    fetched = fetch_product_infos_graphql([sku for sku in skus if sku not in results])
+    for sku, info in fetched.items():
+        product_cache.store(sku, info)
+    results.update(fetched)
+    return {sku: results.get(sku) for sku in skus}
+
+def get_product_info_by_sku(sku, api=None, use_cache=True):
+    """
+    Return product info for SKU. `api` picks the fetch path ("graphql" or "rest",
+    defaulting to settings.PRODUCT_INFO_API); `use_cache=False` always fetches.
+    """
+    api = api or settings.PRODUCT_INFO_API
+    fetch = fetch_product_info_graphql if api == "graphql" else fetch_product_info
+    if not use_cache:
+        result = fetch(sku)
+        product_cache.store(sku, result)
+        return result
+
+    cached, missing = product_cache.get_cached(sku)
+    if not missing:
+        product_cache.record("hit")
+        return {field: cached.get(field) for field in product_cache.FIELDS}
+
+    if missing == {"inventory"}:
+        # Only the short-lived inventory group expired; refresh just that
+        entry = SkuIndex.objects.filter(sku=sku).first()
+        if entry and entry.inventory_item_id:
+            product_cache.record("partial")
+            cached["available"] = fetch_available(entry.inventory_item_id)
+            product_cache.store(sku, {"available": cached["available"]})
+            return {field: cached.get(field) for field in product_cache.FIELDS}
+
+    product_cache.record("miss")
+    result = fetch(sku)
+    product_cache.store(sku, result)
     return result
 
-def update_product_by_sku(sku, update_fields):
+PRODUCT_UPDATE_FIELDS = {
+    "title": "title",
+    "product_type": "productType",
+    "vendor": "vendor",
+    "tags": "tags",
+    "body_html": "descriptionHtml",
+}
+
+INVENTORY_LOCATION_QUERY = '''
+query inventoryLocation($id: ID!) {
+  inventoryItem(id: $id) {
+    inventoryLevels(first: 1) { edges { node { location { id } } } }
+  }
+}
+'''
+
+# Mutations in one document run one after another, so the variant update sees
+# the product update and its returned node carries the product's new state.
+PRODUCT_UPDATE_MUTATION = '''
+  productUpdate(input: $product) {
+    userErrors { field message }
+  }
+'''
+
+VARIANT_UPDATE_MUTATION = '''
+  productVariantsBulkUpdate(productId: $productId, variants: [$variant]) {
+    productVariants { %s }
+    userErrors { field message }
+  }
+''' % PRODUCT_VARIANT_FIELDS
+
+INVENTORY_SET_MUTATION = '''
+  inventorySetQuantities(input: $quantities) {
+    inventoryAdjustmentGroup { changes { name quantityAfterChange } }
+    userErrors { field message }
+  }
+'''
+
+UPDATE_GRAPHQL_COST = 100
+
+def resolve_variant_ids(sku, need_location=False, use_index=True):
+    """
+    Return (product_id, variant_id, inventory_item_id, location_id) for SKU, or
+    None if it doesn't exist. Uses the SKU index and catalog mirror when they
+    have the ids, and a single lookup query when they don't or `use_index`
+    is off; the query's result is written back to the index.
+    location_id is only looked up when `need_location` is set.
+    """
+    entry = SkuIndex.objects.filter(sku=sku).first() if use_index else None
+    if not entry or not entry.inventory_item_id:
+        data = run_graphql(PRODUCT_BY_SKU_QUERY, {"query": sku_search_term(sku)})
+        node = next((e["node"] for e in data["productVariants"]["edges"] if e["node"]["sku"] == sku), None)
+        if node is None:
+            SkuIndex.objects.filter(sku=sku).delete()
+            return None
+        entry = sku_index_entry(node)
+        write_sku_index({sku: entry})
+        levels = node["inventoryItem"]["inventoryLevels"]["edges"]
+        location_id = gid_to_id(levels[0]["node"]["location"]["id"]) if levels else None
+        return entry.product_id, entry.variant_id, entry.inventory_item_id, location_id
+
+    location_id = None
+    if need_location:
+        location_id = (
+            CatalogInventoryLevel.objects.filter(inventory_item_id=entry.inventory_item_id)
+            .values_list("location_id", flat=True).first()
+        )
+        if location_id is None:
+            data = run_graphql(INVENTORY_LOCATION_QUERY, {"id": f"gid://shopify/InventoryItem/{entry.inventory_item_id}"})
+            levels = ((data.get("inventoryItem") or {}).get("inventoryLevels") or {}).get("edges", [])
+            location_id = gid_to_id(levels[0]["node"]["location"]["id"]) if levels else None
+    return entry.product_id, entry.variant_id, entry.inventory_item_id, location_id
+
+def plan_product_update(ids, update_fields):
+    """
+    Turn update_fields into a single mutation document and its variables:
+    productUpdate for product fields, productVariantsBulkUpdate for price,
+    cost and tracking, and inventorySetQuantities for the available quantity.
+    """
+    product_id, variant_id, inventory_item_id, location_id = ids
+    product_gid = f"gid://shopify/Product/{product_id}"
+    variables = {"productId": product_gid}
+    declarations = ["$productId: ID!", "$variant: ProductVariantsBulkInput!"]
+    mutations = []
+
+    product_input = {}
+    for field, graphql_field in PRODUCT_UPDATE_FIELDS.items():
+        if field in update_fields:
+            product_input[graphql_field] = update_fields[field]
+    if "tags" in product_input and isinstance(product_input["tags"], str):
+        product_input["tags"] = [tag.strip() for tag in product_input["tags"].split(",") if tag.strip()]
+    if product_input:
+        variables["product"] = {"id": product_gid, **product_input}
+        declarations.append("$product: ProductInput!")
+        mutations.append(PRODUCT_UPDATE_MUTATION)
+
+    # Always sent, even with no variant changes, since its response is the updated product info
+    variant_input = {"id": f"gid://shopify/ProductVariant/{variant_id}"}
+    if "price" in update_fields:
+        variant_input["price"] = str(update_fields["price"])
+    if "compare_at_price" in update_fields:
+        compare_at_price = update_fields["compare_at_price"]
+        variant_input["compareAtPrice"] = str(compare_at_price) if compare_at_price not in (None, "") else None
+    inventory_item = {}
+    if "cost" in update_fields:
+        inventory_item["cost"] = str(update_fields["cost"])
+    if "available" in update_fields:
+        # Quantities can only be set on tracked inventory
+        inventory_item["tracked"] = True
+    if inventory_item:
+        variant_input["inventoryItem"] = inventory_item
+    variables["variant"] = variant_input
+    mutations.append(VARIANT_UPDATE_MUTATION)
+
+    if "available" in update_fields and location_id:
+        variables["quantities"] = {
+            "name": "available",
+            "reason": "correction",
+            "ignoreCompareQuantity": True,
+            "quantities": [{
+                "inventoryItemId": f"gid://shopify/InventoryItem/{inventory_item_id}",
+                "locationId": f"gid://shopify/Location/{location_id}",
+                "quantity": int(update_fields["available"]),
+            }],
+        }
+        declarations.append("$quantities: InventorySetQuantitiesInput!")
+        mutations.append(INVENTORY_SET_MUTATION)
+
+    query = "mutation updateProductBySku(%s) {%s}" % (", ".join(declarations), "".join(mutations))
+    return query, variables
+
+def send_product_update(ids, update_fields):
+    """Run the planned update for `ids`; returns (data, user errors)."""
+    query, variables = plan_product_update(ids, update_fields)
+    data = run_graphql(query, variables, cost=UPDATE_GRAPHQL_COST)
+    errors = [
+        f"{'.'.join(error.get('field') or [])}: {error['message']}"
+        for payload in data.values()
+        for error in (payload or {}).get("userErrors") or []
+    ]
+    return data, errors
+
+def update_product_by_sku_graphql(sku, update_fields):
+    """
+    Apply every change for SKU in one GraphQL request and build the returned
+    product info from the mutation responses, with no re-read afterwards.
+    """
+    need_location = "available" in update_fields
+    ids = resolve_variant_ids(sku, need_location=need_location)
+    if not ids:
+        return {"status": "error", "message": f"Could not find product with SKU '{sku}'"}
+
+    data, errors = send_product_update(ids, update_fields)
+    if errors:
+        # The index may point at a product or variant that is gone; look the SKU
+        # up again, which rebuilds its entry, and retry once if it moved
+        fresh = resolve_variant_ids(sku, need_location=need_location, use_index=False)
+        if not fresh:
+            return {"status": "error", "message": f"Could not find product with SKU '{sku}'"}
+        if fresh[:3] != ids[:3]:
+            ids = fresh
+            data, errors = send_product_update(ids, update_fields)
+    if errors:
+        return {"status": "error", "message": f"Failed to update product. Errors: {errors}"}
+
+    variants = data["productVariantsBulkUpdate"]["productVariants"] or []
+    if not variants:
+        return {"status": "error", "message": f"Failed to update product. No variant returned for SKU '{sku}'"}
+    info = product_info_from_variant_node(variants[0])
+    if "inventorySetQuantities" in data:
+        changes = data["inventorySetQuantities"]["inventoryAdjustmentGroup"]["changes"]
+        after = [c.get("quantityAfterChange") for c in changes if c["name"] == "available"]
+        info["available"] = after[0] if after and after[0] is not None else int(update_fields["available"])
+
+    product_cache.store(sku, info)
+    if any(field in update_fields for field in PRODUCT_UPDATE_FIELDS):
+        siblings = SkuIndex.objects.filter(product_id=ids[0]).exclude(sku=sku).values_list("sku", flat=True)
+        product_cache.invalidate(*siblings, groups=["details"])
+    return {
+        "status": "success",
+        "message": "The product was successfully updated.",
+        "updated_fields": info,
+    }
+
+def update_product_by_sku(sku, update_fields, api=None):
+    """
+    Update SKU with update_fields. `api` picks the write path ("graphql" or
+    "rest", defaulting to settings.PRODUCT_WRITE_API). The number of API calls
+    made is recorded per path and returned as `api_calls`.
+    """
+    api = api or settings.PRODUCT_WRITE_API
+    update = update_product_by_sku_graphql if api == "graphql" else update_product_by_sku_rest
+    with rate_limit.count_calls() as calls:
+        response = update(sku, update_fields)
+    api_calls = sum(calls.values())
+    rate_limit.record_operation(f"update_product_by_sku:{api}", api_calls)
+    response["api_calls"] = api_calls
+    return response
+
+def update_product_by_sku_rest(sku, update_fields):
     product, variant = find_product_by_sku(sku)
     if not product or not variant:
         return {"status": "error", "message": f"Could not find product with SKU '{sku}'"}
@@ -92,6 +629,7 @@ def update_product_by_sku(sku, update_fields):
     # Now handle inventory-related updates
     inventory_item_id = variant.inventory_item_id
     inventory_item = shopify.InventoryItem.find(inventory_item_id)
+    known = {"cost": getattr(inventory_item, 'cost', None)}
 
     # Update cost if provided
     if "cost" in update_fields:
@@ -99,6 +637,7 @@ def update_product_by_sku(sku, update_fields):
         if not inventory_item.save():
             errors = inventory_item.errors.full_messages() if inventory_item.errors else ["Unknown error"]
             return {"status": "error", "message": f"Failed to update inventory item cost. Errors: {errors}"}
+        known["cost"] = inventory_item.cost
 
     # Update available quantity if provided
     if "available" in update_fields:
@@ -126,14 +665,113 @@ def update_product_by_sku(sku, update_fields):
             shopify.InventoryLevel.set(inventory_item_id=inventory_item_id,
                                        location_id=location_id,
                                        available=new_available)
+            known["available"] = new_available
 
+    write_through(product, variant, product_info_from(product, variant, **known))
     return {
         "status": "success",
         "message": "The product was successfully updated.",
         "updated_fields": get_product_info_by_sku(sku)
     }
 
-def create_product_with_sku(sku, **fields):
+LOCATIONS_QUERY = '''
+query defaultLocation {
+  locations(first: 1) { edges { node { id } } }
+}
+'''
+
+PRODUCT_SET_MUTATION = '''
+mutation createProductWithSku($input: ProductSetInput!) {
+  productSet(input: $input, synchronous: true) {
+    product {
+      variants(first: 1) { edges { node { %s } } }
+    }
+    userErrors { field message }
+  }
+}
+''' % PRODUCT_VARIANT_FIELDS
+
+CREATE_GRAPHQL_COST = 100
+
+def default_location_id():
+    """The store's first location, where new products get their initial quantity. Cached for a day."""
+    location_id = cache.get("shopify:default-location")
+    if location_id is None:
+        edges = run_graphql(LOCATIONS_QUERY)["locations"]["edges"]
+        location_id = gid_to_id(edges[0]["node"]["id"]) if edges else None
+        if location_id:
+            cache.set("shopify:default-location", location_id, timeout=24 * 60 * 60)
+    return location_id
+
+def create_product_with_sku_graphql(sku, **fields):
+    """
+    Create a single-variant product with price, cost, tracking and initial
+    quantity in one `productSet` mutation, and build its product info from
+    the response rather than looking the new product up again.
+    """
+    product_input = {"title": fields.get("title") or "New Product"}
+    for field, graphql_field in PRODUCT_UPDATE_FIELDS.items():
+        if field != "title" and fields.get(field):
+            product_input[graphql_field] = fields[field]
+    if isinstance(product_input.get("tags"), str):
+        product_input["tags"] = [tag.strip() for tag in product_input["tags"].split(",") if tag.strip()]
+
+    inventory_item = {"sku": sku, "tracked": True}
+    if fields.get("cost") not in (None, ""):
+        inventory_item["cost"] = str(fields["cost"])
+    variant_input = {
+        "optionValues": [{"optionName": "Title", "name": "Default Title"}],
+        "price": str(fields.get("price") or "0.00"),
+        "inventoryItem": inventory_item,
+    }
+    if fields.get("compare_at_price"):
+        variant_input["compareAtPrice"] = str(fields["compare_at_price"])
+    available = fields.get("available")
+    if available not in (None, ""):
+        location_id = default_location_id()
+        if location_id:
+            variant_input["inventoryQuantities"] = [{
+                "locationId": f"gid://shopify/Location/{location_id}",
+                "name": "available",
+                "quantity": int(available),
+            }]
+    product_input["productOptions"] = [{"name": "Title", "values": [{"name": "Default Title"}]}]
+    product_input["variants"] = [variant_input]
+
+    data = run_graphql(PRODUCT_SET_MUTATION, {"input": product_input}, cost=CREATE_GRAPHQL_COST)["productSet"]
+    if data["userErrors"]:
+        errors = [f"{'.'.join(e.get('field') or [])}: {e['message']}" for e in data["userErrors"]]
+        return {"status": "error", "message": f"Failed to create product. Errors: {errors}"}
+
+    node = data["product"]["variants"]["edges"][0]["node"]
+    write_sku_index({sku: sku_index_entry(node)})
+    product_info = product_info_from_variant_node(node)
+    product_cache.store(sku, product_info)
+    return {
+        "status": "success",
+        "message": "The product was successfully created.",
+        "product_info": product_info
+    }
+
+def create_product_with_sku(sku, api=None, **fields):
+    """
+    Create a product with a single variant for SKU. `api` picks the write path
+    ("graphql" or "rest", defaulting to settings.PRODUCT_WRITE_API). The number
+    of API calls made is recorded per path and returned as `api_calls`.
+    """
+    if not sku:
+        return {"status": "error", "message": "SKU is required"}
+
+    api = api or settings.PRODUCT_WRITE_API
+    create = create_product_with_sku_graphql if api == "graphql" else create_product_with_sku_rest
+    with rate_limit.count_calls() as calls:
+        response = create(sku, **fields)
+    api_calls = sum(calls.values())
+    rate_limit.record_operation(f"create_product_with_sku:{api}", api_calls)
+    response["api_calls"] = api_calls
+    return response
+
+def create_product_with_sku_rest(sku, **fields):
     if not sku:
         return {"status": "error", "message": "SKU is required"}
 
@@ -173,9 +811,11 @@ def create_product_with_sku(sku, **fields):
         errors = new_product.errors.full_messages() if new_product.errors else ["Unknown error"]
         return {"status": "error", "message": f"Failed to create product. Errors: {errors}"}
 
-    # Product and variant created successfully. Retrieve them
-    created_product, created_variant = find_product_by_sku(sku)
-    if not created_product or not created_variant:
+    # Product and variant created successfully. Index them and use the saved objects directly
+    index_products([new_product])
+    created_product = new_product
+    created_variant = next((v for v in new_product.variants if v.sku == sku), None)
+    if not created_variant:
         return {"status": "error", "message": "Product was created but could not be retrieved by SKU."}
 
     inventory_item_id = created_variant.inventory_item_id
@@ -193,6 +833,7 @@ def create_product_with_sku(sku, **fields):
         if not inventory_item.save():
             errors = inventory_item.errors.full_messages() if inventory_item.errors else ["Unknown error"]
             return {"status": "error", "message": f"Product created, but failed to update cost. Errors: {errors}"}
+    known = {"cost": getattr(inventory_item, 'cost', None)}
 
     # Update available quantity if provided
     if available is not None:
@@ -207,8 +848,11 @@ def create_product_with_sku(sku, **fields):
                 location_id=location_id,
                 available=new_available
             )
+            known["available"] = new_available
 
-    product_info = get_product_info_by_sku(sku)
+    product_info = product_info_from(created_product, created_variant, **known)
+    write_through(created_product, created_variant, product_info)
+    product_info = {field: product_info.get(field) for field in product_cache.FIELDS}
     return {
         "status": "success",
         "message": "The product was successfully created.",
@@ -239,6 +883,7 @@ def put_product_on_sale(sku, sale_price, regular_price, tags_to_add=["on-sale"])
         errors = product.errors.full_messages() if product.errors else ["Unknown error"]
         raise Exception(f"Failed to update product tags. Errors: {errors}")
 
+    write_through(product, variant, product_info_from(product, variant))
     return {"status": "success", "message": f"Product with SKU '{sku}' put on sale."}
 
 def take_product_off_sale(sku, tags_to_remove=["on-sale"]):
@@ -264,6 +909,7 @@ def take_product_off_sale(sku, tags_to_remove=["on-sale"]):
         errors = product.errors.full_messages() if product.errors else ["Unknown error"]
         raise Exception(f"Failed to update product tags. Errors: {errors}")
 
+    write_through(product, variant, product_info_from(product, variant))
     return {"status": "success", "message": f"Product with SKU '{sku}' taken off sale."}
 
 def disable_product_by_sku(sku):
@@ -287,149 +933,213 @@ def disable_product_by_sku(sku):
         errors = product.errors.full_messages() if product.errors else ["Unknown error"]
         return {"status": "error", "message": f"Failed to disable product. Errors: {errors}"}
 
+    write_through(product, variant, product_info_from(product, variant))
     return {
         "status": "success",
         "message": "The product was successfully disabled.",
         "updated_fields": get_product_info_by_sku(sku)
     }
 
-def send_email(recipient, subject, body):
-    mailgun_domain = config("MAILGUN_DOMAIN")
-    mailgun_api_key = config("MAILGUN_API_KEY")
-    from_email = config("FROM_EMAIL")
+def normalized_value(field, value):
+    """Normalize a field value so CSV text and Shopify values compare equal when they mean the same thing."""
+    if value is None or str(value).strip() == "":
+        return None
+    if field in ("price", "compare_at_price", "cost"):
+        try:
+            return Decimal(str(value).strip())
+        except InvalidOperation:
+            return str(value).strip()
+    if field == "available":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return str(value).strip()
+    if field == "tags":
+        return sorted(tag.strip() for tag in str(value).split(",") if tag.strip())
+    return str(value).strip()
+
+
+def changed_fields(current_info, update_fields):
+    """
+    Return the subset of `update_fields` that differs from `current_info`
+    (a product info dict). Without current info, every field counts as changed.
+    """
+    if not current_info:
+        return dict(update_fields)
+    return {
+        field: value for field, value in update_fields.items()
+        if normalized_value(field, value) != normalized_value(field, current_info.get(field))
+    }
 
-    try:
-        print(f"Sending email to: {recipient}, Subject: {subject}, Body: {body}")
-        response = requests.post(
-            f"https://api.mailgun.net/v3/{mailgun_domain}/messages",
-            auth=("api", mailgun_api_key),
-            data={"from": from_email, "to": recipient, "subject": subject, "text": body},
-        )
-        response.raise_for_status()
-        return {"status": "success", "details": response.json()}
-    except requests.exceptions.RequestException as e:
-        return {"status": "error", "details": str(e)}
-
-def create_products_from_csv(filename):
-    if not os.path.exists(filename):
-        return {"status": "error", "message": f"File '{filename}' not found."}
-
-    results = []
-    with open(filename, mode='r', encoding='utf-8-sig') as csvfile:
-        reader = csv.DictReader(csvfile)
-
-        if 'sku' not in reader.fieldnames:
-            return {"status": "error", "message": "CSV must contain a 'sku' column."}
-
-        for row in reader:
-            sku = row.get('sku', '').strip()
-            if not sku:
-                results.append({"sku": None, "response": {"status": "error", "message": "No SKU provided"}})
-                continue
 
-            response = create_product_with_sku(
-                sku=sku,
-                title=row.get('title'),
-                product_type=row.get('product_type'),
-                vendor=row.get('vendor'),
-                tags=row.get('tags'),
-                body_html=row.get('body_html'),
-                price=row.get('price'),
-                compare_at_price=row.get('compare_at_price'),
-                cost=row.get('cost'),
-                available=row.get('available')
-            )
-            results.append({"sku": sku, "response": response})
-
-    # Transform 'results' into a user-friendly summary
-    created_products = []
-    error_messages = []
-
-    for r in results:
-        resp = r["response"]
-        if resp.get("status") == "success":
-            # resp["product_info"] holds details about the created product
-            product_info = resp.get("product_info", {})
-            created_products.append({
-                "sku": product_info.get("sku", r["sku"]),
-                "title": product_info.get("title", "Unknown Title")
-            })
-        else:
-            error_messages.append(f"SKU {r['sku']}: {resp.get('message', 'Unknown error')}")
+def run_in_threads(func, items):
+    """
+    Run `func(sku, fields)` for every (sku, fields) item on up to
+    SHOPIFY_ASYNC_CONCURRENCY threads. Results come back in input order; an
+    exception becomes an error response for its item, as with the async client.
+    """
+    def run(item):
+        try:
+            return func(*item)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        finally:
+            # Each thread opens its own database connection
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=settings.SHOPIFY_ASYNC_CONCURRENCY) as executor:
+        # Each call runs in a copy of this context, so API calls are still counted
+        futures = [executor.submit(contextvars.copy_context().run, run, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def run_csv_rows(operation_name, results, func):
+    """
+    Fill in the response for every CSV row that is still waiting for one.
+    With SHOPIFY_ASYNC_CONCURRENCY above 1 the rows run concurrently: on
+    threads through `func(sku, fields)` when PRODUCT_WRITE_API is "graphql",
+    so each update is one coalesced mutation and each create one
+    `productSet`, and otherwise on the async REST client. With 1 they go one
+    at a time through `func`.
+    """
+    pending = [r for r in results if r["response"] is None]
+    items = [(r["sku"], r["fields"]) for r in pending]
+    concurrent = settings.SHOPIFY_ASYNC_CONCURRENCY > 1 and len(pending) > 1
+    if concurrent and settings.PRODUCT_WRITE_API == "graphql":
+        responses = run_in_threads(func, items)
+    elif concurrent:
+        # Imported here because async_shopify imports this module
+        from .async_shopify import run_concurrently
+        responses = run_concurrently(operation_name, items)
+    else:
+        responses = [func(*item) for item in items]
+    for r, response in zip(pending, responses):
+        r["response"] = response
+
+
+def csv_chunks(filename):
+    """
+    Yield the CSV's rows CSV_CHUNK_SIZE at a time as result dicts, with a
+    response already filled in for rows that failed validation.
+    """
+    for chunk in chunked(csv_pipeline.iter_items(filename), settings.CSV_CHUNK_SIZE):
+        yield [
+            {
+                "row": item.row,
+                "sku": item.sku,
+                "fields": item.fields,
+                "response": {"status": "error", "message": item.error} if item.error else None,
+            }
+            for item in chunk
+        ]
+
 
-    if created_products:
+def upload_results_path(filename, action):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return csv_pipeline.results_path(f"{name}-{action}-{timezone.now():%Y%m%d%H%M%S}")
+
+
+def create_products_from_csv(filename, progress=None):
+    """
+    Create a product for every CSV row. `progress(done, failed)`, if given,
+    is called after each chunk with the number of rows finished in it.
+    """
+    try:
+        csv_pipeline.read_header(filename)
+    except csv_pipeline.CsvFormatError as e:
+        return {"status": "error", "message": str(e)}
+
+    # Rows are streamed through in chunks; only counts and a short list stay in memory
+    with csv_pipeline.ResultsWriter(upload_results_path(filename, "create")) as results:
+        for chunk in csv_chunks(filename):
+            run_csv_rows("create_product_with_sku", chunk, lambda sku, fields: create_product_with_sku(sku=sku, **fields))
+            for r in chunk:
+                # resp["product_info"] holds details about the created product
+                product_info = r["response"].get("product_info") or {}
+                results.write(r["row"], r["sku"], r["response"], listed={
+                    "sku": product_info.get("sku", r["sku"]),
+                    "title": product_info.get("title", "Unknown Title")
+                })
+            if progress:
+                progress(len(chunk), sum(1 for r in chunk if r["response"].get("status") == "error"))
+
+    summary = results.summary()
+    if summary["success"]:
         return {
             "status": "success",
             "message": "Products processed from CSV.",
-            "created_products": created_products,
-            "errors": error_messages
+            "created_count": summary["success"],
+            "created_products": results.listed,
+            "errors": summary["errors"],
+            "error_count": summary["error"],
+            "results_file": summary["results_path"],
         }
     else:
         return {
             "status": "error",
             "message": "No products were successfully created.",
-            "errors": error_messages
+            "errors": summary["errors"],
+            "error_count": summary["error"],
+            "results_file": summary["results_path"],
         }
 
 
-def update_products_from_csv(filename):
-    if not os.path.exists(filename):
-        return {"status": "error", "message": f"File '{filename}' not found."}
-
-    results = []
-    with open(filename, mode='r', encoding='utf-8-sig') as csvfile:
-        reader = csv.DictReader(csvfile)
-
-        if 'sku' not in reader.fieldnames:
-            return {"status": "error", "message": "CSV must contain a 'sku' column."}
-
-        for row in reader:
-            sku = row.get('sku', '').strip()
-            if not sku:
-                results.append({"sku": None, "response": {"status": "error", "message": "No SKU provided"}})
-                continue
-
-            update_fields = {}
-            for field in ["title", "product_type", "vendor", "tags", "body_html", "price", "compare_at_price", "cost"]:
-                if row.get(field):
-                    update_fields[field] = row.get(field)
-
-            if row.get('available'):
-                try:
-                    update_fields['available'] = int(row.get('available'))
-                except ValueError:
-                    pass
-
-            response = update_product_by_sku(sku, update_fields)
-            results.append({"sku": sku, "response": response})
-
-    # Transform 'results' into a user-friendly summary
-    updated_products = []
-    error_messages = []
-
-    for r in results:
-        resp = r["response"]
-        if resp.get("status") == "success":
-            updated_fields = resp.get("updated_fields", {})
-            updated_products.append({
-                "sku": updated_fields.get("sku", r["sku"]),
-                "title": updated_fields.get("title", "Unknown Title")
-            })
-        else:
-            error_messages.append(f"SKU {r['sku']}: {resp.get('message', 'Unknown error')}")
-
-    if updated_products:
+def update_products_from_csv(filename, progress=None):
+    """
+    Update products by SKU from the CSV rows, sending only changed fields.
+    `progress` works as in `create_products_from_csv`.
+    """
+    try:
+        csv_pipeline.read_header(filename)
+    except csv_pipeline.CsvFormatError as e:
+        return {"status": "error", "message": str(e)}
+
+    with csv_pipeline.ResultsWriter(upload_results_path(filename, "update")) as results:
+        for chunk in csv_chunks(filename):
+            # Only send what differs from the current product info, read fresh so a stale
+            # cache entry can't make a needed change look done; skip rows with no changes
+            try:
+                current = get_product_info_by_skus([r["sku"] for r in chunk if r["response"] is None], use_cache=False)
+            except Exception as e:
+                print(f"Could not look up current product info, updating every row: {e}")
+                current = {}
+            for r in chunk:
+                if r["response"] is not None:
+                    continue
+                r["fields"] = changed_fields(current.get(r["sku"]), r["fields"])
+                if current.get(r["sku"]) and not r["fields"]:
+                    r["response"] = {"status": "unchanged", "message": "Already up to date."}
+
+            run_csv_rows("update_product_by_sku", chunk, update_product_by_sku)
+            for r in chunk:
+                updated_fields = r["response"].get("updated_fields") or {}
+                results.write(r["row"], r["sku"], r["response"], listed={
+                    "sku": updated_fields.get("sku", r["sku"]),
+                    "title": updated_fields.get("title", "Unknown Title")
+                })
+            if progress:
+                progress(len(chunk), sum(1 for r in chunk if r["response"].get("status") == "error"))
+
+    summary = results.summary()
+    if summary["success"] or summary["unchanged"]:
         return {
             "status": "success",
             "message": "Products updated from CSV.",
-            "updated_products": updated_products,
-            "errors": error_messages
+            "updated_count": summary["success"],
+            "updated_products": results.listed,
+            "unchanged": summary["unchanged"],
+            "errors": summary["errors"],
+            "error_count": summary["error"],
+            "results_file": summary["results_path"],
         }
     else:
         return {
             "status": "error",
             "message": "No products were successfully updated.",
-            "errors": error_messages
+            "unchanged": summary["unchanged"],
+            "errors": summary["errors"],
+            "error_count": summary["error"],
+            "results_file": summary["results_path"],
         }
 
 tools = [
@@ -437,15 +1147,15 @@ tools = [
         "type": "function",
         "function": {
             "name": "send_email",
-            "description": "Send an email to a recipient",
+            "description": "Send an email to one or more recipients",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "recipient": {"type": "string"},
+                    "recipients": {"type": "array", "items": {"type": "string"}},
                     "subject": {"type": "string"},
                     "body": {"type": "string"},
                 },
-                "required": ["recipient", "subject", "body"],
+                "required": ["recipients", "subject", "body"],
             },
         }
     },
@@ -592,89 +1302,3 @@ tools = [
         }
     },
 ]
-
-if __name__ == "__main__":
-    while True:
-        user_input = input(":")
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant for the music store All You Need Music. You can send emails, retrieve product information by SKU, create products, update products, and process CSV files."},
-            {"role": "user", "content": user_input},
-        ]
-
-        completion = client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=messages,
-            tools=tools,
-        )
-
-        message = completion.choices[0].message
-
-        if message.tool_calls:
-            for tool_call in message.tool_calls:
-                tool_name = tool_call.function.name
-                args = eval(tool_call.function.arguments)
-
-                if tool_name == "send_email":
-                    response = send_email(args["recipient"], args["subject"], args["body"])
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-
-                elif tool_name == "get_product_info_by_sku":
-                    response = get_product_info_by_sku(args["sku"])
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-                    messages.append({"role": "system", "content": "Please summarize the product information requested above for the user in a helpful manner."})
-                    followup_completion = client.chat.completions.create(model='gpt-4o-mini', messages=messages, tools=tools)
-                    final_message = followup_completion.choices[0].message
-                    print(final_message.content)
-
-                elif tool_name == "update_product_by_sku":
-                    update_fields = {k: v for k, v in args.items() if k != "sku"}
-                    response = update_product_by_sku(args["sku"], update_fields)
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-                    messages.append({"role": "system", "content": "The update has been processed. Provide a confirmation message to the user."})
-                    followup_completion = client.chat.completions.create(model='gpt-4o-mini', messages=messages, tools=tools)
-                    final_message = followup_completion.choices[0].message
-                    print(final_message.content)
-
-                elif tool_name == "create_product_with_sku":
-                    create_fields = {k: v for k, v in args.items() if k != "sku"}
-                    response = create_product_with_sku(args["sku"], **create_fields)
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-                    messages.append({"role": "system", "content": "The product has been created. Provide a confirmation message to the user."})
-                    followup_completion = client.chat.completions.create(model='gpt-4o-mini', messages=messages, tools=tools)
-                    final_message = followup_completion.choices[0].message
-                    print(final_message.content)
-
-                elif tool_name == "put_product_on_sale":
-                    response = put_product_on_sale(args["sku"], args["sale_price"], args["regular_price"], args.get("tags_to_add", ["on-sale"]))
-                    print(f"Tool response: {response}")
-
-                elif tool_name == "take_product_off_sale":
-                    response = take_product_off_sale(args["sku"], args.get("tags_to_remove", ["on-sale"]))
-                    print(f"Tool response: {response}")
-
-                elif tool_name == "disable_product_by_sku":
-                    response = disable_product_by_sku(args["sku"])
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-                    messages.append({"role": "system", "content": "The product has been disabled. Provide a confirmation message to the user."})
-                    followup_completion = client.chat.completions.create(model='gpt-4o-mini', messages=messages, tools=tools)
-                    final_message = followup_completion.choices[0].message
-                    print(final_message.content)
-
-                elif tool_name == "create_products_from_csv":
-                    response = create_products_from_csv(args["filename"])
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-                    messages.append({"role": "system", "content": "The products have been processed from the CSV. Provide a summary to the user."})
-                    followup_completion = client.chat.completions.create(model='gpt-4o-mini', messages=messages, tools=tools)
-                    final_message = followup_completion.choices[0].message
-                    print(final_message.content)
-
-                elif tool_name == "update_products_from_csv":
-                    response = update_products_from_csv(args["filename"])
-                    messages.append({"role": "function", "name": tool_name, "content": json.dumps(response)})
-                    messages.append({"role": "system", "content": "The products have been updated from the CSV. Provide a summary to the user."})
-                    followup_completion = client.chat.completions.create(model='gpt-4o-mini', messages=messages, tools=tools)
-                    final_message = followup_completion.choices[0].message
-                    print(final_message.content)
-
-        else:
-            print(message.content)
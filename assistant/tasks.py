@@ -1,182 +1,548 @@
 # assistant/tasks.py
-import os, csv, time, random
-from celery import shared_task
+import os, uuid
+from collections import Counter
+from celery import chord, shared_task
 from django.db import transaction
 from django.conf import settings
+from django.utils import timezone
 
-from .models import ProductSnapshot
-from .shopify_chat_cli import update_product_by_sku, get_product_info_by_sku
-from .views import send_email
-
-
-def get_skus_and_fields(csv_path):
-    """
-    Return a list of (sku, fields_dict) from the CSV,
-    where fields_dict is all relevant fields for update.
-    e.g. [("SKU123", {"price": "19.99", "available": 5}), ...]
-    """
-    items = []
-    with open(csv_path, mode='r', encoding='utf-8-sig') as csvfile:
-        reader = csv.DictReader(csvfile)
-        if 'sku' not in reader.fieldnames:
-            return items
-
-        for row in reader:
-            sku = row.get('sku', '').strip()
-            if not sku:
-                continue
-            # Gather other fields if they exist in the CSV
-            # e.g. price, compare_at_price, etc.
-            fields_dict = {}
-            if 'price' in reader.fieldnames and row['price']:
-                fields_dict['price'] = row['price'].strip()
-            if 'compare_at_price' in reader.fieldnames and row['compare_at_price']:
-                fields_dict['compare_at_price'] = row['compare_at_price'].strip()
-            if 'available' in reader.fieldnames and row['available']:
-                # Convert to int
-                fields_dict['available'] = int(row['available'].strip())
-            if 'title' in reader.fieldnames and row['title']:
-                fields_dict['title'] = row['title'].strip()
-            if 'vendor' in reader.fieldnames and row['vendor']:
-                fields_dict['vendor'] = row['vendor'].strip()
-            if 'product_type' in reader.fieldnames and row['product_type']:
-                fields_dict['product_type'] = row['product_type'].strip()
-            if 'tags' in reader.fieldnames:
-                raw_tags = row.get('tags', '').strip()  # row['tags'] might be "", "nan", or something
-                if raw_tags.lower() not in ('nan', ''):
-                    fields_dict['tags'] = raw_tags
-            if 'body_html' in reader.fieldnames and row['body_html']:
-                fields_dict['body_html'] = row['body_html'].strip()
-            if 'cost' in reader.fieldnames and row['cost']:
-                fields_dict['cost'] = row['cost'].strip()
-
-            items.append((sku, fields_dict))
-    return items
-
-
-class ShopifyRateLimitError(Exception):
-    """Custom exception to handle 429 from Shopify.""" 
-    def __init__(self, retry_after=2.0, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.retry_after = retry_after
+from .models import BatchJob, BatchRow, ProductSnapshot, SaleCampaign
+from .retry import retry_call
+from .shopify_chat_cli import (
+    update_product_by_sku,
+    get_product_info_by_skus,
+    changed_fields,
+    chunked,
+    run_in_threads,
+    create_products_from_csv,
+    update_products_from_csv,
+)
+from .async_shopify import run_concurrently
+from .catalog_mirror import sync_catalog_mirror, first_delivery, forget_delivery, WEBHOOK_HANDLERS
+from .campaigns import apply_campaign, revert_campaign
+from . import job_progress
+from .csv_pipeline import (
+    MAX_REPORTED_ERRORS,
+    CsvFormatError,
+    ResultsWriter,
+    count_rows,
+    iter_items,
+    merge_results,
+    part_path,
+    part_paths,
+    results_path,
+)
+from .chat_tools import send_email
 
 
 def safe_shopify_call(func, *args, **kwargs):
     """
-    Wrapper that calls a Shopify function, catching 429 errors,
-    sleeping for retry-after, and retrying up to a few times.
+    Call a Shopify function that only reads, retrying 429s, 5xx responses
+    and dropped connections with jittered exponential backoff (honoring
+    Retry-After) for up to settings.SHOPIFY_RETRY_TASK_DEADLINE seconds.
     """
-    MAX_RETRIES = 6
-    attempt = 0
+    return retry_call(func, args, kwargs, deadline=settings.SHOPIFY_RETRY_TASK_DEADLINE)
 
-    while attempt < MAX_RETRIES:
-        try:
-            return func(*args, **kwargs)
-        except ShopifyRateLimitError as e:
-            # Sleep for the recommended time + small random offset
-            delay = e.retry_after + random.uniform(0.2, 0.5)
-            print(f"[RateLimit] 429 received. Sleeping {delay:.2f}s then retrying...")
-            time.sleep(delay)
-            attempt += 1
-        except Exception as ex:
-            # If some other error, decide how to handle it; for demonstration
-            # we just re-raise. You might do your own logging, etc.
-            print(f"[Error] {ex}")
-            raise
 
-    raise Exception("Too many 429s or errors, giving up after retries.")
+def safe_shopify_write(func, *args, **kwargs):
+    """
+    Call a Shopify function that writes. Its requests already retry on their
+    own, so this only tries again when it still ends throttled, which means
+    Shopify didn't process the failing request; a 5xx or dropped connection
+    might have come after a write went through, so it is raised instead.
+    """
+    return retry_call(func, args, kwargs, idempotent=False, deadline=settings.SHOPIFY_RETRY_TASK_DEADLINE)
 
 
-@shared_task
+def snapshot_from(batch_id, sku, product_info):
+    return ProductSnapshot(
+        batch_id=batch_id,
+        sku=sku,
+        title=product_info.get('title'),
+        product_type=product_info.get('product_type'),
+        vendor=product_info.get('vendor'),
+        tags=product_info.get('tags'),
+        body_html=product_info.get('body_html'),
+        price=product_info.get('price'),
+        compare_at_price=product_info.get('compare_at_price'),
+        cost=product_info.get('cost'),
+        available=product_info.get('available')
+    )
+
+
+def batch_results_path(batch_id, action):
+    return results_path(f"{batch_id}-{action}")
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
 def apply_csv_updates(csv_path, batch_id=None):
     """
-    For each SKU in the CSV:
-      1. GET product info, store snapshot.
-      2. Sleep ~0.5–0.7s.
-      3. Perform the product update from CSV fields.
-      4. Sleep ~0.5–0.7s.
-    """
-    items = get_skus_and_fields(csv_path)
-
-    for sku, fields_dict in items:
-        # 1) Get and snapshot
-        try:
-            product_info = safe_shopify_call(get_product_info_by_sku, sku)
-            ProductSnapshot.objects.create(
-                batch_id=batch_id,
-                sku=sku,
-                title=product_info.get('title'),
-                product_type=product_info.get('product_type'),
-                vendor=product_info.get('vendor'),
-                tags=product_info.get('tags'),
-                body_html=product_info.get('body_html'),
-                price=product_info.get('price'),
-                compare_at_price=product_info.get('compare_at_price'),
-                cost=product_info.get('cost'),
-                available=product_info.get('available')
-            )
-        except Exception as e:
-            print(f"Failed to store snapshot for SKU {sku}: {e}")
-            # Decide if you want to continue or break. We'll continue.
-
-        # 2) Sleep 0.5–0.7s
-        time.sleep(random.uniform(0.5, 0.7))
-
-        # 3) Update product
-        try:
-            if fields_dict:
-                update_response = safe_shopify_call(update_product_by_sku, sku, fields_dict)
-                print(f"Updated {sku}: {update_response}")
-        except Exception as e:
-            print(f"Failed to update {sku}: {e}")
-            # continue or break, your choice. We'll continue.
-
-        # 4) Sleep again
-        time.sleep(random.uniform(0.5, 0.7))
-
-    print("Done applying CSV updates, batch_id =", batch_id)
-    return {"batch_id": batch_id}
+    Record every CSV row as a pending BatchRow, then apply the rows in
+    parallel as a Celery chord (see `dispatch_batch_rows`). Rows are read
+    from the file one at a time and inserted SNAPSHOT_BULK_SIZE at a time.
+    The job stays interrupted until its rows are recorded, and is then
+    claimed for dispatch the same way `resume_csv_batch` claims it. A
+    redelivered task records any rows still missing and dispatches only if
+    the first delivery never got that far, so rows are never sent twice.
+    """
+    batch_id = batch_id or str(uuid.uuid4())
+    job, _ = BatchJob.objects.get_or_create(
+        batch_id=batch_id,
+        action=BatchJob.APPLY,
+        defaults={"csv_path": csv_path, "status": BatchJob.INTERRUPTED, "errors": []},
+    )
+    if job.status == BatchJob.RUNNING:
+        print(f"Batch {batch_id} is already running; not dispatching it again")
+        return {"batch_id": batch_id, "rows": 0, "chunks": 0}
+
+    try:
+        for items in chunked(iter_items(csv_path), settings.SNAPSHOT_BULK_SIZE):
+            BatchRow.objects.bulk_create([batch_row(job, item) for item in items], ignore_conflicts=True)
+    except CsvFormatError as e:
+        print(f"Cannot apply {csv_path}: {e}")
+        job.errors = [str(e)]
+    job.total_rows = job.rows.count()
+    job.save(update_fields=["errors", "total_rows"])
+
+    claimed = BatchJob.objects.filter(pk=job.pk, status__in=BatchJob.RESUMABLE).update(
+        status=BatchJob.RUNNING, completed_at=None
+    )
+    if not claimed:
+        print(f"Batch {batch_id} was dispatched by another delivery; not dispatching it again")
+        return {"batch_id": batch_id, "rows": 0, "chunks": 0}
+    job.refresh_from_db()
+    return dispatch_batch_rows(job)
+
+
+def batch_row(job, item):
+    if item.error:
+        return BatchRow(job=job, row=item.row, sku=item.sku, state=BatchRow.FAILED, message=item.error)
+    return BatchRow(job=job, row=item.row, sku=item.sku, fields=item.fields)
+
+
+def dispatch_batch_rows(job):
+    """
+    Apply the job's unfinished rows (pending, or snapshotted but not yet
+    confirmed applied) as a chord of CSV_CHUNK_SIZE-row chunks, finished by
+    `finish_csv_batch`, or by `fail_csv_batch` if a chunk fails. Only row ids
+    go through the broker.
+    """
+    row_ids = (
+        job.rows.filter(state__in=BatchRow.UNFINISHED)
+        .order_by("row")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=settings.SNAPSHOT_BULK_SIZE)
+    )
+    chunks = list(chunked(row_ids, settings.CSV_CHUNK_SIZE))
+    rows = sum(len(chunk) for chunk in chunks)
+    if chunks:
+        chord(apply_csv_chunk.s(chunk, job.batch_id) for chunk in chunks)(
+            finish_csv_batch.s(job.batch_id, BatchJob.APPLY).on_error(fail_csv_batch.s(job.batch_id, BatchJob.APPLY))
+        )
+    else:
+        finish_csv_batch.delay([], job.batch_id, BatchJob.APPLY)
+    print(f"Dispatched {rows} rows in {len(chunks)} chunks, batch_id = {job.batch_id}")
+    return {"batch_id": job.batch_id, "rows": rows, "chunks": len(chunks)}
+
+
+def save_rows(rows):
+    BatchRow.objects.bulk_update(rows, ["state", "snapshot", "message"], batch_size=settings.SNAPSHOT_BULK_SIZE)
+
+
+def record_response(row, response):
+    if response.get("status") in ("success", "unchanged"):
+        row.state, row.message = BatchRow.APPLIED, ""
+    else:
+        row.state, row.message = BatchRow.FAILED, response.get("message") or "Unknown error"
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def apply_csv_chunk(row_ids, batch_id):
+    """
+    Apply a chunk of BatchRows, checkpointing each row's state as it goes:
+      1. Prefetch product info for the chunk's SKUs and drop the CSV fields
+         that already match it. Rows with nothing left to change are done.
+      2. Store a snapshot of each changed pending SKU's current info in one
+         bulk insert, and mark those rows snapshotted. A row whose SKU
+         couldn't be looked up is marked failed, since it has no snapshot.
+      3. Send only the changed fields of snapshotted rows, several SKUs at
+         once (one coalesced GraphQL mutation each on a thread pool, or the
+         async REST client when PRODUCT_WRITE_API is "rest"), and mark each
+         row applied or failed.
+    Finished rows are skipped, so a chunk redelivered after a worker restart
+    (acks_late) or resumed with `resume_csv_batch` picks up where it stopped.
+    A snapshotted row keeps its original snapshot; if Shopify already has
+    its new values, the update landed before the interruption.
+    Pacing comes from the shared Shopify rate limiter, which only blocks
+    when the API budget is actually used up, across all chunks at once.
+    """
+    rows = list(BatchRow.objects.filter(id__in=row_ids, state__in=BatchRow.UNFINISHED).order_by("row"))
+
+    # Fetch every snapshot up front in batched requests rather than one GET per row
+    prefetch_error = None
+    try:
+        snapshots = safe_shopify_call(get_product_info_by_skus, list({row.sku for row in rows}), use_cache=False)
+    except Exception as e:
+        print(f"Failed to prefetch snapshots: {e}")
+        snapshots, prefetch_error = {}, f"Could not look up current product info: {e}"
+
+    changes = {row.id: changed_fields(snapshots.get(row.sku), row.fields) for row in rows}
+    for row in rows:
+        if not changes[row.id]:
+            unchanged = row.state == BatchRow.PENDING and snapshots.get(row.sku)
+            row.state = BatchRow.UNCHANGED if unchanged else BatchRow.APPLIED
+
+    # 1) Snapshot every changed SKU in one bulk insert rather than a round trip per row
+    to_snapshot = []
+    for row in rows:
+        if row.state != BatchRow.PENDING:
+            continue
+        if snapshots.get(row.sku) is None:
+            # Nothing to snapshot, so nothing to revert to; the row isn't updated
+            row.state = BatchRow.FAILED
+            row.message = prefetch_error or f"Could not find product with SKU '{row.sku}'"
+            print(f"Failed to store snapshot for SKU {row.sku}: {row.message}")
+            continue
+        to_snapshot.append(row)
+    try:
+        created = ProductSnapshot.objects.bulk_create(
+            [snapshot_from(batch_id, row.sku, snapshots[row.sku]) for row in to_snapshot],
+            batch_size=settings.SNAPSHOT_BULK_SIZE,
+        )
+        for row, snap in zip(to_snapshot, created):
+            row.state, row.snapshot = BatchRow.SNAPSHOTTED, snap
+    except Exception as e:
+        # Without a snapshot the row couldn't be reverted, so it isn't updated
+        print(f"Failed to store snapshots for batch {batch_id}: {e}")
+        for row in to_snapshot:
+            row.state, row.message = BatchRow.FAILED, f"Could not store snapshot: {e}"
+    save_rows(rows)
+
+    # 2) Update products, concurrently when SHOPIFY_ASYNC_CONCURRENCY allows
+    to_update = [row for row in rows if row.state == BatchRow.SNAPSHOTTED]
+    if settings.SHOPIFY_ASYNC_CONCURRENCY > 1 and len(to_update) > 1:
+        items = [(row.sku, changes[row.id]) for row in to_update]
+        if settings.PRODUCT_WRITE_API == "graphql":
+            responses = run_in_threads(lambda sku, fields: safe_shopify_write(update_product_by_sku, sku, fields), items)
+        else:
+            responses = run_concurrently("update_product_by_sku", items)
+        for row, response in zip(to_update, responses):
+            print(f"Updated {row.sku}: {response}")
+            record_response(row, response)
+        save_rows(to_update)
+    else:
+        for row in to_update:
+            try:
+                response = safe_shopify_write(update_product_by_sku, row.sku, changes[row.id])
+            except Exception as e:
+                response = {"status": "error", "message": str(e)}
+            print(f"Updated {row.sku}: {response}")
+            record_response(row, response)
+            row.save(update_fields=["state", "message"])
+
+    return dict(Counter(row.state for row in rows))
+
+
+@shared_task
+def resume_csv_batch(batch_id, retry_failed=False):
+    """
+    Pick an applied CSV batch up from its last checkpoint, dispatching only
+    the rows that are still pending or snapshotted. With `retry_failed`,
+    rows whose update failed are queued again as well; they keep their
+    snapshots, and rows that already succeeded are not touched. Rows that
+    failed validation need a corrected CSV instead.
+    Only an interrupted or complete batch is resumed; a running one is left
+    alone.
+    """
+    job = BatchJob.objects.get(batch_id=batch_id, action=BatchJob.APPLY)
+    # Claim the job in one UPDATE, so two resumes can't both dispatch its rows
+    claimed = BatchJob.objects.filter(pk=job.pk, status__in=BatchJob.RESUMABLE).update(
+        status=BatchJob.RUNNING, completed_at=None
+    )
+    if not claimed:
+        print(f"Batch {batch_id} is {job.status}; not resuming it")
+        return {"status": "error", "message": f"Batch {batch_id} is still running."}
+    if retry_failed:
+        failed = job.rows.filter(state=BatchRow.FAILED, fields__isnull=False)
+        failed.filter(snapshot__isnull=False).update(state=BatchRow.SNAPSHOTTED, message="")
+        failed.filter(snapshot__isnull=True).update(state=BatchRow.PENDING, message="")
+    job.refresh_from_db()
+    return dispatch_batch_rows(job)
 
 
 @shared_task
 def revert_csv_updates(batch_id):
     """
-    Loop over all snapshots for batch_id. For each:
-      - Put original fields back via safe_shopify_call
-      - Mark snapshot as reverted
-    """
-    snapshots = ProductSnapshot.objects.filter(batch_id=batch_id, reverted=False)
-
-    for snap in snapshots:
-        try:
-            # Build update fields from snapshot
-            update_fields = {
-                "title": snap.title,
-                "product_type": snap.product_type,
-                "vendor": snap.vendor,
-                "tags": snap.tags,
-                "body_html": snap.body_html,
-                "price": snap.price,
-                "compare_at_price": snap.compare_at_price,
-                "cost": snap.cost,
-                "available": snap.available
-            }
-            update_fields = {k: v for k, v in update_fields.items() if v is not None}
-
-            safe_shopify_call(update_product_by_sku, snap.sku, update_fields)
-            print(f"Reverted {snap.sku}")
-        except Exception as e:
-            print(f"Failed to revert {snap.sku}: {e}")
-            # continue or break, up to you
-
-        # Mark snapshot as reverted
-        snap.reverted = True
-        snap.save()
-
-        # Sleep a bit between each revert call
-        time.sleep(random.uniform(0.5, 0.7))
-
-    print(f"Reverted batch {batch_id}")
+    Split the batch's unreverted snapshots into chunks and revert them in
+    parallel as a Celery chord, aggregating results with `finish_csv_batch`.
+    """
+    snapshot_ids = (
+        ProductSnapshot.objects.filter(batch_id=batch_id, reverted=False)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=settings.SNAPSHOT_BULK_SIZE)
+    )
+    chunks = list(chunked(snapshot_ids, settings.CSV_CHUNK_SIZE))
+    total_rows = sum(len(chunk) for chunk in chunks)
+    BatchJob.objects.update_or_create(
+        batch_id=batch_id,
+        action=BatchJob.REVERT,
+        defaults={"total_rows": total_rows, "status": BatchJob.RUNNING, "errors": []},
+    )
+
+    if chunks:
+        chord(revert_snapshot_chunk.s(chunk, batch_id) for chunk in chunks)(
+            finish_csv_batch.s(batch_id, BatchJob.REVERT).on_error(fail_csv_batch.s(batch_id, BatchJob.REVERT))
+        )
+    else:
+        finish_csv_batch.delay([], batch_id, BatchJob.REVERT)
+    print(f"Dispatched revert of {total_rows} snapshots in {len(chunks)} chunks, batch_id = {batch_id}")
+    return {"batch_id": batch_id, "rows": total_rows, "chunks": len(chunks)}
+
+
+def mark_reverted(snapshot_ids):
+    ProductSnapshot.objects.filter(id__in=snapshot_ids).update(reverted=True)
+    BatchRow.objects.filter(snapshot_id__in=snapshot_ids).update(state=BatchRow.REVERTED)
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def revert_snapshot_chunk(snapshot_ids, batch_id):
+    """
+    Stream through a chunk of snapshots. For each:
+      - Put original fields back via safe_shopify_write
+      - Mark snapshot (and its BatchRow) as reverted once Shopify accepts it
+    The reverted flags are written with one UPDATE per SNAPSHOT_BULK_SIZE
+    snapshots instead of a save() per row. Snapshots that fail to revert
+    stay unreverted, so running the revert again retries just those.
+    Outcomes go to a results file for this chunk, keyed by snapshot id; a
+    summary is returned.
+    """
+    reverted_ids = []
+    path = part_path(batch_results_path(batch_id, BatchJob.REVERT), snapshot_ids[0] if snapshot_ids else 0)
+    snapshots = ProductSnapshot.objects.filter(id__in=snapshot_ids, reverted=False).order_by("id")
+    with ResultsWriter(path, header=False) as results:
+        for snap in snapshots.iterator(chunk_size=settings.SNAPSHOT_BULK_SIZE):
+            try:
+                # Build update fields from snapshot
+                update_fields = {
+                    "title": snap.title,
+                    "product_type": snap.product_type,
+                    "vendor": snap.vendor,
+                    "tags": snap.tags,
+                    "body_html": snap.body_html,
+                    "price": snap.price,
+                    "compare_at_price": snap.compare_at_price,
+                    "cost": snap.cost,
+                    "available": snap.available
+                }
+                update_fields = {k: v for k, v in update_fields.items() if v is not None}
+
+                response = safe_shopify_write(update_product_by_sku, snap.sku, update_fields)
+                print(f"Reverted {snap.sku}")
+            except Exception as e:
+                print(f"Failed to revert {snap.sku}: {e}")
+                response = {"status": "error", "message": str(e)}
+            results.write(snap.id, snap.sku, response)
+
+            # Mark snapshot as reverted
+            if response.get("status") in ("success", "unchanged"):
+                reverted_ids.append(snap.id)
+            if len(reverted_ids) >= settings.SNAPSHOT_BULK_SIZE:
+                mark_reverted(reverted_ids)
+                reverted_ids = []
+
+    if reverted_ids:
+        mark_reverted(reverted_ids)
+    return results.summary()
+
+
+def row_response(row):
+    """The results-file response for a BatchRow in its current state."""
+    if row.state == BatchRow.UNCHANGED:
+        return {"status": "unchanged"}
+    if row.state == BatchRow.FAILED:
+        return {"status": "error", "message": row.message}
+    if row.state in BatchRow.UNFINISHED:
+        return {"status": "error", "message": f"Interrupted while {row.state}; resume the batch to finish it"}
+    return {"status": "success"}
+
+
+def write_row_results(job, path):
+    """Write every BatchRow's outcome, in CSV order, to the results file at `path`."""
+    rows = job.rows.order_by("row").only("row", "sku", "state", "message")
+    with ResultsWriter(path) as results:
+        for row in rows.iterator(chunk_size=settings.SNAPSHOT_BULK_SIZE):
+            results.write(row.row, row.sku, row_response(row))
+    return results.summary()
+
+
+@shared_task
+def finish_csv_batch(chunk_summaries, batch_id, action):
+    """
+    Chord callback: record the batch's results and sustained throughput on
+    its BatchJob. An apply is summarized from its BatchRows, which also
+    covers rows finished before a resume; a revert adds up the chunk
+    summaries and merges the chunk result files into one results CSV. An
+    apply that still has unfinished rows is marked interrupted.
+    """
+    job = BatchJob.objects.get(batch_id=batch_id, action=action)
+    path = batch_results_path(batch_id, action)
+    if action == BatchJob.APPLY:
+        summary = write_row_results(job, path)
+        counts = {status: summary[status] for status in ("success", "unchanged", "error")}
+        # Row errors are rebuilt from the rows; keep a file-level error when there are none
+        errors = summary["errors"] or job.errors or []
+        finished = not job.rows.filter(state__in=BatchRow.UNFINISHED).exists()
+    else:
+        counts = {
+            status: sum(summary[status] for summary in chunk_summaries)
+            for status in ("success", "unchanged", "error")
+        }
+        merge_results(path, part_paths(path))
+        errors = (job.errors or []) + [
+            error for summary in chunk_summaries for error in summary["errors"]
+        ][:MAX_REPORTED_ERRORS]
+        finished = True
+
+    job.completed_at = timezone.now()
+    seconds = (job.completed_at - job.created_at).total_seconds()
+    rows = sum(counts.values())
+    job.status = BatchJob.COMPLETE if finished else BatchJob.INTERRUPTED
+    job.succeeded = counts["success"]
+    job.unchanged = counts["unchanged"]
+    job.failed = counts["error"]
+    job.errors = errors
+    job.results_path = path
+    job.rows_per_second = round(rows / seconds, 2) if seconds else None
+    job.save()
+
+    print(
+        f"Batch {batch_id} {action} {job.status}: {job.succeeded} succeeded, {job.unchanged} unchanged, "
+        f"{job.failed} failed in {seconds:.1f}s ({job.rows_per_second} rows/sec), results in {path}"
+    )
+    return {
+        "batch_id": batch_id, "action": action, "status": job.status,
+        "succeeded": job.succeeded, "unchanged": job.unchanged, "failed": job.failed,
+    }
+
+
+@shared_task
+def fail_csv_batch(request, exc, traceback, batch_id, action):
+    """
+    Chord errback: a chunk raised, so `finish_csv_batch` never runs. Mark the
+    batch interrupted with the error, rather than leaving it running, so it
+    can be resumed.
+    """
+    job = BatchJob.objects.get(batch_id=batch_id, action=action)
+    job.status = BatchJob.INTERRUPTED
+    job.completed_at = timezone.now()
+    job.errors = ((job.errors or []) + [f"Chunk failed: {exc!r}"])[:MAX_REPORTED_ERRORS]
+    job.save()
+    print(f"Batch {batch_id} {action} interrupted: a chunk failed with {exc!r}")
+
+
+CSV_UPLOAD_ACTIONS = {
+    "create": create_products_from_csv,
+    "update": update_products_from_csv,
+}
+
+
+@shared_task
+def run_csv_upload(job_id, action, csv_path):
+    """
+    Create or update products from a CSV uploaded in the chat, reporting
+    rows done, errors and the final result to `job_progress` for the
+    page to poll.
+    """
+    try:
+        total = count_rows(csv_path)
+    except CsvFormatError:
+        total = 0  # The create/update call reports the problem
+    job_progress.start(job_id, total)
+    try:
+        result = CSV_UPLOAD_ACTIONS[action](
+            csv_path, progress=lambda done, failed: job_progress.advance(job_id, done, failed)
+        )
+    except Exception as e:
+        print(f"CSV {action} job {job_id} failed: {e}")
+        result = {"status": "error", "message": str(e)}
+    job_progress.finish(job_id, result)
+    print(f"CSV {action} job {job_id} finished: {result.get('message')}")
+    return result
+
+
+@shared_task
+def run_sale_campaign(campaign_id):
+    """
+    Put a SaleCampaign's variants on sale, and schedule its revert for
+    `ends_at` when the campaign has one.
+    """
+    campaign = SaleCampaign.objects.get(pk=campaign_id)
+    if campaign.status != SaleCampaign.SCHEDULED:
+        print(f"Campaign {campaign_id} is already {campaign.status}; not applying again")
+        return None
+    try:
+        result = apply_campaign(campaign)
+    except Exception as e:
+        campaign.status = SaleCampaign.FAILED
+        campaign.errors = [str(e)]
+        campaign.save()
+        print(f"Campaign {campaign_id} failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+    if campaign.ends_at:
+        revert_sale_campaign.apply_async(args=[campaign_id], eta=campaign.ends_at)
+    print(f"Campaign {campaign_id} applied: {result['message']}")
+    return result
+
+
+@shared_task
+def revert_sale_campaign(campaign_id):
+    """Restore the prices and tags a SaleCampaign changed, from its snapshots."""
+    campaign = SaleCampaign.objects.get(pk=campaign_id)
+    if campaign.status != SaleCampaign.ACTIVE:
+        print(f"Campaign {campaign_id} is {campaign.status}; nothing to revert")
+        return None
+    result = revert_campaign(campaign)
+    print(f"Campaign {campaign_id} reverted: {result['message']}")
+    return result
+
+
+@shared_task
+def refresh_catalog_mirror():
+    """
+    Rebuild the local catalog mirror from a Shopify bulk operation export.
+    """
+    result = sync_catalog_mirror()
+    print(
+        f"Catalog mirror refreshed: {result['counts']} in {result['seconds']}s "
+        f"({result['rows_per_second']} rows/sec)"
+    )
+    return result
+
+
+@shared_task
+def process_shopify_webhook(topic, payload, webhook_id=None):
+    """
+    Apply a verified Shopify webhook to the local catalog data.
+    Queued by the webhook view so the HTTP response goes back immediately.
+    A repeated delivery of the same `webhook_id` is ignored, unless the
+    earlier one failed.
+    """
+    handler = WEBHOOK_HANDLERS.get(topic)
+    if not handler:
+        print(f"Ignoring webhook with unhandled topic {topic}")
+        return None
+    if not first_delivery(webhook_id):
+        print(f"Ignoring repeated delivery of {topic} webhook {webhook_id}")
+        return None
+    try:
+        result = handler(payload)
+    except Exception:
+        forget_delivery(webhook_id)
+        raise
+    print(f"Processed {topic} webhook: {result}")
+    return result
 
 
 @shared_task
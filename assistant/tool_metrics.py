@@ -0,0 +1,111 @@
+# assistant/tool_metrics.py
+"""
+Per-tool histograms of chat tool calls: wall time, Shopify API calls and the
+size of the arguments and result.
+
+Each tool keeps one Redis hash of bucket counters and running sums, so
+recording a call is a single pipelined round trip from any process (web or
+worker) and the numbers add up across all of them. Percentiles are read off
+the buckets: each is the upper bound of the bucket it falls in, or the lower
+bound of the last, open-ended one.
+"""
+
+import redis
+
+from . import rate_limit
+
+KEY_PREFIX = "tool-metrics"
+
+# Bucket upper bounds; anything larger is counted in a final open-ended bucket
+BUCKETS = {
+    "wall_ms": (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000),
+    "api_calls": (0, 1, 2, 3, 5, 10, 25, 50, 100),
+    "request_bytes": (64, 256, 1024, 4096, 16384, 65536),
+    "response_bytes": (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def key(tool):
+    return f"{KEY_PREFIX}:{tool}"
+
+
+def bucket(metric, value):
+    for bound in BUCKETS[metric]:
+        if value <= bound:
+            return str(bound)
+    return "inf"
+
+
+def record(tool, wall_ms, api_calls, request_bytes, response_bytes, failed=False):
+    values = {
+        "wall_ms": wall_ms,
+        "api_calls": api_calls,
+        "request_bytes": request_bytes,
+        "response_bytes": response_bytes,
+    }
+    try:
+        pipe = rate_limit.get_client().pipeline()
+        pipe.sadd(f"{KEY_PREFIX}:tools", tool)
+        pipe.hincrby(key(tool), "count", 1)
+        if failed:
+            pipe.hincrby(key(tool), "errors", 1)
+        for metric, value in values.items():
+            pipe.hincrby(key(tool), f"{metric}:{bucket(metric, value)}", 1)
+            pipe.hincrbyfloat(key(tool), f"{metric}:sum", value)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"[ToolMetrics] Could not record {tool}: {e}")
+
+
+def percentile(counts, bounds, total, p):
+    rank = total * p / 100
+    seen = 0
+    for bound in bounds:
+        seen += counts.get(str(bound), 0)
+        if seen >= rank:
+            return bound
+    return bounds[-1]
+
+
+def histogram(raw, metric, total):
+    bounds = BUCKETS[metric]
+    counts = {name: int(raw.get(f"{metric}:{name}", 0)) for name in [*map(str, bounds), "inf"]}
+    result = {"mean": round(float(raw.get(f"{metric}:sum", 0)) / total, 1) if total else None}
+    for p in PERCENTILES:
+        result[f"p{p}"] = percentile(counts, bounds, total, p) if total else None
+    result["buckets"] = {name: count for name, count in counts.items() if count}
+    return result
+
+
+def stats(tool=None):
+    """
+    Return {tool: {"count", "errors", metric: {"mean", "p50", "p95", "p99",
+    "buckets"}}} for every tool called so far, or just `tool`.
+    """
+    client = rate_limit.get_client()
+    try:
+        names = [tool] if tool else sorted(name.decode() for name in client.smembers(f"{KEY_PREFIX}:tools"))
+        pipe = client.pipeline()
+        for name in names:
+            pipe.hgetall(key(name))
+        hashes = pipe.execute()
+    except redis.exceptions.RedisError as e:
+        return {"error": str(e)}
+    result = {}
+    for name, raw in zip(names, hashes):
+        raw = {field.decode(): value.decode() for field, value in raw.items()}
+        total = int(raw.get("count", 0))
+        result[name] = {"count": total, "errors": int(raw.get("errors", 0))}
+        for metric in BUCKETS:
+            result[name][metric] = histogram(raw, metric, total)
+    return result
+
+
+def reset():
+    client = rate_limit.get_client()
+    try:
+        names = client.smembers(f"{KEY_PREFIX}:tools")
+        client.delete(f"{KEY_PREFIX}:tools", *(key(name.decode()) for name in names))
+    except redis.exceptions.RedisError as e:
+        print(f"[ToolMetrics] Could not reset: {e}")
@@ -0,0 +1,139 @@
+# assistant/tool_registry.py
+"""
+The chat tools by name. Each tool declares the function that carries it out,
+the function that turns its result into answer text, and whether it only
+reads (so it can run alongside anything) or changes the store:
+
+    @register("get_product_info_by_sku", formatter=product_info_text, read_only=True)
+    def lookup_product(args, **context):
+        return get_product_info_by_sku(args["sku"])
+
+Pure tools are read-only and also give the same result for the same
+arguments every time, so answers that only used them can be cached.
+
+Handlers take the model's arguments plus the request context (uploaded
+file, CSV filename, apply and revert times...) and return a JSON-able result
+dict, which is what the CLI hands back to the model. Formatters take the
+arguments, that result and the same context and return the text added to
+the answer. A tool may also have an async handler for the async views.
+
+Every call is timed and its Shopify requests and payload sizes are recorded
+in `tool_metrics`.
+"""
+
+import json
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+
+from . import rate_limit, tool_metrics
+
+Tool = namedtuple("Tool", ["name", "handler", "formatter", "read_only", "pure", "async_handler"])
+
+TOOLS = {}
+
+
+def register(name, formatter=None, read_only=False, pure=False):
+    """Decorator registering a handler as the tool `name`."""
+    def decorator(handler):
+        TOOLS[name] = Tool(name, handler, formatter, read_only or pure, pure, None)
+        return handler
+    return decorator
+
+
+def register_async(name):
+    """Decorator adding an async handler to the already registered tool `name`."""
+    def decorator(handler):
+        TOOLS[name] = TOOLS[name]._replace(async_handler=handler)
+        return handler
+    return decorator
+
+
+def is_read_only(name):
+    tool = TOOLS.get(name)
+    return bool(tool and tool.read_only)
+
+
+def is_pure(name):
+    tool = TOOLS.get(name)
+    return bool(tool and tool.pure)
+
+
+def has_async_handler(name):
+    tool = TOOLS.get(name)
+    return bool(tool and tool.async_handler)
+
+
+def payload_size(value):
+    """Bytes in `value` as JSON, the way it would be sent to the model."""
+    return len(json.dumps(value, default=str).encode()) if value is not None else 0
+
+
+def unknown_tool(name):
+    return {"status": "error", "message": f"Unknown tool '{name}'"}
+
+
+def failed(response):
+    return not isinstance(response, dict) or response.get("status") == "error"
+
+
+def call(name, args, **context):
+    """Run the tool's handler and return its result dict, recording how the call went."""
+    tool = TOOLS.get(name)
+    if tool is None:
+        return unknown_tool(name)
+    response = None
+    started = time.perf_counter()
+    with rate_limit.count_calls() as calls:
+        try:
+            response = tool.handler(args, **context)
+        finally:
+            tool_metrics.record(
+                name,
+                wall_ms=(time.perf_counter() - started) * 1000,
+                api_calls=sum(calls.values()),
+                request_bytes=payload_size(args),
+                response_bytes=payload_size(response),
+                failed=failed(response),
+            )
+    return response
+
+
+async def acall(name, args, **context):
+    """`call` with the tool's async handler."""
+    tool = TOOLS.get(name)
+    if tool is None or tool.async_handler is None:
+        raise ValueError(f"Tool '{name}' has no async handler")
+    response = None
+    started = time.perf_counter()
+    with rate_limit.count_calls() as calls:
+        try:
+            response = await tool.async_handler(args, **context)
+        finally:
+            await sync_to_async(tool_metrics.record, thread_sensitive=False)(
+                name,
+                wall_ms=(time.perf_counter() - started) * 1000,
+                api_calls=sum(calls.values()),
+                request_bytes=payload_size(args),
+                response_bytes=payload_size(response),
+                failed=failed(response),
+            )
+    return response
+
+
+def answer_text(name, args, response, **context):
+    tool = TOOLS.get(name)
+    if tool is None or tool.formatter is None:
+        return ""
+    return tool.formatter(args, response, **context)
+
+
+def run(name, args, **context):
+    """Carry out one tool call and return the text it adds to the answer."""
+    return answer_text(name, args, call(name, args, **context), **context)
+
+
+async def arun(name, args, **context):
+    """`run` with the tool's async handler."""
+    return answer_text(name, args, await acall(name, args, **context), **context)
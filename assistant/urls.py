@@ -5,4 +5,8 @@ from . import views
 
 urlpatterns = [
     path("", views.home, name="home"),
+    path("answers/<str:stream_id>/stream/", views.answer_stream, name="answer-stream"),
+    path("webhooks/shopify/", views.shopify_webhook, name="shopify-webhook"),
+    path("metrics/", views.metrics, name="metrics"),
+    path("csv-jobs/<str:job_id>/", views.csv_job_status, name="csv-job-status"),
 ]
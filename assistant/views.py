@@ -2,26 +2,35 @@
 
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.core.cache import cache
+from django.db import connections
+from django.core.files import File
+from django.template.loader import render_to_string
+from django.utils.html import escape
 from .forms import QuestionForm
 from .models import Conversation, Message
-from .shopify_chat_cli import (
-    get_product_info_by_sku,
-    update_product_by_sku,
-    create_product_with_sku,
-    create_products_from_csv,
-    update_products_from_csv,
-    put_product_on_sale,
-    take_product_off_sale,
-    disable_product_by_sku,
-)
 from environs import Env
-import requests
+import asyncio
 import json, os
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
+import uuid
 import csv
+import base64
+import hashlib
+import hmac
 from io import TextIOWrapper
-from openai import OpenAI
+from asgiref.sync import sync_to_async
+from openai import AsyncOpenAI, OpenAI
 from django.conf import settings
-from .discounts import calculate_cost
+from . import answer_cache, handbook, intent_router, job_progress, product_cache, rate_limit, tool_metrics, tool_registry
+# Importing the chat tools registers them
+from . import chat_tools  # noqa: F401
 
 env = Env()
 env.read_env()
@@ -30,6 +39,7 @@ DEBUG = True
 
 OPENAI_API_KEY = env("OPENAI_API_KEY")
 client = OpenAI(api_key=OPENAI_API_KEY)
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 MODEL = "gpt-4o-mini"
 MAX_LEN = 1800
@@ -37,6 +47,16 @@ MAX_TOKENS = 300
 
 PROMPT = """Answer the question based on the context below."""
 
+SYSTEM_PROMPT = """You are a helpful assistant for the music store All You Need Music. 
+                    You can send emails and interact with Shopify products using the provided functions.
+                    When the user asks to email an attached file, assume that one is provided by the user form.
+                    Call the `send_email` function with the given recipient, subject, and body. The backend 
+                    code will handle the attachment automatically. When the user asks to create or update products 
+                    from an attached CSV, call `create_products_from_csv` or `update_products_from_csv` with a
+                    dummy filename (e.g., "attached.csv"). The backend code will replace that with the actual 
+                    uploaded CSV file. To put many products on sale at once (by vendor, product type, tag or
+                    a list of SKUs), call `start_sale_campaign` once instead of `put_product_on_sale` per SKU."""
+
 tools = [
     {
         "type": "function",
@@ -77,6 +97,29 @@ tools = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_product_info_by_skus",
+            "description": "Retrieve product information for several SKUs at once. Use this instead of repeated get_product_info_by_sku calls when the user asks about more than one SKU.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "skus": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The SKUs of the product variants"
+                    },
+                    "fields": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "A list of specific fields to return (optional). Possible fields: ['sku', 'title', 'price', 'compare_at_price', 'cost', 'available', 'vendor', 'product_type', 'tags', 'body_html']"
+                    }
+                },
+                "required": ["skus"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -163,6 +206,31 @@ tools = [
             },
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "start_sale_campaign",
+            "description": (
+                "Put every product variant matching a vendor, product type, tag and/or SKU list on sale at once, "
+                "e.g. '20% off all Yamaha keyboards'. Give either percent_off or a discount code. Uses the "
+                "form's schedule start and end times, if set, to start the sale and revert it automatically."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "A short name for the campaign"},
+                    "vendor": {"type": "string", "description": "Only variants of products from this vendor"},
+                    "product_type": {"type": "string", "description": "Only variants of products of this type"},
+                    "tag": {"type": "string", "description": "Only variants of products with this tag"},
+                    "skus": {"type": "array", "items": {"type": "string"}, "description": "Only these SKUs"},
+                    "percent_off": {"type": "number", "description": "Percentage to take off the regular price"},
+                    "discount_code": {"type": "string", "description": "Discount code to price the sale with, e.g. 'B'"},
+                    "sale_tag": {"type": "string", "description": "Tag added to products on sale (default 'on-sale')"},
+                },
+                "required": ["name"],
+            },
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -222,40 +290,219 @@ tools = [
     },
 ]
 
-def send_email(recipients, subject, body, attachment=None):
-    mailgun_domain = env("MAILGUN_DOMAIN")
-    mailgun_api_key = env("MAILGUN_API_KEY")
-    from_email = env("FROM_EMAIL")
-
-    # Mailgun can accept a list of recipients directly
-    data = {
-        "from": from_email,
-        "to": recipients,  # <-- This is now a list
-        "subject": subject,
-        "text": body,
-    }
+# Changes whenever the prompts or tool schemas do, so cached answers from before don't match
+ANSWER_SCHEMA_VERSION = answer_cache.schema_version(PROMPT, SYSTEM_PROMPT, tools)
 
-    files = []
-    if attachment:
-        attachment.seek(0)
-        file_content = attachment.read()
-        files.append(
-            ("attachment", (attachment.name, file_content, "application/octet-stream"))
-        )
 
+def csv_upload_summary(action, response):
+    """Describe the result of a finished CSV create or update job."""
+    if response.get("status") != "success":
+        error_details = response.get("message") or response.get("details") or "Unknown error"
+        return f"Failed to {action} products from CSV.\nError: {error_details}"
+
+    if action == "create":
+        products = response.get("created_products", [])
+        count = response.get("created_count", len(products))
+        lines = [
+            "Products were successfully created!",
+            f"Number of products created: {count}",
+        ]
+    else:
+        products = response.get("updated_products", [])
+        count = response.get("updated_count", len(products))
+        lines = [
+            "Products were successfully updated!",
+            f"Number of products updated: {count}",
+            f"Number of products already up to date: {response.get('unchanged', 0)}",
+        ]
+    product_list = "\n".join([f"- {p.get('sku', 'Unknown SKU')} ({p.get('title', 'No title')})" for p in products])
+    lines += [
+        f"Number of rows with errors: {response.get('error_count', 0)}",
+        f"{'Created' if action == 'create' else 'Updated'} Products:\n{product_list}",
+    ]
+    if count > len(products):
+        lines.append(f"...and more. Every row's outcome is in {response.get('results_file')}")
+    return "\n".join(lines)
+
+
+def run_tool_call(tool_name, args, **context):
+    """
+    Carry out one tool call from the model and return the text it adds to the
+    answer. `context` is the request's uploaded_file, csv_filename,
+    apply_time, revert_time, attachment_path and csv_jobs.
+    """
+    return tool_registry.run(tool_name, args, **context)
+
+
+def call_skus(args):
+    """The SKUs a tool call names, in `sku` or a `skus` list."""
+    skus = [args["sku"]] if args.get("sku") else []
+    return skus + [sku for sku in args.get("skus") or [] if sku]
+
+
+def tool_call_lanes(calls):
+    """
+    Split a completion's tool calls, [(tool_name, args)], into lanes of call
+    indexes that can run at the same time. Calls naming a SKU (in `sku` or
+    `skus`) that another call in the completion changes share that SKU's
+    lane and keep their order; a call naming several such SKUs joins their
+    lanes into one. Changing calls that name no SKU share one lane as well,
+    since what they touch isn't known. Every other call gets a lane of its
+    own. Tools registered as read-only never change a SKU.
+    """
+    changed = set()
+    for tool_name, args in calls:
+        if not tool_registry.is_read_only(tool_name):
+            changed.update(call_skus(args))
+
+    lanes, key_lanes = [], {}
+    for i, (tool_name, args) in enumerate(calls):
+        keys = [sku for sku in call_skus(args) if sku in changed]
+        if not keys and not tool_registry.is_read_only(tool_name):
+            keys = [None]  # The lane of changing calls without a SKU
+        if not keys:
+            lanes.append([i])
+            continue
+
+        joined = []
+        for key in keys:
+            lane = key_lanes.get(key)
+            if lane is not None and all(lane is not other for other in joined):
+                joined.append(lane)
+        if not joined:
+            lane = []
+            lanes.append(lane)
+        else:
+            # Merge every lane this call touches, keeping the calls in order
+            lane = joined[0]
+            for other in joined[1:]:
+                lane.extend(other)
+                lanes = [existing for existing in lanes if existing is not other]
+                for key, existing in key_lanes.items():
+                    if existing is other:
+                        key_lanes[key] = lane
+            lane.sort()
+        lane.append(i)
+        for key in keys:
+            key_lanes[key] = lane
+    return lanes
+
+
+def run_tool_call_in_thread(tool_name, args, **kwargs):
+    """`run_tool_call` off the request thread, closing the database connection the thread opened."""
     try:
-        response = requests.post(
-            f"https://api.mailgun.net/v3/{mailgun_domain}/messages",
-            auth=("api", mailgun_api_key),
-            data=data,
-            files=files if files else None
-        )
-        response.raise_for_status()
-        return {"status": "success", "details": response.json()}
-    except requests.exceptions.RequestException as e:
-        return {"status": "error", "details": str(e)}
+        return run_tool_call(tool_name, args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def run_tool_calls(calls, **kwargs):
+    """
+    Run a completion's tool calls, [(tool_name, args)], and yield their
+    results in the original order, each as soon as it and those before it
+    are done. Lanes from `tool_call_lanes` run in a pool of
+    TOOL_CALL_CONCURRENCY threads, so several product lookups take as long
+    as the slowest one rather than the sum.
+    """
+    if len(calls) <= 1:
+        for tool_name, args in calls:
+            yield run_tool_call(tool_name, args, **kwargs)
+        return
+
+    results = [Future() for _ in calls]
+
+    def run_lane(lane):
+        for i in lane:
+            tool_name, args = calls[i]
+            try:
+                results[i].set_result(run_tool_call_in_thread(tool_name, args, **kwargs))
+            except Exception as e:
+                results[i].set_exception(e)
+
+    with ThreadPoolExecutor(max_workers=settings.TOOL_CALL_CONCURRENCY) as pool:
+        for lane in tool_call_lanes(calls):
+            pool.submit(run_lane, lane)
+        for result in results:
+            yield result.result()
+
+
+def schedule_csv_updates(csv_filename, apply_time, revert_time=None):
+    from assistant.tasks import apply_csv_updates, revert_csv_updates
+    batch_id = str(uuid.uuid4())
+    
+    apply_csv_updates.apply_async(args=[csv_filename, batch_id], eta=apply_time)
+    scheduling_message = f"Your CSV updates have been scheduled at {apply_time}."
+    
+    if revert_time:
+        revert_csv_updates.apply_async(args=[batch_id], eta=revert_time)
+        scheduling_message += f" They will be reverted at {revert_time}."
+    
+    return scheduling_message
+
+
+def chat_request(question, model, debug=False, max_len=MAX_LEN):
+    """
+    Arguments for a streamed chat completion answering `question`, with the
+    most relevant handbook passages (up to `max_len` tokens) as context.
+    """
+    context = handbook.context_for(question, max_len)
+    if debug:
+        print("Context:\n" + context)
+
+    prompt = f"""{PROMPT}```Context: {context}```\n\n---\n\n``Question: {question}```\n Answer:"""
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "model": model,
+        "tools": tools,
+        "temperature": 0,
+        "stream": True,
+    }
+
+
+def add_tool_call_fragments(tool_calls, delta):
+    """
+    A tool call arrives spread over the stream's deltas (its name, then its
+    JSON arguments in fragments), keyed by index. Add this delta's fragments
+    to `tool_calls`, {index: {"name", "arguments"}}.
+    """
+    for fragment in delta.tool_calls or []:
+        call = tool_calls.setdefault(fragment.index, {"name": "", "arguments": ""})
+        if fragment.function and fragment.function.name:
+            call["name"] += fragment.function.name
+        if fragment.function and fragment.function.arguments:
+            call["arguments"] += fragment.function.arguments
+
+
+def route_question(question, uploaded_file=None, csv_filename=None, apply_time=None):
+    """The fast-path route for a structured command, or None to ask the model."""
+    if not settings.INTENT_ROUTER_ENABLED or uploaded_file or csv_filename or apply_time:
+        return None
+    return intent_router.route(question)
+
+
+def answer_cache_key(question, model, uploaded_file=None, csv_filename=None, apply_time=None):
+    """
+    Key for the question's cached answer, or None when the answer may depend
+    on more than the question (an uploaded file or a scheduled time).
+    """
+    if not answer_cache.enabled() or uploaded_file or csv_filename or apply_time:
+        return None
+    return answer_cache.key(question, model, f"{ANSWER_SCHEMA_VERSION}:{handbook.version()}")
+
+
+def cache_answer(cache_key, calls, pieces):
+    """Cache the finished answer if its turn called no tools, or only pure ones."""
+    answer = "".join(pieces)
+    if answer.strip() and all(tool_registry.is_pure(tool_name) for tool_name, _ in calls):
+        answer_cache.store(cache_key, answer)
+    else:
+        answer_cache.record("skipped")
+
 
-def answer_question(
+def stream_answer(
     model=MODEL,
     question="What is your store phone number?",
     max_len=MAX_LEN,
@@ -266,341 +513,239 @@ def answer_question(
     apply_time=None,
     revert_time=None,
     attachment_path=None,
+    csv_jobs=None,
+    openai_client=None,
+    use_cache=True,
 ):
+    """
+    Yield the answer in pieces as it is produced: the model's text token by
+    token, then the result of each tool call, which are assembled from the
+    stream as it arrives and run once it ends. Structured commands the
+    intent router recognizes, and repeated questions whose answer is cached,
+    come back in one piece without asking the model.
+    """
     # If apply_time is given by the form and user requested scheduling:
     if apply_time and csv_filename:
-        from assistant.tasks import apply_csv_updates, revert_csv_updates
-        import uuid
-        batch_id = str(uuid.uuid4())
-        
-        apply_csv_updates.apply_async(args=[csv_filename, batch_id], eta=apply_time)
-        scheduling_message = f"Your CSV updates have been scheduled at {apply_time}."
-        
-        if revert_time:
-            revert_csv_updates.apply_async(args=[batch_id], eta=revert_time)
-            scheduling_message += f" They will be reverted at {revert_time}."
-        
-        return scheduling_message
-
-    context = ""
-    if debug:
-        print("Context:\n" + context)
+        yield schedule_csv_updates(csv_filename, apply_time, revert_time)
+        return
+
+    # Structured commands like "price of SKU 12345" skip the model
+    routed = route_question(question, uploaded_file, csv_filename, apply_time)
+    if routed:
+        try:
+            yield run_tool_call(routed.tool_name, routed.args).lstrip()
+        except Exception as e:
+            print(e)
+            yield str(e)
+        return
+
+    cache_key = answer_cache_key(question, model, uploaded_file, csv_filename, apply_time) if use_cache else None
+    if cache_key:
+        cached = answer_cache.lookup(cache_key)
+        if cached is not None:
+            yield cached
+            return
 
     try:
-        prompt = f"""{PROMPT}```Context: {context}```\n\n---\n\n``Question: {question}```\n Answer:"""
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are a helpful assistant for the music store All You Need Music. 
-                    You can send emails and interact with Shopify products using the provided functions.
-                    When the user asks to email an attached file, assume that one is provided by the user form.
-                    Call the `send_email` function with the given recipient, subject, and body. The backend 
-                    code will handle the attachment automatically. When the user asks to create or update products 
-                    from an attached CSV, call `create_products_from_csv` or `update_products_from_csv` with a
-                    dummy filename (e.g., "attached.csv"). The backend code will replace that with the actual 
-                    uploaded CSV file.""",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            model=model,
-            tools=tools,
-            temperature=0,
+        response = (openai_client or client).chat.completions.create(
+            **chat_request(question, model, debug, max_len)
         )
 
-        message = response.choices[0].message
-        answer = message.content if message.content else ""
-    
+        pieces, tool_calls = [], {}
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                pieces.append(delta.content)
+                yield delta.content
+            add_tool_call_fragments(tool_calls, delta)
+
         # Handle tool calls
-        if message.tool_calls:
-            for tool_call in message.tool_calls:
-                tool_name = tool_call.function.name
-                args = json.loads(tool_call.function.arguments)
-
-                if tool_name == "send_email":
-                    recipients = args["recipients"]
-                    subject = args["subject"]
-                    body = args["body"]
-
-                    # If apply_time is provided, schedule the email
-                    if apply_time:
-                        from assistant.tasks import send_scheduled_email
-                        # Use the attachment_path if available
-                        # Note: attachment_path must be known or passed into answer_question
-                        # You might pass it in similarly to how you pass csv_filename.
-                        send_scheduled_email.apply_async(
-                            args=[recipients, subject, body, attachment_path],
-                            eta=apply_time
-                        )
-                        answer += (
-                            f"\n\nYour email has been scheduled at {apply_time}!\n"
-                            f"Recipients: {recipients}\n"
-                            f"Subject: {subject}\n"
-                            f"Body: {body}"
-                        )
-                        if uploaded_file:
-                            answer += f"\nAttachment scheduled: {uploaded_file.name}"
-                    else:
-                        # No scheduling, send immediately
-                        email_response = send_email(
-                            recipients, subject, body,
-                            attachment=uploaded_file if uploaded_file else None
-                        )
-                        if email_response["status"] == "success":
-                            answer += (
-                                "\n\nEmail was successfully sent!\n"
-                                f"Recipients: {recipients}\n"
-                                f"Subject: {subject}\n"
-                                f"Body: {body}"
-                            )
-                            if uploaded_file:
-                                answer += f"\nAttachment: {uploaded_file.name}"
-                        else:
-                            answer += f"\n\nFailed to send email.\nError: {email_response['details']}"
-
-                elif tool_name == "get_product_info_by_sku":
-                    product_info = get_product_info_by_sku(args["sku"])
-                    # Print JSON for debugging
-                    print("Product Info JSON for debugging:", json.dumps(product_info, indent=2))
-                
-                    requested_fields = args.get("fields", None)  # fields is optional
-                    if requested_fields:
-                        # Filter product_info to only include requested fields
-                        filtered_info = {field: product_info.get(field, 'N/A') for field in requested_fields}
-                        answer += "\n\nRequested Product Information:\n"
-                        for f, val in filtered_info.items():
-                            answer += f"{f.capitalize()}: {val}\n"
-                    else:
-                        # Show all fields
-                        answer += (
-                            "\n\nProduct Information:\n"
-                            f"SKU: {product_info.get('sku', 'Unknown')}\n"
-                            f"Title: {product_info.get('title', 'No title')}\n"
-                            f"Price: {product_info.get('price', 'N/A')}\n"
-                            f"Compare at Price: {product_info.get('compare_at_price', 'N/A')}\n"
-                            f"Cost: {product_info.get('cost', 'N/A')}\n"
-                            f"Available Quantity: {product_info.get('available', 'N/A')}\n"
-                            f"Vendor: {product_info.get('vendor', 'N/A')}\n"
-                            f"Type: {product_info.get('product_type', 'N/A')}\n"
-                            f"Tags: {product_info.get('tags', '')}\n"
-                            "Description:\n"
-                            f"{product_info.get('body_html', 'No description')}"
-                        )
-
-                elif tool_name == "update_product_by_sku":
-                    update_fields = {k: v for k, v in args.items() if k != "sku"}
-                    update_response = update_product_by_sku(args["sku"], update_fields)
-                    # Print JSON for debugging
-                    print("Update Product Response JSON for debugging:", json.dumps(update_response, indent=2))
-
-                    if update_response.get("status") == "success":
-                        updated_info = update_response.get("updated_fields", {})
-                        answer += (
-                            "\n\nProduct successfully updated!\n"
-                            f"SKU: {updated_info.get('sku', args['sku'])}\n"
-                            f"Title: {updated_info.get('title', 'No title')}\n"
-                            f"Price: {updated_info.get('price', 'N/A')}\n"
-                            f"Compare at Price: {updated_info.get('compare_at_price', 'N/A')}\n"
-                            f"Available Quantity: {updated_info.get('available', 'N/A')}\n"
-                            f"Vendor: {updated_info.get('vendor', 'N/A')}\n"
-                            f"Type: {updated_info.get('product_type', 'N/A')}\n"
-                            f"Tags: {updated_info.get('tags', '')}\n"
-                            "Description:\n"
-                            f"{updated_info.get('body_html', 'No description')}"
-                        )
-                    else:
-                        error_message = update_response.get("message", "Unknown error")
-                        answer += f"\n\nFailed to update product.\nError: {error_message}"
-
-                elif tool_name == "create_product_with_sku":
-                    create_fields = {k: v for k, v in args.items() if k != "sku"}
-                    create_response = create_product_with_sku(args["sku"], **create_fields)
-                    # Print JSON for debugging
-                    print("Create Product Response JSON for debugging:", json.dumps(create_response, indent=2))
-
-                    if create_response.get("status") == "success":
-                        product_info = create_response.get("product_info", {})
-                        answer += (
-                            "\n\nProduct successfully created!\n"
-                            f"SKU: {product_info.get('sku', args['sku'])}\n"
-                            f"Title: {product_info.get('title', 'No title')}\n"
-                            f"Price: {product_info.get('price', 'N/A')}\n"
-                            f"Compare at Price: {product_info.get('compare_at_price', 'N/A')}\n"
-                            f"Available Quantity: {product_info.get('available', 'N/A')}\n"
-                            f"Vendor: {product_info.get('vendor', 'N/A')}\n"
-                            f"Type: {product_info.get('product_type', 'N/A')}\n"
-                            f"Tags: {product_info.get('tags', '')}\n"
-                            "Description:\n"
-                            f"{product_info.get('body_html', 'No description')}"
-                        )
-                    else:
-                        error_message = create_response.get("message", "Unknown error")
-                        answer += f"\n\nFailed to create product.\nError: {error_message}"
-                        
-                elif tool_name == "create_products_from_csv":
-                    if csv_filename:
-                        create_response = create_products_from_csv(csv_filename)
-                        # Print JSON to console for debugging
-                        print("Create Products From CSV Response JSON:", json.dumps(create_response, indent=2))
-                        
-                        if create_response.get("status") == "success":
-                            created_products = create_response.get("created_products", [])
-                            product_list = "\n".join([f"- {p.get('sku', 'Unknown SKU')} ({p.get('title', 'No title')})" for p in created_products])
-                            
-                            answer += (
-                                "\n\nProducts were successfully created!\n"
-                                f"Number of products created: {len(created_products)}\n"
-                                f"Created Products:\n{product_list}"
-                            )
-                        else:
-                            # Handle error scenario
-                            error_details = create_response.get("details", "Unknown error")
-                            answer += f"\n\nFailed to create products from CSV.\nError: {error_details}"
-                    else:
-                        answer += "\n\nError: No CSV file provided."
-                
-                elif tool_name == "update_products_from_csv":
-                    if csv_filename:
-                        update_response = update_products_from_csv(csv_filename)
-                        # Print JSON to console for debugging
-                        print("Update Products From CSV Response JSON:", json.dumps(update_response, indent=2))
-                        
-                        if update_response.get("status") == "success":
-                            updated_products = update_response.get("updated_products", [])
-                            product_list = "\n".join([f"- {p.get('sku', 'Unknown SKU')} ({p.get('title', 'No title')})" for p in updated_products])
-                            
-                            answer += (
-                                "\n\nProducts were successfully updated!\n"
-                                f"Number of products updated: {len(updated_products)}\n"
-                                f"Updated Products:\n{product_list}"
-                            )
-                        else:
-                            # Handle error scenario
-                            error_details = update_response.get("details", "Unknown error")
-                            answer += f"\n\nFailed to update products from CSV.\nError: {error_details}"
-                    else:
-                        answer += "\n\nError: No CSV file provided."
-
-                elif tool_name == "put_product_on_sale":
-                    sku = args["sku"]
-                    sale_price = args["sale_price"]
-                    regular_price = args["regular_price"]
-                    tags_to_add = args.get("tags_to_add", ["on-sale"])
-                    sale_response = put_product_on_sale(sku, sale_price, regular_price, tags_to_add)
-
-                    # Print JSON to console for debugging
-                    print("Put Product On Sale Response JSON:", json.dumps(sale_response, indent=2))
-
-                    if sale_response.get("status") == "success":
-                        # Retrieve updated product info
-                        try:
-                            updated_info = get_product_info_by_sku(sku)
-                            answer += (
-                                "\n\nProduct successfully put on sale!\n"
-                                f"SKU: {updated_info.get('sku', sku)}\n"
-                                f"Title: {updated_info.get('title', 'No title')}\n"
-                                f"New Price: {updated_info.get('price', 'N/A')} (was {regular_price}, now {sale_price})\n"
-                                f"Compare at Price: {updated_info.get('compare_at_price', 'N/A')}\n"
-                                f"Available Quantity: {updated_info.get('available', 'N/A')}\n"
-                                f"Vendor: {updated_info.get('vendor', 'N/A')}\n"
-                                f"Type: {updated_info.get('product_type', 'N/A')}\n"
-                                f"Tags: {updated_info.get('tags', '')}\n"
-                                "Description:\n"
-                                f"{updated_info.get('body_html', 'No description')}"
-                            )
-                        except Exception as e:
-                            answer += (
-                                "\n\nProduct put on sale successfully, but unable to retrieve updated product info.\n"
-                                f"SKU: {sku}\n"
-                                f"Error: {str(e)}"
-                            )
-                    else:
-                        error_message = sale_response.get("message", "Unknown error")
-                        answer += f"\n\nFailed to put product on sale.\nError: {error_message}"
-
-                elif tool_name == "take_product_off_sale":
-                    sku = args["sku"]
-                    tags_to_remove = args.get("tags_to_remove", ["on-sale"])
-                    off_sale_response = take_product_off_sale(sku, tags_to_remove)
-
-                    # Print JSON for debugging
-                    print("Take Product Off Sale Response JSON:", json.dumps(off_sale_response, indent=2))
-
-                    if off_sale_response.get("status") == "success":
-                        # Retrieve updated product info
-                        try:
-                            updated_info = get_product_info_by_sku(sku)
-                            answer += (
-                                "\n\nProduct successfully taken off sale!\n"
-                                f"SKU: {updated_info.get('sku', sku)}\n"
-                                f"Title: {updated_info.get('title', 'No title')}\n"
-                                f"Current Price: {updated_info.get('price', 'N/A')} (sale pricing removed)\n"
-                                f"Compare at Price: {updated_info.get('compare_at_price', 'N/A')}\n"
-                                f"Available Quantity: {updated_info.get('available', 'N/A')}\n"
-                                f"Vendor: {updated_info.get('vendor', 'N/A')}\n"
-                                f"Type: {updated_info.get('product_type', 'N/A')}\n"
-                                f"Tags: {updated_info.get('tags', '')}\n"
-                                "Description:\n"
-                                f"{updated_info.get('body_html', 'No description')}"
-                            )
-                        except Exception as e:
-                            answer += (
-                                "\n\nProduct taken off sale successfully, but unable to retrieve updated product info.\n"
-                                f"SKU: {sku}\n"
-                                f"Error: {str(e)}"
-                            )
-                    else:
-                        error_message = off_sale_response.get("message", "Unknown error")
-                        answer += f"\n\nFailed to take product off sale.\nError: {error_message}"
-
-                elif tool_name == "disable_product_by_sku":
-                    sku = args["sku"]
-                    disable_response = disable_product_by_sku(sku)
-
-                    # Print JSON for debugging
-                    print("Disable Product Response JSON:", json.dumps(disable_response, indent=2))
-
-                    if disable_response.get("status") == "success":
-                        updated_fields = disable_response.get("updated_fields", {})
-                        answer += (
-                            "\n\nProduct successfully disabled!\n"
-                            f"SKU: {updated_fields.get('sku', sku)}\n"
-                            f"Title: {updated_fields.get('title', 'No title')}\n"
-                            f"Price: {updated_fields.get('price', 'N/A')} (No longer available)\n"
-                            f"Compare at Price: {updated_fields.get('compare_at_price', 'N/A')}\n"
-                            f"Available Quantity: {updated_fields.get('available', 'N/A')}\n"
-                            f"Vendor: {updated_fields.get('vendor', 'N/A')}\n"
-                            f"Type: {updated_fields.get('product_type', 'N/A')}\n"
-                            f"Tags: {updated_fields.get('tags', '')}\n"
-                            "Description:\n"
-                            f"{updated_fields.get('body_html', 'No description')}"
-                        )
-                    else:
-                        error_message = disable_response.get("message", "Unknown error")
-                        answer += f"\n\nFailed to disable product.\nError: {error_message}"
-                        
-                elif tool_name == "calculate_cost":
-                    # Extract arguments
-                    retail = args["retail"]
-                    discount_code = args.get("discount", "A")  # Default to 'A' if not provided
-                
-                    # Call the calculate_cost function
-                    cost_result = calculate_cost(retail, discount_code)
-                
-                    # Append the result to the answer displayed to the user
-                    answer += (
-                        f"\n\nThe cost for a retail price of ${retail:.2f} with discount code '{discount_code}' "
-                        f"is calculated as: ${cost_result:.2f}"
-                    )
+        calls = [(call["name"], json.loads(call["arguments"] or "{}")) for _, call in sorted(tool_calls.items())]
+        for result in run_tool_calls(
+            calls,
+            uploaded_file=uploaded_file,
+            csv_filename=csv_filename,
+            apply_time=apply_time,
+            revert_time=revert_time,
+            attachment_path=attachment_path,
+            csv_jobs=csv_jobs,
+        ):
+            pieces.append(result)
+            yield result
+        if cache_key:
+            cache_answer(cache_key, calls, pieces)
+    except Exception as e:
+        print(e)
+        yield str(e)
+
+
+def answer_question(**kwargs):
+    """The whole answer at once. Takes the same arguments as `stream_answer`."""
+    return "".join(stream_answer(**kwargs))
+
+
+async def arun_tool_call(tool_name, args, **kwargs):
+    """
+    `run_tool_call` for the async path. Tools with an async handler, like
+    emails sent over async HTTP, run on the event loop. The Shopify tools
+    share the product cache, SKU index and GraphQL code with the sync path,
+    so they run in a worker thread. The event loop keeps serving other
+    questions meanwhile.
+    """
+    if tool_registry.has_async_handler(tool_name):
+        return await tool_registry.arun(tool_name, args, **kwargs)
+    # Not thread-sensitive, so the calls of one answer can run side by side
+    return await sync_to_async(run_tool_call_in_thread, thread_sensitive=False)(tool_name, args, **kwargs)
+
+
+async def arun_tool_calls(calls, **kwargs):
+    """`run_tool_calls` for the async path, with a task per lane."""
+    results = [asyncio.get_running_loop().create_future() for _ in calls]
+    semaphore = asyncio.Semaphore(settings.TOOL_CALL_CONCURRENCY)
+
+    async def run_lane(lane):
+        async with semaphore:
+            for i in lane:
+                tool_name, args = calls[i]
+                try:
+                    results[i].set_result(await arun_tool_call(tool_name, args, **kwargs))
+                except Exception as e:
+                    results[i].set_exception(e)
+
+    tasks = [asyncio.create_task(run_lane(lane)) for lane in tool_call_lanes(calls)]
+    try:
+        for result in results:
+            yield await result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def astream_answer(
+    model=MODEL,
+    question="What is your store phone number?",
+    max_len=MAX_LEN,
+    debug=False,
+    max_tokens=MAX_TOKENS,
+    uploaded_file=None,
+    csv_filename=None,
+    apply_time=None,
+    revert_time=None,
+    attachment_path=None,
+    csv_jobs=None,
+    openai_client=None,
+    use_cache=True,
+):
+    """
+    `stream_answer` on AsyncOpenAI. A question waiting on the model holds no
+    thread, so one process can have many in flight.
+    """
+    if apply_time and csv_filename:
+        yield await sync_to_async(schedule_csv_updates)(csv_filename, apply_time, revert_time)
+        return
+
+    routed = await sync_to_async(route_question, thread_sensitive=False)(
+        question, uploaded_file, csv_filename, apply_time
+    )
+    if routed:
+        try:
+            yield (await arun_tool_call(routed.tool_name, routed.args)).lstrip()
+        except Exception as e:
+            print(e)
+            yield str(e)
+        return
+
+    cache_key = await sync_to_async(answer_cache_key, thread_sensitive=False)(
+        question, model, uploaded_file, csv_filename, apply_time
+    ) if use_cache else None
+    if cache_key:
+        cached = await sync_to_async(answer_cache.lookup, thread_sensitive=False)(cache_key)
+        if cached is not None:
+            yield cached
+            return
 
-        return answer
+    try:
+        # Embedding the question for retrieval is a blocking call
+        request = await sync_to_async(chat_request, thread_sensitive=False)(question, model, debug, max_len)
+        response = await (openai_client or async_client).chat.completions.create(**request)
+
+        pieces, tool_calls = [], {}
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                pieces.append(delta.content)
+                yield delta.content
+            add_tool_call_fragments(tool_calls, delta)
+
+        calls = [(call["name"], json.loads(call["arguments"] or "{}")) for _, call in sorted(tool_calls.items())]
+        async for result in arun_tool_calls(
+            calls,
+            uploaded_file=uploaded_file,
+            csv_filename=csv_filename,
+            apply_time=apply_time,
+            revert_time=revert_time,
+            attachment_path=attachment_path,
+            csv_jobs=csv_jobs,
+        ):
+            pieces.append(result)
+            yield result
+        if cache_key:
+            await sync_to_async(cache_answer, thread_sensitive=False)(cache_key, calls, pieces)
     except Exception as e:
         print(e)
-        return str(e)
+        yield str(e)
 
 
-@login_required
-def home(request):
+async def aanswer_question(**kwargs):
+    """The whole answer at once. Takes the same arguments as `astream_answer`."""
+    return "".join([piece async for piece in astream_answer(**kwargs)])
+
+
+
+# How long a posted question waits for its answer stream to connect
+PENDING_ANSWER_TTL = 300
+
+
+def current_conversation(request, question):
+    if "conversation_id" not in request.session:
+        user = request.user
+        conversation = Conversation.objects.create(title=question, user=user)
+        request.session["conversation_id"] = conversation.id
+    else:
+        conversation_id = request.session["conversation_id"]
+        conversation = get_object_or_404(Conversation, id=conversation_id)
+    return conversation
+
+
+def async_login_required(view):
+    """`login_required` for async views; Django 4.2's decorator only wraps sync ones."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def save_upload(uploaded_file):
+    attachment_path = os.path.join(settings.MEDIA_ROOT, uploaded_file.name)
+    with open(attachment_path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return attachment_path
+
+
+@async_login_required
+async def home(request):
+    """
+    Async so that a question waiting on OpenAI, Shopify or Mailgun doesn't
+    hold a worker. Blocking work (the session, the ORM, writing the upload)
+    goes through sync_to_async.
+    """
     if request.htmx and request.method == "POST":
         form = QuestionForm(request.POST, request.FILES)
         if form.is_valid():
@@ -611,42 +756,183 @@ def home(request):
             csv_filename = None
 
             if uploaded_file:
-                attachment_path = os.path.join(settings.MEDIA_ROOT, uploaded_file.name)
-                with open(attachment_path, 'wb') as f:
-                    for chunk in uploaded_file.chunks():
-                        f.write(chunk)
+                attachment_path = await sync_to_async(save_upload)(uploaded_file)
                 
                 if uploaded_file.name.endswith('.csv') and ("update" in question.lower() or "create" in question.lower()):
                     csv_filename = attachment_path
             else:
                 attachment_path = None
 
-            answer = answer_question(
+            conversation = await sync_to_async(current_conversation)(request, question)
+
+            if settings.CHAT_STREAMING:
+                # The answer is generated by answer_stream once the page connects to it
+                stream_id = uuid.uuid4().hex
+                await cache.aset(f"pending-answer:{stream_id}", {
+                    "user_id": conversation.user_id,
+                    "conversation_id": conversation.id,
+                    "question": question,
+                    "csv_filename": csv_filename,
+                    "apply_time": apply_time,
+                    "revert_time": revert_time,
+                    "attachment_path": attachment_path,
+                }, timeout=PENDING_ANSWER_TTL)
+                return render(request, "answer_stream.html", {"question": question, "stream_id": stream_id})
+
+            csv_jobs = []
+            answer = await aanswer_question(
                 question=question,
                 debug=DEBUG, 
                 uploaded_file=uploaded_file, 
                 csv_filename=csv_filename,
                 apply_time=apply_time,
                 revert_time=revert_time,
-                attachment_path=attachment_path
+                attachment_path=attachment_path,
+                csv_jobs=csv_jobs,
             )
 
-            if "conversation_id" not in request.session:
-                user = request.user
-                conversation = Conversation.objects.create(title=question, user=user)
-                request.session["conversation_id"] = conversation.id
-            else:
-                conversation_id = request.session["conversation_id"]
-                conversation = get_object_or_404(Conversation, id=conversation_id)
-
-            message = Message.objects.create(
+            message = await Message.objects.acreate(
                 conversation=conversation,
                 question=question,
                 answer=answer,
                 context=""
             )
 
-            return render(request, "answer.html", {"answer": answer, "question": question})
+            return render(request, "answer.html", {"answer": answer, "question": question, "csv_jobs": csv_jobs})
     else:
         form = QuestionForm()
     return render(request, "home.html", {"form": form, "title": "Music Store Assistant"})
+
+
+def sse_event(event, data):
+    """Format one server-sent event; multi-line data is sent as several data lines."""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"event: {event}\n{lines}\n"
+
+
+@async_login_required
+async def answer_stream(request, stream_id):
+    """
+    Server-sent events for a question posted with CHAT_STREAMING on: a
+    `token` event with each piece of the answer as it is generated, then
+    `done` with the finished answer card, which replaces the streaming one
+    (and so closes the connection). The pending question is claimed on the
+    first connect; an EventSource reconnect gets a 204, which stops it
+    retrying, instead of asking the model again.
+    """
+    key = f"pending-answer:{stream_id}"
+    pending = await cache.aget(key)
+    user_id = await sync_to_async(lambda: request.user.id)()
+    if not pending or pending["user_id"] != user_id or not await cache.adelete(key):
+        return HttpResponse(status=204)
+
+    async def events():
+        csv_jobs = []
+        answer = ""
+        attachment_path = pending["attachment_path"]
+        attachment = open(attachment_path, "rb") if attachment_path else None
+        try:
+            async for piece in astream_answer(
+                question=pending["question"],
+                debug=DEBUG,
+                uploaded_file=File(attachment, name=os.path.basename(attachment_path)) if attachment else None,
+                csv_filename=pending["csv_filename"],
+                apply_time=pending["apply_time"],
+                revert_time=pending["revert_time"],
+                attachment_path=attachment_path,
+                csv_jobs=csv_jobs,
+            ):
+                answer += piece
+                yield sse_event("token", escape(piece).replace("\n", "<br>"))
+        finally:
+            if attachment:
+                attachment.close()
+
+        await Message.objects.acreate(
+            conversation_id=pending["conversation_id"],
+            question=pending["question"],
+            answer=answer,
+            context=""
+        )
+        yield sse_event("done", await sync_to_async(render_to_string)(
+            "answer.html", {"answer": answer, "question": pending["question"], "csv_jobs": csv_jobs}, request=request
+        ))
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Don't let a proxy hold tokens back until the response is complete
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return None
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+
+
+@login_required
+def csv_job_status(request, job_id):
+    """
+    Progress of a background CSV job from its Redis counters. htmx requests
+    get the progress partial, which polls again until the job is complete;
+    anything else gets the counters as JSON.
+    """
+    job = job_progress.status(job_id)
+    if not request.htmx:
+        if job is None:
+            return JsonResponse({"error": "Unknown job"}, status=404)
+        return JsonResponse(job)
+
+    context = {"job_id": job_id, "job": job}
+    if job:
+        context["eta"] = format_eta(job["eta_seconds"])
+        if job["state"] == job_progress.COMPLETE:
+            context["summary"] = csv_upload_summary(job["action"], job["result"] or {})
+    return render(request, "csv_job.html", context)
+
+
+def verify_shopify_hmac(body, received_hmac):
+    """Check a webhook body against the base64 HMAC-SHA256 Shopify sends with it."""
+    secret = settings.SHOPIFY_WEBHOOK_SECRET
+    if not secret or not received_hmac:
+        return False
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), received_hmac)
+
+
+@csrf_exempt
+@require_POST
+def shopify_webhook(request):
+    """
+    Receive product and inventory webhooks from Shopify. The payload is queued
+    for the Celery worker so we answer well inside Shopify's delivery timeout.
+    """
+    if not verify_shopify_hmac(request.body, request.headers.get("X-Shopify-Hmac-Sha256")):
+        return HttpResponse(status=401)
+
+    topic = request.headers.get("X-Shopify-Topic", "")
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse(status=400)
+
+    from assistant.tasks import process_shopify_webhook
+    process_shopify_webhook.delay(topic, payload, request.headers.get("X-Shopify-Webhook-Id"))
+    return HttpResponse(status=200)
+
+
+@staff_member_required
+def metrics(request):
+    return JsonResponse({
+        "answer_cache": answer_cache.stats(),
+        "intent_router": intent_router.stats(),
+        "product_cache": product_cache.stats(),
+        "shopify_rate_limit": rate_limit.stats(),
+        "shopify_calls_per_operation": rate_limit.operation_stats(),
+        "tools": tool_metrics.stats(request.GET.get("tool")),
+    })
@@ -9,8 +9,12 @@ app = Celery("core")
 # Load config from Django settings
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
-# limit concurrency to 1 worker
-app.conf.update(worker_concurrency=1)
+# CSV batches run as chords of chunk tasks across these worker processes;
+# Shopify API usage is bounded by the shared rate limiter, not by concurrency
+app.conf.update(
+    worker_concurrency=int(os.environ.get("CELERY_WORKER_CONCURRENCY", 4)),
+    worker_prefetch_multiplier=1,
+)
 
 # Set Celery configuration option
 app.conf.broker_connection_retry_on_startup = True
@@ -63,6 +63,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "core.wsgi.application"
+ASGI_APPLICATION = "core.asgi.application"
 
 POSTGRES_USER = env.str("POSTGRES_USER")
 POSTGRES_PASSWORD = env.str("POSTGRES_PASSWORD")
@@ -134,12 +135,97 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Cache
+
+# Redis database for the cache and other shared state (rate limiting); Celery uses database 0
+REDIS_URL = env.str("REDIS_URL", default="redis://redis:6379/1")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    }
+}
+
+# Chat
+
+# Stream answers to the page token by token over server-sent events;
+# when off, the answer is rendered once it is complete
+CHAT_STREAMING = env.bool("CHAT_STREAMING", default=True)
+
+# Tool calls from one completion that may run at the same time
+TOOL_CALL_CONCURRENCY = env.int("TOOL_CALL_CONCURRENCY", default=4)
+
+# Answer structured commands ("price of SKU 12345", "cost of 299.99 with
+# code BY", "take SKU X off sale") directly, without asking the model
+INTENT_ROUTER_ENABLED = env.bool("INTENT_ROUTER_ENABLED", default=True)
+
+# Answers to repeated questions that used no tools (or only pure ones) are
+# cached for this many seconds; 0 turns the answer cache off
+ANSWER_CACHE_TTL = env.int("ANSWER_CACHE_TTL", default=60 * 60 * 24)
+# Least recently used answers are evicted beyond this many
+ANSWER_CACHE_MAX_ENTRIES = env.int("ANSWER_CACHE_MAX_ENTRIES", default=5000)
+
+# Handbook
+
+# Where `ingest_handbook` writes the chunk embeddings the chat retrieves context from
+HANDBOOK_INDEX_DIR = env.str("HANDBOOK_INDEX_DIR", default=os.path.join(MEDIA_ROOT, "handbook_index"))
+# "openai", "hashing" (local and deterministic, for offline use) or a dotted path to a backend class
+HANDBOOK_EMBEDDING_BACKEND = env.str("HANDBOOK_EMBEDDING_BACKEND", default="openai")
+HANDBOOK_EMBEDDING_MODEL = env.str("HANDBOOK_EMBEDDING_MODEL", default="text-embedding-3-small")
+# Shortened embeddings keep a search over tens of thousands of chunks to a few milliseconds
+HANDBOOK_EMBEDDING_DIMENSIONS = env.int("HANDBOOK_EMBEDDING_DIMENSIONS", default=256)
+# Estimated tokens per chunk, and how many of the closest chunks may go into the prompt
+HANDBOOK_CHUNK_TOKENS = env.int("HANDBOOK_CHUNK_TOKENS", default=300)
+HANDBOOK_TOP_K = env.int("HANDBOOK_TOP_K", default=4)
+# Chunks less similar to the question than this are left out
+HANDBOOK_MIN_SCORE = env.float("HANDBOOK_MIN_SCORE", default=0.1)
+
 # Celery
 
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
+# Rows per chunk task when a CSV batch is split across workers
+CSV_CHUNK_SIZE = env.int("CSV_CHUNK_SIZE", default=50)
+
+# Per-row results of CSV batches and chat CSV uploads are written here
+CSV_RESULTS_DIR = env.str("CSV_RESULTS_DIR", default=os.path.join(MEDIA_ROOT, "csv_results"))
+
+# Rows per INSERT/UPDATE (and per fetch when streaming) for ProductSnapshot bookkeeping
+SNAPSHOT_BULK_SIZE = env.int("SNAPSHOT_BULK_SIZE", default=500)
+
+# Products changed per GraphQL request when applying or reverting a sale campaign
+CAMPAIGN_PRODUCTS_PER_REQUEST = env.int("CAMPAIGN_PRODUCTS_PER_REQUEST", default=10)
+
 INSTALLED_APPS += [
     "django_celery_beat",
 ]
+
+# Shopify
+
+# Fall back to a full catalog scan when a SKU is missing from the SKU index.
+# Turn off once the index is built and kept current.
+SKU_INDEX_SCAN_ON_MISS = env.bool("SKU_INDEX_SCAN_ON_MISS", default=True)
+
+# How get_product_info_by_sku fetches on a cache miss: "graphql" (one request) or "rest"
+PRODUCT_INFO_API = env.str("PRODUCT_INFO_API", default="graphql")
+
+# How update_product_by_sku writes: "graphql" (one request of coalesced mutations) or "rest"
+PRODUCT_WRITE_API = env.str("PRODUCT_WRITE_API", default="graphql")
+
+# Total seconds to keep retrying throttled or failed Shopify calls, interactively and in batch tasks
+SHOPIFY_RETRY_DEADLINE = env.int("SHOPIFY_RETRY_DEADLINE", default=60)
+SHOPIFY_RETRY_TASK_DEADLINE = env.int("SHOPIFY_RETRY_TASK_DEADLINE", default=600)
+
+# SKU operations the async client runs at once for CSV create/update; 1 keeps the sequential path
+SHOPIFY_ASYNC_CONCURRENCY = env.int("SHOPIFY_ASYNC_CONCURRENCY", default=8)
+
+# Shared secret used to verify the HMAC signature on incoming Shopify webhooks
+SHOPIFY_WEBHOOK_SECRET = env.str("SHOPIFY_WEBHOOK_SECRET", default="")
+
+# Product info cache lifetimes, in seconds, per field group
+PRODUCT_CACHE_TTL_DETAILS = env.int("PRODUCT_CACHE_TTL_DETAILS", default=6 * 60 * 60)
+PRODUCT_CACHE_TTL_PRICING = env.int("PRODUCT_CACHE_TTL_PRICING", default=15 * 60)
+PRODUCT_CACHE_TTL_INVENTORY = env.int("PRODUCT_CACHE_TTL_INVENTORY", default=60)